@@ -13,9 +13,141 @@ class Settings(BaseModel):
     QR_HMAC_SECRET: str = os.getenv("QR_HMAC_SECRET", "")
     QR_SIG_TTL_SECONDS: int = int(os.getenv("QR_SIG_TTL_SECONDS", "900"))
 
+    # Replay protection for QR tokens: a token creates at most one collection request.
+    # memory = per instance; mongo = shared via TTL documents in `qr_consumed`; off
+    QR_REPLAY_STORE: str = os.getenv("QR_REPLAY_STORE", "memory")
+    QR_REPLAY_CACHE_SIZE: int = int(os.getenv("QR_REPLAY_CACHE_SIZE", "100000"))
+
+    # Printable labels (POST /qr/labels): landing page the QR codes open, QR payload
+    # template, ECC level L/M/Q/H, encoder processes (0 = one per CPU) and max labels per
+    # call. /qr/labels refuses to run until the template renders an http(s) URL
+    QR_LABEL_BASE_URL: str = os.getenv("QR_LABEL_BASE_URL", "")
+    QR_LABEL_URL: str = os.getenv("QR_LABEL_URL", "{baseUrl}?containerId={containerId}&sig={sig}")
+    QR_LABEL_ECC: str = os.getenv("QR_LABEL_ECC", "M")
+    QR_LABEL_WORKERS: int = int(os.getenv("QR_LABEL_WORKERS", "0"))
+    QR_LABELS_MAX: int = int(os.getenv("QR_LABELS_MAX", "5000"))
+
     DB_CREATE_INDEXES: bool = os.getenv(
         "DB_CREATE_INDEXES", "true").lower() == "true"
 
+    # Live collection request feed (/collection-requests/stream)
+    EVENTS_CHANGE_STREAMS: bool = os.getenv(
+        "EVENTS_CHANGE_STREAMS", "false").lower() == "true"
+    EVENTS_BUFFER_SIZE: int = int(os.getenv("EVENTS_BUFFER_SIZE", "1000"))
+    EVENTS_HEARTBEAT_SECONDS: int = int(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+
+    # Outbox worker (side effects applied after the request returns)
+    OUTBOX_ENABLED: bool = os.getenv("OUTBOX_ENABLED", "true").lower() == "true"
+    OUTBOX_BATCH_SIZE: int = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+    OUTBOX_CONCURRENCY: int = int(os.getenv("OUTBOX_CONCURRENCY", "8"))
+    OUTBOX_MAX_ATTEMPTS: int = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+    OUTBOX_BACKOFF_BASE_SECONDS: float = float(os.getenv("OUTBOX_BACKOFF_BASE_SECONDS", "2"))
+    OUTBOX_BACKOFF_MAX_SECONDS: float = float(os.getenv("OUTBOX_BACKOFF_MAX_SECONDS", "300"))
+    OUTBOX_LEASE_SECONDS: int = int(os.getenv("OUTBOX_LEASE_SECONDS", "60"))
+    OUTBOX_POLL_SECONDS: float = float(os.getenv("OUTBOX_POLL_SECONDS", "1"))
+    OUTBOX_LAG_INTERVAL_SECONDS: float = float(os.getenv("OUTBOX_LAG_INTERVAL_SECONDS", "30"))
+
+    # Keep matching ISO-string timestamps in range filters until
+    # `python -m app.migrations.timestamps` has converted existing documents.
+    DB_LEGACY_STRING_TIMESTAMPS: bool = os.getenv(
+        "DB_LEGACY_STRING_TIMESTAMPS", "true").lower() == "true"
+
+    # Per-request Mongo round-trip budget; exceeding it logs a warning (0 disables).
+    # Per-route overrides: "POST /deployments/swap=10;GET /households/{household_id}/history=4"
+    DB_ROUNDTRIP_BUDGET: int = int(os.getenv("DB_ROUNDTRIP_BUDGET", "8"))
+    DB_ROUNDTRIP_BUDGETS: str = os.getenv("DB_ROUNDTRIP_BUDGETS", "")
+
+    # Group commit for hot single-document inserts (collection requests, signups):
+    # inserts arriving within DB_INSERT_LINGER_MS share one insert_many
+    DB_INSERT_COALESCING: bool = os.getenv("DB_INSERT_COALESCING", "false").lower() == "true"
+    DB_INSERT_MAX_BATCH: int = int(os.getenv("DB_INSERT_MAX_BATCH", "100"))
+    DB_INSERT_LINGER_MS: float = float(os.getenv("DB_INSERT_LINGER_MS", "2"))
+
+    # Hot/cold archival (app/services/archive.py): finished requests, closed assignments and
+    # performed deployments older than ARCHIVE_AFTER_DAYS move to `<collection>_archive`
+    ARCHIVE_ENABLED: bool = os.getenv("ARCHIVE_ENABLED", "false").lower() == "true"
+    ARCHIVE_AFTER_DAYS: int = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+    ARCHIVE_CHUNK_SIZE: int = int(os.getenv("ARCHIVE_CHUNK_SIZE", "500"))
+    ARCHIVE_PAUSE_SECONDS: float = float(os.getenv("ARCHIVE_PAUSE_SECONDS", "0.05"))
+    ARCHIVE_INTERVAL_SECONDS: float = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600"))
+
+    # Request tracing (app/core/tracing.py): traces of TRACE_SAMPLE_RATE of requests, plus
+    # every request slower than TRACE_SLOW_MS (0 = off), appended to a rotating JSONL file
+    TRACE_ENABLED: bool = os.getenv("TRACE_ENABLED", "false").lower() == "true"
+    TRACE_SAMPLE_RATE: float = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+    TRACE_SLOW_MS: float = float(os.getenv("TRACE_SLOW_MS", "1000"))
+    TRACE_FILE: str = os.getenv("TRACE_FILE", "traces.jsonl")
+    TRACE_FILE_MAX_BYTES: int = int(os.getenv("TRACE_FILE_MAX_BYTES", str(50 * 1024 * 1024)))
+    TRACE_FILE_BACKUPS: int = int(os.getenv("TRACE_FILE_BACKUPS", "5"))
+    TRACE_MAX_SPANS: int = int(os.getenv("TRACE_MAX_SPANS", "2000"))
+    TRACE_QUEUE_SIZE: int = int(os.getenv("TRACE_QUEUE_SIZE", "1000"))
+
+    # On-demand sampling profiler (GET /admin/profile, app/services/profiler.py); off by
+    # default and refused unless an API key is configured
+    PROFILER_ENABLED: bool = os.getenv("PROFILER_ENABLED", "false").lower() == "true"
+    PROFILER_INTERVAL_MS: float = float(os.getenv("PROFILER_INTERVAL_MS", "10"))
+    PROFILER_MAX_SECONDS: float = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+    PROFILER_MAX_DEPTH: int = int(os.getenv("PROFILER_MAX_DEPTH", "100"))
+
+    # Readiness probe (/ready): cached background ping
+    READY_PING_INTERVAL_SECONDS: float = float(os.getenv("READY_PING_INTERVAL_SECONDS", "5"))
+    READY_PING_TIMEOUT_SECONDS: float = float(os.getenv("READY_PING_TIMEOUT_SECONDS", "2"))
+
+    # Admission control (app/middleware/admission.py). Token buckets are "rate:burst" per
+    # client and priority class, e.g. "critical=50:100;default=20:40;bulk=2:5"; route
+    # overrides use the route key: "GET /collections=1:2". Concurrency caps are per class
+    # and per route ("bulk=4" / "GET /signups=1"), 0 = unlimited. Clients are keyed on
+    # X-User-Id, else their address; ADMISSION_TRUSTED_PROXIES is the number of proxies in
+    # front of the app whose X-Forwarded-For entries are trusted (0 when exposed directly).
+    ADMISSION_ENABLED: bool = os.getenv("ADMISSION_ENABLED", "false").lower() == "true"
+    ADMISSION_TRUSTED_PROXIES: int = int(os.getenv("ADMISSION_TRUSTED_PROXIES", "1"))
+    ADMISSION_RATE_LIMITS: str = os.getenv(
+        "ADMISSION_RATE_LIMITS", "critical=50:100;default=20:40;bulk=5:10")
+    ADMISSION_ROUTE_RATE_LIMITS: str = os.getenv("ADMISSION_ROUTE_RATE_LIMITS", "")
+    ADMISSION_CONCURRENCY: str = os.getenv(
+        "ADMISSION_CONCURRENCY", "critical=0;default=64;bulk=4")
+    ADMISSION_ROUTE_CONCURRENCY: str = os.getenv("ADMISSION_ROUTE_CONCURRENCY", "")
+    # How long a request may wait for a concurrency slot before it is shed
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "0.5"))
+    ADMISSION_MAX_CLIENTS: int = int(os.getenv("ADMISSION_MAX_CLIENTS", "10000"))
+
+    # Concurrent identical GETs on these routes share one execution and response body
+    SINGLEFLIGHT_ROUTES: str = os.getenv(
+        "SINGLEFLIGHT_ROUTES",
+        "GET /collections;GET /collection-requests;GET /deployments;GET /signups/all")
+
+    # Driver work queue (POST /collection-requests/claim)
+    CLAIM_LEASE_SECONDS: int = int(os.getenv("CLAIM_LEASE_SECONDS", "1800"))
+    CLAIM_MAX_BATCH: int = int(os.getenv("CLAIM_MAX_BATCH", "20"))
+    # Oldest open requests ranked by distance when a location is supplied
+    CLAIM_PROXIMITY_CANDIDATES: int = int(os.getenv("CLAIM_PROXIMITY_CANDIDATES", "200"))
+
+    # Batch swap submission (POST /deployments/swap/batch): swaps per call, and swaps per
+    # chunk of bulk writes
+    SWAP_BATCH_MAX: int = int(os.getenv("SWAP_BATCH_MAX", "200"))
+    SWAP_BATCH_CHUNK_SIZE: int = int(os.getenv("SWAP_BATCH_CHUNK_SIZE", "50"))
+
+    # Driver delta sync (GET /sync): changes are re-read this far behind the client's
+    # watermark, so writes stamped just before it but committed after it are not missed
+    SYNC_OVERLAP_SECONDS: float = float(os.getenv("SYNC_OVERLAP_SECONDS", "10"))
+
+    # /search: optional in-memory trigram index (infix matches, no Mongo round trip)
+    SEARCH_NGRAM_ENABLED: bool = os.getenv("SEARCH_NGRAM_ENABLED", "false").lower() == "true"
+    SEARCH_NGRAM_REFRESH_SECONDS: float = float(os.getenv("SEARCH_NGRAM_REFRESH_SECONDS", "300"))
+
+    # count=true on filtered lists: how long a count_documents result is reused
+    COUNT_CACHE_TTL_SECONDS: float = float(os.getenv("COUNT_CACHE_TTL_SECONDS", "10"))
+    # Per-status counters: increments spread over COUNTER_SHARDS documents per collection,
+    # recounted from the collection every COUNTS_RECONCILE_INTERVAL_SECONDS (0 = never).
+    # Every instance that enables it runs a full-collection $group: set it on one instance
+    # only, or schedule `python -m app.migrations.counters` instead
+    COUNTER_SHARDS: int = int(os.getenv("COUNTER_SHARDS", "8"))
+    COUNTS_RECONCILE_INTERVAL_SECONDS: float = float(os.getenv("COUNTS_RECONCILE_INTERVAL_SECONDS", "0"))
+
+    # Bulk import (POST /containers:import, /households:import)
+    BULK_IMPORT_CHUNK_SIZE: int = int(os.getenv("BULK_IMPORT_CHUNK_SIZE", "500"))
+    BULK_IMPORT_MAX_ROWS: int = int(os.getenv("BULK_IMPORT_MAX_ROWS", "100000"))
+
     ALLOWED_ORIGINS: list[str] = [
         o.strip() for o in os.getenv("ALLOWED_ORIGINS", "").split(",") if o.strip()
     ]
@@ -0,0 +1,12 @@
+from typing import Callable
+
+# Named snapshot providers surfaced by GET /admin/metrics.
+_providers: dict[str, Callable[[], dict]] = {}
+
+
+def register(name: str, provider: Callable[[], dict]):
+    _providers[name] = provider
+
+
+def snapshot() -> dict:
+    return {name: provider() for name, provider in _providers.items()}
@@ -0,0 +1,250 @@
+"""
+In-process request tracing (TRACE_ENABLED).
+
+Each request gets a trace whose spans form a tree: the request itself (middleware),
+every Mongo command it sends (command monitoring) and any `span("...")` block in the
+code. The active span lives in a contextvar, so tasks started with gather() and the
+executor threads Motor runs pymongo on attach their spans to the right parent.
+
+Spans are recorded for every request; when it ends, the trace is kept if it was
+head-sampled (TRACE_SAMPLE_RATE) or took at least TRACE_SLOW_MS (tail capture). Kept
+traces are written by a background thread, one per line, to a rotating JSONL file
+(TRACE_FILE). Each line is a Chrome trace-event document (`{"traceEvents": [...]}`)
+that chrome://tracing, Perfetto or speedscope open as is. If the writer falls behind,
+traces are dropped rather than queued without bound.
+"""
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from app.core import metrics
+from app.core.config import settings
+
+log = logging.getLogger("uvicorn.error")
+
+
+class Span:
+    __slots__ = ("id", "parent", "name", "cat", "start", "end", "attrs")
+
+    def __init__(self, span_id: int, parent: int | None, name: str, cat: str, start: int, attrs: dict):
+        self.id = span_id
+        self.parent = parent
+        self.name = name
+        self.cat = cat
+        self.start = start
+        self.end = start
+        self.attrs = attrs
+
+
+class Trace:
+    __slots__ = ("id", "sampled", "spans", "dropped", "commands", "_ids")
+
+    def __init__(self, sampled: bool):
+        self.id = os.urandom(8).hex()
+        self.sampled = sampled
+        self.spans: list[Span] = []
+        self.dropped = 0
+        # Mongo request id -> collection, between command started and finished
+        self.commands: dict[int, str | None] = {}
+        self._ids = itertools.count(1)
+
+    def new_span(self, parent: Span | None, name: str, cat: str, start: int, attrs: dict) -> Span:
+        return Span(next(self._ids), parent.id if parent else None, name, cat, start, attrs)
+
+    def add(self, span: Span):
+        # list.append is atomic: executor threads add Mongo spans concurrently
+        if len(self.spans) >= settings.TRACE_MAX_SPANS:
+            self.dropped += 1
+            return
+        self.spans.append(span)
+
+
+# (trace, active span) for the current request; None outside traced requests
+_active: ContextVar[tuple[Trace, Span | None] | None] = ContextVar("trace_active", default=None)
+
+_stats = {"traces": 0, "sampled": 0, "slow": 0, "written": 0, "dropped": 0}
+
+
+def _now_us() -> int:
+    return time.time_ns() // 1000
+
+
+def start_trace() -> Trace | None:
+    if not settings.TRACE_ENABLED:
+        return None
+    trace = Trace(sampled=random.random() < settings.TRACE_SAMPLE_RATE)
+    _active.set((trace, None))
+    return trace
+
+
+@contextmanager
+def span(name: str, cat: str = "app", **attrs):
+    """Time a block as a child of the active span; a no-op outside traced requests."""
+    active = _active.get()
+    if active is None:
+        yield None
+        return
+    trace, parent = active
+    s = trace.new_span(parent, name, cat, _now_us(), attrs)
+    token = _active.set((trace, s))
+    try:
+        yield s
+    except BaseException as e:
+        s.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        s.end = _now_us()
+        _active.reset(token)
+        trace.add(s)
+
+
+def db_started(event):
+    active = _active.get()
+    if active is not None:
+        target = event.command.get(event.command_name)
+        active[0].commands[event.request_id] = target if isinstance(target, str) else None
+
+
+def db_finished(event, error: str | None = None):
+    active = _active.get()
+    if active is None:
+        return
+    trace, parent = active
+    attrs = {"collection": trace.commands.pop(event.request_id, None)}
+    if error:
+        attrs["error"] = error
+    end = _now_us()
+    s = trace.new_span(parent, f"mongo.{event.command_name}", "db", end - event.duration_micros, attrs)
+    s.end = end
+    trace.add(s)
+
+
+def finish(trace: Trace, root: Span) -> bool:
+    """Keep the trace if sampled or slow; True if it was handed to the writer."""
+    _stats["traces"] += 1
+    slow = settings.TRACE_SLOW_MS > 0 and (root.end - root.start) >= settings.TRACE_SLOW_MS * 1000
+    if not (trace.sampled or slow):
+        return False
+    reason = "sampled" if trace.sampled else "slow"
+    _stats[reason] += 1
+    if not _get_writer().submit((trace.id, reason, root, list(trace.spans), trace.dropped)):
+        _stats["dropped"] += 1
+        return False
+    return True
+
+
+def _layout(spans: list[Span]) -> dict[int, int]:
+    """
+    Span id -> tid. Viewers nest "X" events by time on one tid, so a span shares its
+    parent's tid only while it is the innermost open span there; overlapping siblings
+    (gathered work) get tids of their own.
+    """
+    lanes: list[list[Span]] = []
+    lane_of: dict[int, int] = {}
+    for s in sorted(spans, key=lambda s: (s.start, -s.end)):
+        preferred = lane_of.get(s.parent)
+        candidates = ([preferred] if preferred is not None else []) + list(range(len(lanes)))
+        for lane in candidates:
+            stack = lanes[lane]
+            while stack and stack[-1].end <= s.start:
+                stack.pop()
+            if not stack or (stack[-1].id == s.parent and stack[-1].end >= s.end):
+                break
+        else:
+            lanes.append([])
+            lane = len(lanes) - 1
+        lanes[lane].append(s)
+        lane_of[s.id] = lane
+    return {span_id: lane + 1 for span_id, lane in lane_of.items()}
+
+
+def encode(trace_id: str, reason: str, root: Span, spans: list[Span], dropped: int) -> str:
+    pid = os.getpid()
+    tids = _layout(spans)
+    events = [
+        {"name": s.name, "cat": s.cat, "ph": "X", "ts": s.start, "dur": max(0, s.end - s.start),
+         "pid": pid, "tid": tids[s.id], "args": {"spanId": s.id, "parentId": s.parent, **s.attrs}}
+        for s in sorted(spans, key=lambda s: s.start)
+    ]
+    return json.dumps({
+        "traceId": trace_id,
+        "name": root.name,
+        "reason": reason,
+        "durationMs": round((root.end - root.start) / 1000, 3),
+        "droppedSpans": dropped,
+        "displayTimeUnit": "ms",
+        "traceEvents": events,
+    }, default=str)
+
+
+class _Writer:
+    """Encodes and appends traces on its own thread; RotatingFileHandler does the rotation."""
+
+    def __init__(self):
+        self.queue: queue.Queue = queue.Queue(maxsize=settings.TRACE_QUEUE_SIZE)
+        self.handler = logging.handlers.RotatingFileHandler(
+            settings.TRACE_FILE, maxBytes=settings.TRACE_FILE_MAX_BYTES,
+            backupCount=settings.TRACE_FILE_BACKUPS, encoding="utf-8", delay=True)
+        self.handler.setFormatter(logging.Formatter("%(message)s"))
+        self.thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, item) -> bool:
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except queue.Full:
+            return False
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            try:
+                self.handler.handle(logging.makeLogRecord({"msg": encode(*item)}))
+                _stats["written"] += 1
+            except Exception as e:
+                log.warning("Could not write trace %s: %s", item[0], e)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join(timeout=5)
+        self.handler.close()
+
+
+_writer: _Writer | None = None
+_writer_lock = threading.Lock()
+
+
+def _get_writer() -> _Writer:
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = _Writer()
+    return _writer
+
+
+def snapshot() -> dict:
+    return {**_stats, "sampleRate": settings.TRACE_SAMPLE_RATE, "slowMs": settings.TRACE_SLOW_MS,
+            "queued": _writer.queue.qsize() if _writer else 0}
+
+
+def shutdown():
+    global _writer
+    if _writer is not None:
+        _writer.close()
+        _writer = None
+
+
+if settings.TRACE_ENABLED:
+    metrics.register("tracing", snapshot)
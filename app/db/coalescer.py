@@ -0,0 +1,100 @@
+# app/db/coalescer.py
+"""
+Group commit for single-document inserts (DB_INSERT_COALESCING).
+
+Inserts into the same collection that arrive within DB_INSERT_LINGER_MS of each
+other are sent as one unordered `insert_many` (at most DB_INSERT_MAX_BATCH
+documents). Each caller awaits its own future and gets its own outcome: a
+duplicate key or other write error for document i is raised only in caller i; a
+failure of the whole command is raised in every caller of that batch.
+
+Batches are flushed outside any request context, so their round trips do not show
+up in a request's Server-Timing.
+"""
+import asyncio
+import contextvars
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError, WriteError
+
+from app.core import metrics
+
+DUPLICATE_KEY = 11000
+
+
+class InsertCoalescer:
+    def __init__(self, db, max_batch: int, linger_ms: float):
+        self.db = db
+        self.max_batch = max_batch
+        self.linger = linger_ms / 1000
+        self._pending: dict[str, tuple[list[tuple[dict, asyncio.Future]], asyncio.Event]] = {}
+        # The loop only keeps weak references to tasks: hold the flushes until they finish
+        self._tasks: set[asyncio.Task] = set()
+        self.stats = {"inserts": 0, "batches": 0, "maxBatch": 0, "errors": 0}
+        metrics.register("insert_coalescer", self.snapshot)
+
+    def snapshot(self) -> dict:
+        batches = self.stats["batches"]
+        return {**self.stats, "avgBatch": round(self.stats["inserts"] / batches, 2) if batches else 0.0,
+                "queued": sum(len(batch) for batch, _ in self._pending.values())}
+
+    async def insert(self, collection: str, doc: dict):
+        """Resolves with the inserted `_id` once the batch containing `doc` is written."""
+        fut = asyncio.get_running_loop().create_future()
+        open_batch = self._pending.get(collection)
+        if open_batch is None:
+            open_batch = self._pending[collection] = ([], asyncio.Event())
+            # Fresh context: the flush must not be accounted to whichever request came first
+            task = asyncio.create_task(
+                self._flush_after_linger(collection, *open_batch), context=contextvars.Context())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        batch, full = open_batch
+        batch.append((doc, fut))
+        if len(batch) >= self.max_batch:
+            # Close it now; the next insert opens a new batch
+            del self._pending[collection]
+            full.set()
+        return await fut
+
+    async def close(self):
+        """Write every open batch now and wait for all flushes (shutdown)."""
+        for _, full in list(self._pending.values()):
+            full.set()
+        self._pending.clear()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _flush_after_linger(self, collection: str, batch: list, full: asyncio.Event):
+        try:
+            await asyncio.wait_for(full.wait(), self.linger)
+        except asyncio.TimeoutError:
+            if self._pending.get(collection, (None,))[0] is batch:
+                del self._pending[collection]
+        await self._write(collection, batch)
+
+    async def _write(self, collection: str, batch: list[tuple[dict, asyncio.Future]]):
+        self.stats["batches"] += 1
+        self.stats["inserts"] += len(batch)
+        self.stats["maxBatch"] = max(self.stats["maxBatch"], len(batch))
+        failed: dict[int, dict] = {}
+        try:
+            await self.db[collection].insert_many([doc for doc, _ in batch], ordered=False)
+        except BulkWriteError as e:
+            for err in (e.details or {}).get("writeErrors", []):
+                failed[err["index"]] = err
+        except Exception as e:
+            self.stats["errors"] += len(batch)
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for i, (doc, fut) in enumerate(batch):
+            if fut.done():  # caller went away
+                continue
+            err = failed.get(i)
+            if err is None:
+                fut.set_result(doc["_id"])
+                continue
+            self.stats["errors"] += 1
+            exc_type = DuplicateKeyError if err.get("code") == DUPLICATE_KEY else WriteError
+            fut.set_exception(exc_type(err.get("errmsg", "write failed"), err.get("code"), err))
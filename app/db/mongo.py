@@ -1,14 +1,74 @@
 # app/db/mongo.py
+import asyncio
+import hashlib
+import json
 import logging
 
 from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo.errors import OperationFailure
 
 from app.core.config import settings
+from app.db.coalescer import InsertCoalescer
+from app.db.monitoring import db_command_listener, pool_stats
 
 log = logging.getLogger("uvicorn.error")
 
 
+# (collection, keys, create_index options). Changing this list changes the fingerprint
+# and makes the next startup create indexes again.
+INDEX_SPECS: list[tuple[str, list[tuple[str, int]], dict]] = [
+    # signups: list & triage
+    ("signups", [("status", 1), ("createdAt", -1)], {}),
+    # households: lookup by community + villa
+    ("households", [("community", 1), ("villaNumber", 1)], {"unique": False}),
+    # /search: anchored prefix regexes on the normalized search keys
+    ("households", [("searchKeys", 1)], {}),
+    ("signups", [("searchKeys", 1)], {}),
+    # containers: who has what, current state
+    ("containers", [("assignedHouseholdId", 1), ("state", 1)], {}),
+    # /qr/labels serial ranges
+    ("containers", [("serial", 1)], {}),
+    # collection_requests: dashboards + history
+    ("collection_requests", [("status", 1), ("requestedAt", -1)], {}),
+    ("collection_requests", [("householdId", 1), ("requestedAt", -1)], {}),
+    # collection_requests: community-scoped dashboards (denormalized community)
+    ("collection_requests", [("community", 1), ("status", 1), ("requestedAt", -1)], {}),
+    # collection_requests: driver work-queue claim (unassigned / expired lease)
+    ("collection_requests", [("status", 1), ("assignedTo", 1), ("requestedAt", 1)], {}),
+    ("collection_requests", [("status", 1), ("leaseExpiresAt", 1)], {}),
+    # collection_requests / deployments: driver delta sync (GET /sync)
+    ("collection_requests", [("assignedTo", 1), ("updatedAt", 1)], {}),
+    ("deployments", [("assignedTo", 1), ("updatedAt", 1)], {}),
+    # container_assignments: audit trails
+    ("container_assignments", [("householdId", 1), ("assignedAt", -1)], {}),
+    ("container_assignments", [("containerId", 1), ("assignedAt", -1)], {}),
+    # *_archive: history reads of archived rows (app/services/archive.py)
+    ("collection_requests_archive", [("householdId", 1), ("requestedAt", 1)], {}),
+    ("collection_requests_archive", [("containerId", 1), ("requestedAt", 1)], {}),
+    ("container_assignments_archive", [("householdId", 1), ("assignedAt", 1)], {}),
+    ("container_assignments_archive", [("containerId", 1), ("assignedAt", 1)], {}),
+    ("deployments_archive", [("householdId", 1), ("performedAt", 1)], {}),
+    ("deployments_archive", [("installedContainerId", 1)], {}),
+    ("deployments_archive", [("removedContainerId", 1)], {}),
+    # users: auth
+    ("users", [("username", 1)], {"unique": True}),
+    # deployments: task assignment
+    ("deployments", [("assignedTo", 1), ("performedAt", -1)], {}),
+    ("deployments", [("type", 1), ("performedAt", -1)], {}),
+    # entity_events: per-entity timeline range scans + cursor paging
+    ("entity_events", [("entityId", 1), ("ts", -1), ("_id", -1)], {}),
+    # qr_consumed: replay-protection entries expire with their token
+    ("qr_consumed", [("expiresAt", 1)], {"expireAfterSeconds": 0}),
+    # outbox: worker claim scan + lag probe
+    ("outbox", [("status", 1), ("availableAt", 1)], {}),
+    ("outbox", [("claim", 1)], {}),
+]
+
+
+def index_fingerprint() -> str:
+    return hashlib.sha256(json.dumps(INDEX_SPECS, sort_keys=True).encode()).hexdigest()
+
+
 class MongoClientWrapper:
     def __init__(self):
         # Firestore's Mongo-compatible URI already includes TLS and auth.
@@ -16,8 +76,14 @@ class MongoClientWrapper:
         self.client = AsyncIOMotorClient(
             settings.MONGO_URI,
             uuidRepresentation="standard",
+            # Timestamps are BSON dates; read them back as aware UTC datetimes.
+            tz_aware=True,
+            # Per-request round-trip accounting (Server-Timing) and pool occupancy (/ready)
+            event_listeners=[db_command_listener, pool_stats],
         )
         self.db = self.client[settings.MONGO_DB]
+        self._coalescer: InsertCoalescer | None = None
+        self._transactions: bool | None = None
 
     # --- Collections ---
     @property
@@ -48,53 +114,103 @@ class MongoClientWrapper:
     def users(self):
         return self.db["users"]
 
+    @property
+    def entity_events(self):
+        return self.db["entity_events"]
+
+    @property
+    def qr_consumed(self):
+        # Used QR tokens when QR_REPLAY_STORE=mongo (see app/services/qr.py)
+        return self.db["qr_consumed"]
+
+    @property
+    def counters(self):
+        # Per-status document counts for count=true (see app/services/counts.py)
+        return self.db["counters"]
+
+    @property
+    def outbox(self):
+        return self.db["outbox"]
+
+    @property
+    def meta(self):
+        # Internal bookkeeping: migration checkpoints and the like
+        return self.db["meta"]
+
     # --- Utilities ---
 
+    async def insert(self, collection: str, doc: dict):
+        """
+        insert_one for hot write paths; with DB_INSERT_COALESCING it joins a group-commit
+        batch (see app/db/coalescer.py). Raises DuplicateKeyError/WriteError like insert_one.
+        """
+        if not settings.DB_INSERT_COALESCING:
+            await self.db[collection].insert_one(doc)
+            return doc["_id"]
+        if self._coalescer is None:
+            self._coalescer = InsertCoalescer(
+                self.db, settings.DB_INSERT_MAX_BATCH, settings.DB_INSERT_LINGER_MS)
+        return await self._coalescer.insert(collection, doc)
+
+    async def flush_inserts(self):
+        """Write out pending group-commit batches; called on shutdown."""
+        if self._coalescer is not None:
+            await self._coalescer.close()
+
+    async def supports_transactions(self) -> bool:
+        """Multi-document transactions need a replica set or a sharded cluster; checked once."""
+        if self._transactions is None:
+            hello = await self.db.command("hello")
+            self._transactions = "setName" in hello or hello.get("msg") == "isdbgrid"
+        return self._transactions
+
     async def ping(self):
         # Connectivity check
         await self.db.command("ping")
 
+    def pool_status(self) -> dict:
+        return {**pool_stats.snapshot(), "maxPoolSize": self.client.delegate.options.pool_options.max_pool_size}
+
     async def ensure_indexes(self):
         """
         Some Mongo-compatible backends (e.g., Firestore’s Mongo API) block runtime index creation.
         Make this optional and non-fatal.
+
+        All indexes are requested concurrently. A fingerprint of INDEX_SPECS is stored in
+        `meta` once every index exists, so later cold starts skip straight past this with a
+        single read until the spec list changes.
         """
         if not settings.DB_CREATE_INDEXES:
             log.info("DB_CREATE_INDEXES=false -> skipping runtime index creation.")
             return
 
+        fingerprint = index_fingerprint()
         try:
-            # signups: list & triage
-            await self.signups.create_index([("status", 1), ("createdAt", -1)])
-
-            # households: lookup by community + villa
-            await self.households.create_index([("community", 1), ("villaNumber", 1)], unique=False)
-
-            # containers: who has what, current state
-            await self.containers.create_index([("assignedHouseholdId", 1), ("state", 1)])
-
-            # collection_requests: dashboards + history
-            await self.collection_requests.create_index([("status", 1), ("requestedAt", -1)])
-            await self.collection_requests.create_index([("householdId", 1), ("requestedAt", -1)])
-
-            # container_assignments: audit trails
-            await self.container_assignments.create_index([("householdId", 1), ("assignedAt", -1)])
-            await self.container_assignments.create_index([("containerId", 1), ("assignedAt", -1)])
-
-            # users: auth
-            await self.users.create_index([("username", 1)], unique=True)
-
-            # deployments: task assignment
-            await self.deployments.create_index([("assignedTo", 1), ("performedAt", -1)])
-            await self.deployments.create_index([("type", 1), ("performedAt", -1)])
-
-            log.info("Indexes ensured (Mongo driver).")
-        except OperationFailure as e:
-            # Firestore Mongo API often blocks createIndex -> do not fail startup
-            log.warning(
-                "Index creation denied by backend. Continuing without runtime createIndex. Details: %s",
-                e,
+            stored = await self.meta.find_one({"_id": "indexes"})
+            if stored and stored.get("fingerprint") == fingerprint:
+                log.info("Index catalog unchanged (%s) -> skipping createIndex.", fingerprint[:12])
+                return
+
+            results = await asyncio.gather(
+                *(self.db[coll].create_index(keys, **opts) for coll, keys, opts in INDEX_SPECS),
+                return_exceptions=True,
             )
+            errors = [r for r in results if isinstance(r, Exception)]
+            if not errors:
+                await self.meta.update_one(
+                    {"_id": "indexes"}, {"$set": {"fingerprint": fingerprint}}, upsert=True)
+                log.info("Indexes ensured (Mongo driver).")
+                return
+            if all(isinstance(e, OperationFailure) for e in errors):
+                # Firestore Mongo API often blocks createIndex -> do not fail startup
+                log.warning(
+                    "Index creation denied by backend for %d/%d indexes. Continuing without runtime createIndex. Details: %s",
+                    len(errors), len(INDEX_SPECS), errors[0],
+                )
+            else:
+                log.warning(
+                    "Index creation failed non-fatally for %d/%d indexes. Continuing. Details: %s",
+                    len(errors), len(INDEX_SPECS), errors[0])
         except Exception as e:
             log.warning(
                 "Index creation failed non-fatally. Continuing. Details: %s", e)
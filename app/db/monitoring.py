@@ -0,0 +1,115 @@
+# app/db/monitoring.py
+import threading
+from contextvars import ContextVar
+
+from pymongo import monitoring
+
+from app.core import tracing
+from app.core.config import settings
+
+
+class RequestDbStats:
+    """Mongo round trips and time spent in them for the current request."""
+    __slots__ = ("ops", "db_ms", "commands")
+
+    def __init__(self):
+        self.ops = 0
+        self.db_ms = 0.0
+        self.commands: dict[str, int] = {}
+
+    def record(self, command_name: str, duration_micros: int):
+        self.ops += 1
+        self.db_ms += duration_micros / 1000
+        self.commands[command_name] = self.commands.get(command_name, 0) + 1
+
+
+# Holds a mutable stats object: Motor runs pymongo on executor threads with a copy of
+# the caller's context, so the listener below updates the same object the request sees.
+_request_stats: ContextVar[RequestDbStats | None] = ContextVar("request_db_stats", default=None)
+
+
+def start_request_stats() -> RequestDbStats:
+    stats = RequestDbStats()
+    _request_stats.set(stats)
+    return stats
+
+
+def current_request_stats() -> RequestDbStats | None:
+    return _request_stats.get()
+
+
+class DbCommandListener(monitoring.CommandListener):
+    def started(self, event):
+        if settings.TRACE_ENABLED:
+            tracing.db_started(event)
+
+    def succeeded(self, event):
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.record(event.command_name, event.duration_micros)
+        if settings.TRACE_ENABLED:
+            tracing.db_finished(event)
+
+    def failed(self, event):
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.record(event.command_name, event.duration_micros)
+        if settings.TRACE_ENABLED:
+            tracing.db_finished(event, error=str((event.failure or {}).get("errmsg") or event.failure))
+
+
+db_command_listener = DbCommandListener()
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connection pool occupancy across all servers, for the readiness probe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.checked_out = 0
+        self.checkout_failures = 0
+
+    def snapshot(self) -> dict:
+        return {"open": self.open, "checkedOut": self.checked_out, "checkoutFailures": self.checkout_failures}
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checked_out += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+
+pool_stats = PoolStats()
@@ -0,0 +1,36 @@
+"""
+Move finished history rows older than ARCHIVE_AFTER_DAYS to the `*_archive`
+collections (see app/services/archive.py). Resumable: rows are moved in
+`_id`-ordered chunks and each chunk is copied before it is deleted, so an
+interrupted run is simply started again.
+
+    python -m app.jobs.archive [--collection deployments] [--older-than-days 180] [--chunk-size 500] [--pause 0.05]
+"""
+import argparse
+import asyncio
+import logging
+
+from app.dependencies.db import get_db
+from app.services.archive import ARCHIVED, archive_all
+
+log = logging.getLogger("jobs.archive")
+
+
+async def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", choices=sorted(ARCHIVED), action="append",
+                        help="limit to a collection (repeatable); default: all")
+    parser.add_argument("--older-than-days", type=int, default=None,
+                        help="default: ARCHIVE_AFTER_DAYS")
+    parser.add_argument("--chunk-size", type=int, default=None, help="default: ARCHIVE_CHUNK_SIZE")
+    parser.add_argument("--pause", type=float, default=None,
+                        help="seconds to sleep between chunks to leave room for live traffic")
+    args = parser.parse_args(argv)
+
+    moved = await archive_all(get_db(), args.collection, args.older_than_days, args.chunk_size, args.pause)
+    log.info("done: %s", moved)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    asyncio.run(main())
@@ -1,10 +1,18 @@
 import asyncio
+import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from app.core import tracing
 from app.core.config import settings
+from app.middleware.admission import admission_middleware
 from app.middleware.auth import api_key_auth_middleware
+from app.middleware.singleflight import singleflight_middleware
+from app.middleware.timing import db_timing_middleware
+from app.middleware.tracing import tracing_middleware
 from app.dependencies.db import get_db
-from app.routers import health, qr, signups, collection_requests, deployments, containers, households, users, collections
+from app.routers import health, qr, signups, collection_requests, deployments, containers, households, users, collections, admin, search, sync
+from app.services import archive, counts, labels, outbox, readiness
+from app.services import search as search_service
 
 app = FastAPI(
     title="HomeCollection API",
@@ -26,9 +34,24 @@ if settings.ALLOWED_ORIGINS:
         max_age=86400,  # cache preflight for a day
     )
 
+# Middleware registered later wraps earlier ones, so requests pass through
+# tracing -> timing -> API key -> single-flight -> admission control -> router.
+
+# Admission control (rate limits + concurrency caps)
+app.middleware("http")(admission_middleware)
+
+# Identical concurrent hot GETs share one execution; followers skip admission control
+app.middleware("http")(singleflight_middleware)
+
 # API key middleware
 app.middleware("http")(api_key_auth_middleware)
 
+# Mongo round-trip accounting -> Server-Timing header + structured log line
+app.middleware("http")(db_timing_middleware)
+
+# Span trees of sampled and slow requests -> rotating JSONL (TRACE_ENABLED)
+app.middleware("http")(tracing_middleware)
+
 # Routers
 app.include_router(
     health.router, prefix=settings.API_BASE_PATH, tags=["health"])
@@ -47,22 +70,47 @@ app.include_router(users.router,
                    prefix=settings.API_BASE_PATH, tags=["users", "auth"])
 app.include_router(collections.router,
                    prefix=settings.API_BASE_PATH, tags=["collections"])
+app.include_router(search.router,
+                   prefix=settings.API_BASE_PATH, tags=["search"])
+app.include_router(sync.router,
+                   prefix=settings.API_BASE_PATH, tags=["sync"])
+app.include_router(admin.router,
+                   prefix=settings.API_BASE_PATH, tags=["admin"])
 
-# Background worker for outbox (optional)
+# Background tasks (outbox worker, readiness probe, index creation, counter recount)
 _stop_event: asyncio.Event | None = None
 _task: asyncio.Task | None = None
 
 
-async def startup_event():
-    db = get_db()
+async def _ensure_indexes(db):
     try:
         await db.ensure_indexes()
     except Exception as e:
         # Never block startup if indexes can’t be created at runtime
-        import logging
         logging.getLogger("uvicorn.error").warning(
             "ensure_indexes failed, continuing: %s", e)
+
+
+async def _background(db, stop: asyncio.Event):
+    tasks = [readiness.run_probe(db, stop), _ensure_indexes(db)]
+    if settings.OUTBOX_ENABLED:
+        tasks.append(outbox.run_worker(db, stop))
+    if settings.SEARCH_NGRAM_ENABLED:
+        tasks.append(search_service.run_ngram_index(db, stop))
+    if settings.ARCHIVE_ENABLED:
+        tasks.append(archive.run_archiver(db, stop))
+    if settings.COUNTS_RECONCILE_INTERVAL_SECONDS > 0:
+        tasks.append(counts.run_reconciler(db, stop))
+    await asyncio.gather(*tasks)
+
+
+@app.on_event("startup")
+async def startup_event():
+    # Return immediately: indexes, the first ping and the outbox run in the background
+    # and /ready reports 503 until Mongo has answered.
     global _stop_event, _task
+    _stop_event = asyncio.Event()
+    _task = asyncio.create_task(_background(get_db(), _stop_event))
 
 
 @app.on_event("shutdown")
@@ -71,3 +119,6 @@ async def shutdown_event():
     if _stop_event and _task:
         _stop_event.set()
         await _task
+    await get_db().flush_inserts()
+    labels.shutdown_pool()
+    tracing.shutdown()
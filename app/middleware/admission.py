@@ -0,0 +1,243 @@
+# app/middleware/admission.py
+import asyncio
+import math
+import time
+from collections import OrderedDict
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from starlette.routing import Match
+
+from app.core import metrics
+from app.core.config import settings
+
+# Priority classes. Field writes (swaps, collection requests) must keep getting pool
+# connections while OMS bulk reads are throttled hard; everything else is "default",
+# including the driver polling reads (GET /collection-requests, /deployments, /sync).
+CRITICAL_ROUTES = {
+    "POST /deployments/swap",
+    "POST /deployments/swap/batch",
+    "POST /deployments/perform",
+    "POST /collection-requests",
+    "POST /collection-requests/claim",
+    "POST /collection-requests/{request_id}/lease",
+    "PATCH /collection-requests/{request_id}/assign",
+    "PATCH /collection-requests/{request_id}/status",
+    "POST /collections/start-manual",
+}
+BULK_ROUTES = {
+    "GET /signups",
+    "GET /signups/all",
+    "GET /signups/awaiting-deployment",
+    "GET /collections",
+    "GET /households",
+    "GET /containers",
+    "GET /users",
+    "POST /households:import",
+    "POST /containers:import",
+    "POST /qr/labels",
+}
+# Probes and long-lived streams are never limited
+EXEMPT_ROUTES = {
+    "GET /health",
+    "GET /ready",
+    "GET /collection-requests/stream",
+}
+
+
+def _parse(raw: str) -> dict[str, str]:
+    # "critical=50:100;GET /collections=1:2" -> {"critical": "50:100", "GET /collections": "1:2"}
+    out = {}
+    for item in raw.split(";"):
+        key, sep, value = item.strip().rpartition("=")
+        if sep and key:
+            out[key.strip()] = value.strip()
+    return out
+
+
+def _parse_rates(raw: str) -> dict[str, tuple[float, float]]:
+    rates = {}
+    for key, value in _parse(raw).items():
+        rate, _, burst = value.partition(":")
+        rates[key] = (float(rate), float(burst or rate))
+    return rates
+
+
+def _parse_caps(raw: str) -> dict[str, int]:
+    return {key: int(value) for key, value in _parse(raw).items()}
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Consume one token; returns 0 on success, otherwise seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+
+class Gate:
+    """Concurrency cap; waiters give up after the queue timeout."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self._sem = asyncio.Semaphore(limit)
+
+    async def acquire(self, timeout: float) -> bool:
+        if self._sem.locked() and timeout <= 0:
+            return False
+        try:
+            await asyncio.wait_for(self._sem.acquire(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        self._sem.release()
+
+
+class Admission:
+    def __init__(self):
+        self.class_rates = _parse_rates(settings.ADMISSION_RATE_LIMITS)
+        self.route_rates = _parse_rates(settings.ADMISSION_ROUTE_RATE_LIMITS)
+        self.class_gates = {
+            name: Gate(cap) for name, cap in _parse_caps(settings.ADMISSION_CONCURRENCY).items() if cap > 0}
+        self.route_gates = {
+            name: Gate(cap) for name, cap in _parse_caps(settings.ADMISSION_ROUTE_CONCURRENCY).items() if cap > 0}
+        # (client, class or route) -> bucket, least recently used first
+        self.buckets: OrderedDict[tuple[str, str], TokenBucket] = OrderedDict()
+        self.admitted: dict[str, int] = {}
+        self.shed: dict[str, int] = {}
+
+    def bucket(self, client: str, scope: str, rate: tuple[float, float]) -> TokenBucket:
+        key = (client, scope)
+        b = self.buckets.get(key)
+        if b is None:
+            b = self.buckets[key] = TokenBucket(*rate)
+            if len(self.buckets) > settings.ADMISSION_MAX_CLIENTS:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+        return b
+
+    def count(self, counter: dict, key: str):
+        counter[key] = counter.get(key, 0) + 1
+
+    def stats(self) -> dict:
+        return {
+            "admitted": dict(self.admitted),
+            "shed": dict(self.shed),
+            "inFlight": {name: g.in_flight for name, g in {**self.class_gates, **self.route_gates}.items()},
+            "clients": len(self.buckets),
+        }
+
+
+_admission: Admission | None = None
+
+
+def get_admission() -> Admission:
+    global _admission
+    if _admission is None:
+        _admission = Admission()
+        metrics.register("admission", _admission.stats)
+    return _admission
+
+
+def route_key(request: Request) -> str | None:
+    """Route template ("PATCH /collection-requests/{request_id}/status") before routing runs."""
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            path = getattr(route, "path", request.url.path)
+            if path.startswith(settings.API_BASE_PATH):
+                path = path[len(settings.API_BASE_PATH):]
+            return f"{request.method} {path}"
+    return None
+
+
+def priority_class(route: str) -> str:
+    if route in CRITICAL_ROUTES:
+        return "critical"
+    if route in BULK_ROUTES:
+        return "bulk"
+    return "default"
+
+
+def client_ip(request: Request) -> str:
+    """
+    Address of the caller: the entry ADMISSION_TRUSTED_PROXIES hops from the right of
+    X-Forwarded-For (each trusted proxy appends the address it received from), else the
+    socket peer. Entries further left are client-supplied and never used.
+    """
+    hops = settings.ADMISSION_TRUSTED_PROXIES
+    forwarded = request.headers.get("x-forwarded-for")
+    if hops > 0 and forwarded:
+        chain = [a.strip() for a in forwarded.split(",") if a.strip()]
+        if chain:
+            return chain[-min(hops, len(chain))]
+    return request.client.host if request.client else "unknown"
+
+
+def client_id(request: Request) -> str:
+    # The API key is shared by every app install, so it does not identify a caller:
+    # the signed-in user (X-User-Id, the id /auth/login returns), else the client address
+    user = request.headers.get("x-user-id")
+    if user:
+        return "user:" + user
+    return "ip:" + client_ip(request)
+
+
+def _too_many(detail: str, retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        status_code=429, content={"detail": detail},
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+
+async def admission_middleware(request: Request, call_next):
+    if not settings.ADMISSION_ENABLED or request.method == "OPTIONS":
+        return await call_next(request)
+
+    route = route_key(request)
+    if route is None or route in EXEMPT_ROUTES:
+        return await call_next(request)
+
+    adm = get_admission()
+    klass = priority_class(route)
+    client = client_id(request)
+
+    # 1) Rate: route override if configured, else the class bucket
+    rate_scope, rate = (route, adm.route_rates[route]) if route in adm.route_rates else (klass, adm.class_rates.get(klass))
+    if rate:
+        wait = adm.bucket(client, rate_scope, rate).take()
+        if wait:
+            adm.count(adm.shed, f"{klass}:rate")
+            return _too_many("Rate limit exceeded", wait)
+
+    # 2) Concurrency: class cap, then route cap. Critical routes are uncapped by default.
+    gates = [g for g in (adm.class_gates.get(klass), adm.route_gates.get(route)) if g]
+    held = []
+    try:
+        for gate in gates:
+            if not await gate.acquire(settings.ADMISSION_QUEUE_TIMEOUT_SECONDS):
+                adm.count(adm.shed, f"{klass}:concurrency")
+                return _too_many("Server busy, retry shortly", 1)
+            held.append(gate)
+        adm.count(adm.admitted, klass)
+        return await call_next(request)
+    finally:
+        for gate in held:
+            gate.release()
@@ -8,6 +8,7 @@ API_KEY = os.getenv("API_KEY", "")
 
 PUBLIC_PATHS = (
     "/health",
+    "/ready",
     "/qr/sign",
     "/qr/verify",
     "/auth/login",
@@ -0,0 +1,74 @@
+# app/middleware/singleflight.py
+import asyncio
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from app.core import metrics
+from app.core.config import settings
+from app.middleware.admission import route_key
+
+# Routes whose identical concurrent GETs share one execution, e.g. "GET /collections;GET /deployments"
+_routes = {r.strip() for r in settings.SINGLEFLIGHT_ROUTES.split(";") if r.strip()}
+
+# key -> future resolved with (status, raw headers, body) of the leader's response
+_in_flight: dict[tuple, asyncio.Future] = {}
+_stats = {"leaders": 0, "coalesced": 0, "failedLeaders": 0, "byRoute": {}}
+
+
+def _stats_snapshot() -> dict:
+    return {**_stats, "byRoute": dict(_stats["byRoute"]), "inFlight": len(_in_flight)}
+
+
+metrics.register("singleflight", _stats_snapshot)
+
+
+def _key(route: str, request: Request) -> tuple:
+    # Parameter order and repeated keys are normalized; values are kept verbatim.
+    return route, tuple(sorted(request.query_params.multi_items()))
+
+
+def _replay(shared: tuple) -> Response:
+    status, raw_headers, body = shared
+    resp = Response(content=body, status_code=status)
+    resp.raw_headers = list(raw_headers)
+    return resp
+
+
+async def singleflight_middleware(request: Request, call_next):
+    if request.method != "GET" or not _routes:
+        return await call_next(request)
+    route = route_key(request)
+    if route not in _routes:
+        return await call_next(request)
+
+    key = _key(route, request)
+    fut = _in_flight.get(key)
+    if fut is not None:
+        try:
+            # shield: a follower disconnecting must not cancel the shared result
+            shared = await asyncio.shield(fut)
+        except Exception:
+            # Leader failed or was cancelled; run this request on its own
+            return await call_next(request)
+        _stats["coalesced"] += 1
+        _stats["byRoute"][route] = _stats["byRoute"].get(route, 0) + 1
+        return _replay(shared)
+
+    fut = asyncio.get_running_loop().create_future()
+    _in_flight[key] = fut
+    _stats["leaders"] += 1
+    try:
+        response = await call_next(request)
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        shared = (response.status_code, tuple(response.raw_headers), body)
+        fut.set_result(shared)
+        return _replay(shared)
+    except BaseException as e:
+        _stats["failedLeaders"] += 1
+        fut.set_exception(e if isinstance(e, Exception) else RuntimeError("leader cancelled"))
+        # Nobody may be waiting; mark the exception as retrieved
+        fut.exception()
+        raise
+    finally:
+        _in_flight.pop(key, None)
@@ -0,0 +1,61 @@
+# app/middleware/timing.py
+import json
+import logging
+import time
+
+from fastapi import Request
+
+from app.core.config import settings
+from app.db.monitoring import start_request_stats
+from app.repositories.base import start_identity_map
+
+log = logging.getLogger("uvicorn.error")
+
+
+def _parse_budgets(raw: str) -> dict[str, int]:
+    # "POST /deployments/swap=10;GET /households/{household_id}/history=4"
+    budgets = {}
+    for item in raw.split(";"):
+        key, sep, value = item.strip().rpartition("=")
+        if sep and key:
+            budgets[key.strip()] = int(value)
+    return budgets
+
+
+_budgets = _parse_budgets(settings.DB_ROUNDTRIP_BUDGETS)
+
+
+def _route_key(request: Request) -> str:
+    route = request.scope.get("route")
+    path = getattr(route, "path", None) or request.url.path
+    if path.startswith(settings.API_BASE_PATH):
+        path = path[len(settings.API_BASE_PATH):]
+    return f"{request.method} {path}"
+
+
+async def db_timing_middleware(request: Request, call_next):
+    stats = start_request_stats()
+    start_identity_map()
+    t0 = time.perf_counter()
+    response = await call_next(request)
+    total_ms = (time.perf_counter() - t0) * 1000
+
+    response.headers["Server-Timing"] = (
+        f'db;dur={stats.db_ms:.1f};desc="{stats.ops} ops", app;dur={total_ms:.1f}'
+    )
+
+    route = _route_key(request)
+    budget = _budgets.get(route, settings.DB_ROUNDTRIP_BUDGET)
+    over_budget = budget > 0 and stats.ops > budget
+    log.info(json.dumps({
+        "route": route,
+        "status": response.status_code,
+        "durationMs": round(total_ms, 1),
+        "dbOps": stats.ops,
+        "dbMs": round(stats.db_ms, 1),
+        "dbCommands": stats.commands,
+        "overBudget": over_budget,
+    }))
+    if over_budget:
+        log.warning("%s used %d Mongo round trips (budget %d): %s", route, stats.ops, budget, stats.commands)
+    return response
@@ -0,0 +1,21 @@
+# app/middleware/tracing.py
+from fastapi import Request
+
+from app.core import tracing
+from app.core.config import settings
+from app.middleware.timing import _route_key
+
+
+async def tracing_middleware(request: Request, call_next):
+    if not settings.TRACE_ENABLED:
+        return await call_next(request)
+    trace = tracing.start_trace()
+    with tracing.span(f"{request.method} {request.url.path}", cat="http") as root:
+        response = await call_next(request)
+        # Known once routed: name the trace after the route template
+        root.name = _route_key(request)
+        root.attrs["status"] = response.status_code
+    # A streamed body is produced after this point; its spans are not in the trace
+    if tracing.finish(trace, root):
+        response.headers["X-Trace-Id"] = trace.id
+    return response
@@ -0,0 +1,35 @@
+"""
+Seed (or re-seed) the per-status counters behind `count=true` on signups and
+collection requests, from an aggregation over the collections themselves.
+
+Until a collection has been seeded, status-only counts fall back to cached
+`count_documents`. Run this on a schedule (e.g. hourly cron) to correct drift; the
+in-process recount (COUNTS_RECONCILE_INTERVAL_SECONDS) is off by default because every
+instance that enables it recounts on its own.
+
+    python -m app.migrations.counters [--collection signups]
+"""
+import argparse
+import asyncio
+import logging
+
+from app.dependencies.db import get_db
+from app.services.counts import COUNTED, reconcile
+
+log = logging.getLogger("migrations.counters")
+
+
+async def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", choices=sorted(COUNTED), action="append",
+                        help="limit to a collection (repeatable); default: all")
+    args = parser.parse_args(argv)
+
+    db = get_db()
+    for name in args.collection or list(COUNTED):
+        log.info("%s: %s", name, await reconcile(db, name))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    asyncio.run(main())
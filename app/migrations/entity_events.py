@@ -0,0 +1,109 @@
+"""
+Build the per-entity timeline (`entity_events`) from existing deployments and
+collection requests.
+
+Uses the same event builders as the live write paths, so events already written by
+the API are skipped rather than duplicated. Online and resumable like the timestamp
+migration: `_id`-ordered chunks, checkpoint per source collection in `meta`.
+
+    python -m app.migrations.entity_events [--source deployments] [--chunk-size 500] [--pause 0.05]
+    python -m app.migrations.entity_events --restart   # forget checkpoints, rescan everything
+
+Status changes made before the timeline existed carry no timestamp of their own;
+completed requests are covered by their swap event, and cancelled ones are placed
+at their request time.
+"""
+import argparse
+import asyncio
+import logging
+
+from app.dependencies.db import get_db
+from app.services import timeline
+
+log = logging.getLogger("migrations.entity_events")
+
+
+def _request_source_events(req: dict) -> list[dict]:
+    events = timeline.request_events(req)
+    status = req.get("status")
+    if status not in (None, "requested") and not req.get("swap"):
+        events += timeline.status_events(req, status, req.get("requestedAt"), req.get("updatedBy"))
+    return events
+
+
+async def _drop_recorded_statuses(db, events: list[dict]) -> list[dict]:
+    """
+    Drop inferred status events for transitions the API already recorded: live events
+    carry a per-transition ref, so they would not dedupe against the backfilled one.
+    """
+    inferred = [e for e in events if e["kind"] == "collection_status"]
+    if not inferred:
+        return events
+    recorded = {
+        (d["entityId"], d["data"].get("requestId"), d["data"].get("status"))
+        async for d in db.entity_events.find(
+            {"entityId": {"$in": list({e["entityId"] for e in inferred})}, "kind": "collection_status"},
+            {"entityId": 1, "data.requestId": 1, "data.status": 1})
+    }
+    return [e for e in events if e["kind"] != "collection_status"
+            or (e["entityId"], e["data"].get("requestId"), e["data"].get("status")) not in recorded]
+
+
+SOURCES = {
+    "deployments": timeline.deployment_events,
+    "collection_requests": _request_source_events,
+}
+
+
+async def backfill_source(db, name: str, chunk_size: int, pause: float) -> int:
+    build = SOURCES[name]
+    coll = db.db[name]
+    checkpoint_id = f"migration:entity_events:{name}"
+    checkpoint = await db.meta.find_one({"_id": checkpoint_id}) or {}
+    if checkpoint.get("done"):
+        log.info("%s: already backfilled", name)
+        return 0
+
+    last_id = checkpoint.get("lastId")
+    appended = 0
+    while True:
+        q = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        docs = [d async for d in coll.find(q).sort("_id", 1).limit(chunk_size)]
+        if not docs:
+            break
+        events = [e for d in docs for e in build(d)]
+        if name == "collection_requests":
+            events = await _drop_recorded_statuses(db, events)
+        appended += await timeline.append(db, events)
+        last_id = docs[-1]["_id"]
+        await db.meta.update_one({"_id": checkpoint_id}, {"$set": {"lastId": last_id}}, upsert=True)
+        log.info("%s: %d events appended so far (at _id=%s)", name, appended, last_id)
+        if pause:
+            await asyncio.sleep(pause)
+
+    await db.meta.update_one({"_id": checkpoint_id}, {"$set": {"done": True}}, upsert=True)
+    log.info("%s: done, %d events appended", name, appended)
+    return appended
+
+
+async def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", choices=sorted(SOURCES), action="append",
+                        help="limit to a source collection (repeatable); default: all")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--pause", type=float, default=0.05,
+                        help="seconds to sleep between chunks to leave room for live traffic")
+    parser.add_argument("--restart", action="store_true", help="drop checkpoints and rescan")
+    args = parser.parse_args(argv)
+
+    db = get_db()
+    names = args.source or list(SOURCES)
+    if args.restart:
+        await db.meta.delete_many({"_id": {"$in": [f"migration:entity_events:{n}" for n in names]}})
+    for name in names:
+        await backfill_source(db, name, args.chunk_size, args.pause)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+"""
+Copy `community`, `villaNumber` (from the household) and `containerSerial` (from the
+container) onto collection requests written before the write paths stamped them,
+so community filters on /collections and /collection-requests see every request.
+
+Online and resumable: `_id`-ordered chunks, one `$in` lookup per chunk for
+households and containers, checkpoint per collection in `meta`.
+
+    python -m app.migrations.request_denorm [--collection collection_requests_archive] [--chunk-size 500] [--pause 0.05]
+    python -m app.migrations.request_denorm --restart   # forget checkpoints, rescan everything
+"""
+import argparse
+import asyncio
+import logging
+
+from pymongo import UpdateOne
+
+from app.dependencies.db import get_db
+from app.repositories.collection_requests import denormalized
+
+log = logging.getLogger("migrations.request_denorm")
+
+COLLECTIONS = ("collection_requests", "collection_requests_archive")
+FIELDS = ("householdId", "containerId", "community", "villaNumber", "containerSerial")
+
+
+async def migrate_collection(db, name: str, chunk_size: int, pause: float) -> int:
+    coll = db.db[name]
+    checkpoint_id = f"migration:request_denorm:{name}"
+    checkpoint = await db.meta.find_one({"_id": checkpoint_id}) or {}
+    if checkpoint.get("done"):
+        log.info("%s: already backfilled", name)
+        return 0
+
+    last_id = checkpoint.get("lastId")
+    updated = 0
+    projection = {f: 1 for f in FIELDS}
+    while True:
+        q = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        docs = [d async for d in coll.find(q, projection).sort("_id", 1).limit(chunk_size)]
+        if not docs:
+            break
+        hids = list({d["householdId"] for d in docs if d.get("householdId")})
+        cids = list({d["containerId"] for d in docs if d.get("containerId")})
+        households = {h["_id"]: h async for h in db.households.find(
+            {"_id": {"$in": hids}}, {"community": 1, "villaNumber": 1})}
+        containers = {c["_id"]: c async for c in db.containers.find({"_id": {"$in": cids}}, {"serial": 1})}
+        ops = []
+        for d in docs:
+            fields = denormalized(households.get(d.get("householdId")), containers.get(d.get("containerId")))
+            changed = {k: v for k, v in fields.items() if v is not None and d.get(k) != v}
+            if changed:
+                ops.append(UpdateOne({"_id": d["_id"]}, {"$set": changed}))
+        if ops:
+            res = await coll.bulk_write(ops, ordered=False)
+            updated += res.modified_count
+        last_id = docs[-1]["_id"]
+        await db.meta.update_one({"_id": checkpoint_id}, {"$set": {"lastId": last_id}}, upsert=True)
+        log.info("%s: %d documents updated so far (at _id=%s)", name, updated, last_id)
+        if pause:
+            await asyncio.sleep(pause)
+
+    await db.meta.update_one({"_id": checkpoint_id}, {"$set": {"done": True}}, upsert=True)
+    log.info("%s: done, %d documents updated", name, updated)
+    return updated
+
+
+async def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", choices=COLLECTIONS, action="append",
+                        help="limit to a collection (repeatable); default: all")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--pause", type=float, default=0.05,
+                        help="seconds to sleep between chunks to leave room for live traffic")
+    parser.add_argument("--restart", action="store_true", help="drop checkpoints and rescan")
+    args = parser.parse_args(argv)
+
+    db = get_db()
+    names = args.collection or list(COLLECTIONS)
+    if args.restart:
+        await db.meta.delete_many({"_id": {"$in": [f"migration:request_denorm:{n}" for n in names]}})
+    for name in names:
+        await migrate_collection(db, name, args.chunk_size, args.pause)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+"""
+Compute `searchKeys` (see app/services/search.py) for households and signups
+written before /search existed, or recompute them after the key format changes.
+
+Online and resumable: `_id`-ordered chunks, checkpoint per collection in `meta`.
+
+    python -m app.migrations.search_keys [--collection households] [--chunk-size 500] [--pause 0.05]
+    python -m app.migrations.search_keys --restart   # forget checkpoints, recompute everything
+"""
+import argparse
+import asyncio
+import logging
+
+from pymongo import UpdateOne
+
+from app.dependencies.db import get_db
+from app.services.search import search_keys
+
+log = logging.getLogger("migrations.search_keys")
+
+SOURCE_FIELDS: dict[str, tuple[str, ...]] = {
+    "households": ("primaryContact", "addressText", "villaNumber", "community", "searchKeys"),
+    "signups": ("fullName", "phone", "addressText", "villaNumber", "community", "searchKeys"),
+}
+
+
+async def migrate_collection(db, name: str, chunk_size: int, pause: float) -> int:
+    coll = db.db[name]
+    checkpoint_id = f"migration:search_keys:{name}"
+    checkpoint = await db.meta.find_one({"_id": checkpoint_id}) or {}
+    if checkpoint.get("done"):
+        log.info("%s: already indexed", name)
+        return 0
+
+    last_id = checkpoint.get("lastId")
+    updated = 0
+    projection = {f: 1 for f in SOURCE_FIELDS[name]}
+    while True:
+        q = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        docs = [d async for d in coll.find(q, projection).sort("_id", 1).limit(chunk_size)]
+        if not docs:
+            break
+        ops = []
+        for d in docs:
+            keys = search_keys(name, d)
+            if keys != d.get("searchKeys"):
+                ops.append(UpdateOne({"_id": d["_id"]}, {"$set": {"searchKeys": keys}}))
+        if ops:
+            res = await coll.bulk_write(ops, ordered=False)
+            updated += res.modified_count
+        last_id = docs[-1]["_id"]
+        await db.meta.update_one({"_id": checkpoint_id}, {"$set": {"lastId": last_id}}, upsert=True)
+        log.info("%s: %d documents updated so far (at _id=%s)", name, updated, last_id)
+        if pause:
+            await asyncio.sleep(pause)
+
+    await db.meta.update_one({"_id": checkpoint_id}, {"$set": {"done": True}}, upsert=True)
+    log.info("%s: done, %d documents updated", name, updated)
+    return updated
+
+
+async def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", choices=sorted(SOURCE_FIELDS), action="append",
+                        help="limit to a collection (repeatable); default: all")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--pause", type=float, default=0.05,
+                        help="seconds to sleep between chunks to leave room for live traffic")
+    parser.add_argument("--restart", action="store_true", help="drop checkpoints and recompute")
+    args = parser.parse_args(argv)
+
+    db = get_db()
+    names = args.collection or list(SOURCE_FIELDS)
+    if args.restart:
+        await db.meta.delete_many({"_id": {"$in": [f"migration:search_keys:{n}" for n in names]}})
+    for name in names:
+        await migrate_collection(db, name, args.chunk_size, args.pause)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    asyncio.run(main())
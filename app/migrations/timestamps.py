@@ -0,0 +1,105 @@
+"""
+Convert ISO-8601 string timestamps to native BSON dates.
+
+Online and resumable: documents are walked in `_id` order in chunks, each field is
+rewritten with a compare-and-set on its old string value (so a concurrent write is
+never clobbered), and the last processed `_id` per collection is checkpointed in the
+`meta` collection. Re-running continues where the previous run stopped.
+
+    python -m app.migrations.timestamps [--collection NAME] [--chunk-size 500] [--pause 0.05]
+    python -m app.migrations.timestamps --restart   # forget checkpoints, rescan everything
+
+When every collection reports done, set DB_LEGACY_STRING_TIMESTAMPS=false.
+"""
+import argparse
+import asyncio
+import logging
+
+from pymongo import UpdateOne
+
+from app.dependencies.db import get_db
+from app.utils.time import parse_ts
+
+log = logging.getLogger("migrations.timestamps")
+
+TIMESTAMP_FIELDS: dict[str, tuple[str, ...]] = {
+    "signups": ("createdAt", "updatedAt"),
+    "households": ("createdAt", "updatedAt", "lastSwapAt", "lastDeploymentAt"),
+    "containers": ("createdAt", "history.lastAssignedAt", "history.lastUnassignedAt"),
+    "collection_requests": ("requestedAt", "swap.performedAt"),
+    "deployments": ("performedAt", "createdAt"),
+    "container_assignments": ("assignedAt", "unassignedAt"),
+    "users": ("createdAt", "updatedAt"),
+}
+
+
+def _get_path(doc: dict, path: str):
+    for part in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+async def migrate_collection(db, name: str, chunk_size: int, pause: float) -> int:
+    fields = TIMESTAMP_FIELDS[name]
+    coll = db.db[name]
+    checkpoint_id = f"migration:timestamps:{name}"
+    checkpoint = await db.meta.find_one({"_id": checkpoint_id}) or {}
+    if checkpoint.get("done"):
+        log.info("%s: already migrated", name)
+        return 0
+
+    last_id = checkpoint.get("lastId")
+    converted = 0
+    pending = {"$or": [{f: {"$type": "string"}} for f in fields]}
+    while True:
+        q = {**pending, "_id": {"$gt": last_id}} if last_id is not None else pending
+        docs = [d async for d in coll.find(q, {f: 1 for f in fields}).sort("_id", 1).limit(chunk_size)]
+        if not docs:
+            break
+        ops = []
+        for d in docs:
+            for f in fields:
+                value = _get_path(d, f)
+                if not isinstance(value, str):
+                    continue
+                try:
+                    ops.append(UpdateOne({"_id": d["_id"], f: value}, {"$set": {f: parse_ts(value)}}))
+                except ValueError:
+                    log.warning("%s %s: unparseable %s=%r left as-is", name, d["_id"], f, value)
+        if ops:
+            res = await coll.bulk_write(ops, ordered=False)
+            converted += res.modified_count
+        last_id = docs[-1]["_id"]
+        await db.meta.update_one({"_id": checkpoint_id}, {"$set": {"lastId": last_id}}, upsert=True)
+        log.info("%s: converted %d fields so far (at _id=%s)", name, converted, last_id)
+        if pause:
+            await asyncio.sleep(pause)
+
+    await db.meta.update_one({"_id": checkpoint_id}, {"$set": {"done": True}}, upsert=True)
+    log.info("%s: done, %d fields converted", name, converted)
+    return converted
+
+
+async def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", choices=sorted(TIMESTAMP_FIELDS), action="append",
+                        help="limit to a collection (repeatable); default: all")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--pause", type=float, default=0.05,
+                        help="seconds to sleep between chunks to leave room for live traffic")
+    parser.add_argument("--restart", action="store_true", help="drop checkpoints and rescan")
+    args = parser.parse_args(argv)
+
+    db = get_db()
+    names = args.collection or list(TIMESTAMP_FIELDS)
+    if args.restart:
+        await db.meta.delete_many({"_id": {"$in": [f"migration:timestamps:{n}" for n in names]}})
+    for name in names:
+        await migrate_collection(db, name, args.chunk_size, args.pause)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    asyncio.run(main())
@@ -0,0 +1,149 @@
+from contextvars import ContextVar
+from dataclasses import dataclass, fields
+from datetime import datetime
+from typing import ClassVar
+
+from app.utils.time import to_iso
+
+# (collection, _id) -> full record, for the duration of one request. Set by the
+# request middleware; outside a request (scripts, workers) nothing is cached.
+_identity_map: ContextVar[dict | None] = ContextVar("identity_map", default=None)
+
+
+def start_identity_map() -> dict:
+    m: dict = {}
+    _identity_map.set(m)
+    return m
+
+
+@dataclass(slots=True)
+class Record:
+    """
+    Compact row decoded from a Mongo document. Subclasses declare the known fields;
+    anything else on a fully loaded document is kept in `extra` so detail endpoints
+    still return every stored field.
+    """
+    id: str
+    extra: dict | None = None
+
+    @classmethod
+    def projection(cls, names: tuple[str, ...] | None = None) -> dict:
+        return {n: 1 for n in (names or field_names(cls))}
+
+    def to_api(self, names: tuple[str, ...] | None = None) -> dict:
+        """Plain dict for responses: `id` plus fields, BSON dates as ISO strings."""
+        out = {"id": self.id}
+        for n in names or field_names(type(self)):
+            out[n] = _api_value(getattr(self, n))
+        if self.extra:
+            for k, v in self.extra.items():
+                out[k] = _api_value(v)
+        return out
+
+
+_field_names: dict[type, tuple[str, ...]] = {}
+
+
+def field_names(cls: type[Record]) -> tuple[str, ...]:
+    names = _field_names.get(cls)
+    if names is None:
+        names = _field_names[cls] = tuple(f.name for f in fields(cls) if f.name not in ("id", "extra"))
+    return names
+
+
+def _api_value(v):
+    if isinstance(v, datetime):
+        return to_iso(v)
+    if isinstance(v, dict):
+        return {k: _api_value(x) for k, x in v.items()}
+    return v
+
+
+# Derived/bookkeeping fields that are stored but never returned by the API
+INTERNAL_FIELDS = frozenset({"searchKeys"})
+
+
+def decode(cls: type[Record], doc: dict, keep_extra: bool = False) -> Record:
+    """The one doc -> record decoder. Missing fields decode to None."""
+    names = field_names(cls)
+    rec = cls.__new__(cls)
+    rec.id = doc["_id"]
+    get = doc.get
+    for n in names:
+        setattr(rec, n, get(n))
+    rec.extra = None
+    if keep_extra:
+        known = names
+        extra = {k: v for k, v in doc.items() if k != "_id" and k not in known and k not in INTERNAL_FIELDS}
+        rec.extra = extra or None
+    return rec
+
+
+class Repository:
+    """
+    Typed access to one collection. `get`/`get_many` load full documents and go through
+    the request-scoped identity map; `find` returns projected records for list views.
+    Call `forget(id)` after writing a document that the same request will read again.
+    """
+    collection: ClassVar[str]
+    record: ClassVar[type[Record]]
+
+    def __init__(self, db):
+        self.db = db
+        self.coll = db.db[self.collection]
+
+    def _cached(self, _id):
+        m = _identity_map.get()
+        return m.get((self.collection, _id)) if m is not None else None
+
+    def _remember(self, rec: Record):
+        m = _identity_map.get()
+        if m is not None:
+            m[(self.collection, rec.id)] = rec
+
+    def forget(self, _id):
+        m = _identity_map.get()
+        if m is not None:
+            m.pop((self.collection, _id), None)
+
+    async def get(self, _id, session=None) -> Record | None:
+        # Reads inside a transaction always go to the server (and are not cached)
+        if session is None:
+            rec = self._cached(_id)
+            if rec is not None:
+                return rec
+        doc = await self.coll.find_one({"_id": _id}, session=session)
+        if doc is None:
+            return None
+        rec = decode(self.record, doc, keep_extra=True)
+        if session is None:
+            self._remember(rec)
+        return rec
+
+    async def get_many(self, ids) -> dict:
+        """One `$in` round trip for every id not already in the identity map."""
+        found: dict = {}
+        missing = []
+        for _id in dict.fromkeys(ids):
+            rec = self._cached(_id)
+            if rec is not None:
+                found[_id] = rec
+            elif _id is not None:
+                missing.append(_id)
+        if missing:
+            async for doc in self.coll.find({"_id": {"$in": missing}}):
+                rec = decode(self.record, doc, keep_extra=True)
+                self._remember(rec)
+                found[rec.id] = rec
+        return found
+
+    async def find(self, q: dict, sort: list | None = None, limit: int | None = None,
+                   names: tuple[str, ...] | None = None, full: bool = False) -> list[Record]:
+        """Only `names` (default: all declared fields) are fetched, unless full=True."""
+        cur = self.coll.find(q, None if full else self.record.projection(names))
+        if sort:
+            cur = cur.sort(sort)
+        if limit:
+            cur = cur.limit(limit)
+        record = self.record
+        return [decode(record, doc, keep_extra=full) async for doc in cur]
@@ -0,0 +1,50 @@
+from dataclasses import dataclass
+from datetime import datetime
+
+from app.repositories.base import Record, Repository
+
+
+@dataclass(slots=True)
+class CollectionRequest(Record):
+    householdId: str | None = None
+    containerId: str | None = None
+    requestedAt: datetime | None = None
+    requestSource: str | None = None
+    status: str | None = None
+    assignedTo: str | None = None
+    geoAtRequest: dict | None = None
+    metrics: dict | None = None
+    swap: dict | None = None
+    updatedAt: datetime | None = None
+    version: int | None = None
+    # Copied from the household / container at write time for join-free filtering
+    community: str | None = None
+    villaNumber: str | None = None
+    containerSerial: str | None = None
+
+
+# Fields shown in request list views (RequestListOut)
+LIST_FIELDS = ("householdId", "containerId", "status", "requestedAt", "assignedTo",
+               "community", "villaNumber", "containerSerial", "version")
+# Collections summary additionally reads the swap metrics
+SUMMARY_FIELDS = LIST_FIELDS + ("metrics",)
+
+
+def _field(source, name: str):
+    if source is None:
+        return None
+    return source.get(name) if isinstance(source, dict) else getattr(source, name, None)
+
+
+def denormalized(household, container) -> dict:
+    """community/villaNumber/containerSerial for a request; accepts records or raw documents."""
+    return {
+        "community": _field(household, "community"),
+        "villaNumber": _field(household, "villaNumber"),
+        "containerSerial": _field(container, "serial"),
+    }
+
+
+class CollectionRequestRepository(Repository):
+    collection = "collection_requests"
+    record = CollectionRequest
@@ -0,0 +1,22 @@
+from dataclasses import dataclass
+from datetime import datetime
+
+from app.repositories.base import Record, Repository
+
+
+@dataclass(slots=True)
+class Container(Record):
+    serial: str | None = None
+    state: str | None = None
+    attributes: dict | None = None
+    assignedHouseholdId: str | None = None
+    qrVersion: int | None = None
+    createdAt: datetime | None = None
+    updatedAt: datetime | None = None
+    version: int | None = None
+    history: dict | None = None
+
+
+class ContainerRepository(Repository):
+    collection = "containers"
+    record = Container
@@ -0,0 +1,30 @@
+from dataclasses import dataclass
+from datetime import datetime
+
+from app.repositories.base import Record, Repository
+
+
+@dataclass(slots=True)
+class Deployment(Record):
+    type: str | None = None
+    status: str | None = None
+    householdId: str | None = None
+    assignedTo: str | None = None
+    performedAt: datetime | None = None
+    performedBy: str | None = None
+    createdAt: datetime | None = None
+    updatedAt: datetime | None = None
+    version: int | None = None
+    installedContainerId: str | None = None
+    removedContainerId: str | None = None
+    notes: str | None = None
+
+
+# Fields shown in deployment list views (DeploymentListOut)
+LIST_FIELDS = ("type", "status", "householdId", "assignedTo", "performedAt", "createdAt",
+               "installedContainerId", "removedContainerId", "version")
+
+
+class DeploymentRepository(Repository):
+    collection = "deployments"
+    record = Deployment
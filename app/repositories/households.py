@@ -0,0 +1,28 @@
+from dataclasses import dataclass
+from datetime import datetime
+
+from app.repositories.base import Record, Repository
+
+
+@dataclass(slots=True)
+class Household(Record):
+    villaNumber: str | None = None
+    community: str | None = None
+    addressText: str | None = None
+    location: dict | None = None
+    primaryContact: dict | None = None
+    status: str | None = None
+    createdAt: datetime | None = None
+    updatedAt: datetime | None = None
+    version: int | None = None
+    currentContainerId: str | None = None
+    previousContainerIds: list | None = None
+
+
+# Fields shown in household list views (HouseholdListOut)
+LIST_FIELDS = ("villaNumber", "community", "addressText", "status", "currentContainerId")
+
+
+class HouseholdRepository(Repository):
+    collection = "households"
+    record = Household
@@ -0,0 +1,31 @@
+from dataclasses import dataclass
+from datetime import datetime
+
+from app.repositories.base import Record, Repository
+
+
+@dataclass(slots=True)
+class Signup(Record):
+    fullName: str | None = None
+    phone: str | None = None
+    email: str | None = None
+    addressText: str | None = None
+    villaNumber: str | None = None
+    community: str | None = None
+    location: dict | None = None
+    status: str | None = None
+    createdAt: datetime | None = None
+    updatedAt: datetime | None = None
+    dedupeKey: str | None = None
+    linkedHouseholdId: str | None = None
+    source: str | None = None
+
+
+# Fields shown in signup list views (SignupListOut)
+LIST_FIELDS = ("fullName", "phone", "email", "addressText", "villaNumber", "community",
+               "location", "status", "createdAt")
+
+
+class SignupRepository(Repository):
+    collection = "signups"
+    record = Signup
@@ -0,0 +1,41 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from app.core import metrics
+from app.core.config import settings
+from app.middleware.auth import API_KEY
+from app.services import profiler
+
+router = APIRouter()
+
+
+@router.get("/admin/metrics")
+async def admin_metrics():
+    return metrics.snapshot()
+
+
+@router.get("/admin/profile")
+async def admin_profile(
+    seconds: float = Query(10, gt=0),
+    intervalMs: float | None = Query(None, ge=1, description="defaults to PROFILER_INTERVAL_MS"),
+    format: str = Query("json", pattern="^(json|collapsed)$"),
+):
+    """
+    Sample the worker serving this call for `seconds` and return collapsed stacks of the
+    event loop and executor threads plus an asyncio task dump. format=collapsed returns
+    just the stacks as text, ready for flamegraph.pl or speedscope.
+    """
+    if not settings.PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiler disabled")
+    # Stack contents are internal; never serve them on an open deployment
+    if not (settings.API_KEY or API_KEY):
+        raise HTTPException(status_code=403, detail="Profiler requires API_KEY")
+    if seconds > settings.PROFILER_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be <= {settings.PROFILER_MAX_SECONDS:g}")
+    try:
+        result = await profiler.profile(seconds, intervalMs or settings.PROFILER_INTERVAL_MS)
+    except profiler.ProfilerBusy:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    if format == "collapsed":
+        return PlainTextResponse(result["collapsed"] + "\n")
+    return result
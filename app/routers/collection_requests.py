@@ -1,10 +1,23 @@
-from datetime import datetime, timezone
-from fastapi import APIRouter, HTTPException, Query
-from pydantic import BaseModel
+import asyncio
+import json
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from pymongo import ReturnDocument
 from typing import List, Literal
+from app.core.config import settings
 from app.dependencies.db import get_db
-from app.services.qr import verify_action
+from app.repositories.collection_requests import LIST_FIELDS as REQUEST_LIST_FIELDS, CollectionRequestRepository, denormalized
+from app.repositories.containers import ContainerRepository
+from app.repositories.households import HouseholdRepository
+from app.services import counts, timeline
+from app.services.dispatch import claim_requests, renew_lease
+from app.services.expand import embed, parse_expand
+from app.services.events import ensure_feed, get_broker, request_event_payload
+from app.services.qr import consume_action, release_action, verify_action
+from app.utils import versions
 from app.utils.ids import new_id
+from app.utils.time import to_iso, utcnow
 
 router = APIRouter()
 
@@ -32,18 +45,25 @@ async def create_collection_request(payload: RequestCreate, sig: str = Query(...
             status_code=401, detail="Invalid or expired QR signature")
 
     db = get_db()
-    container = await db.containers.find_one({"_id": payload.containerId})
-    if not container or container.get("assignedHouseholdId") != payload.householdId:
+    container, household = await asyncio.gather(
+        ContainerRepository(db).get(payload.containerId), HouseholdRepository(db).get(payload.householdId))
+    if not container or container.assignedHouseholdId != payload.householdId:
         raise HTTPException(
             status_code=400, detail="Container not assigned to household")
+    # Each signed token creates at most one request
+    if await consume_action(db, payload.containerId, sig) is not None:
+        raise HTTPException(
+            status_code=401, detail="Invalid or expired QR signature")
 
-    now = datetime.now(timezone.utc).isoformat()
+    now = utcnow()
     req_id = new_id("req")
     doc = {
         "_id": req_id,
         "householdId": payload.householdId,
         "containerId": payload.containerId,
         "requestedAt": now,
+        "updatedAt": now,
+        "version": 1,
         "requestSource": "container_qr",
         "status": "requested",
         "geoAtRequest": (
@@ -51,8 +71,17 @@ async def create_collection_request(payload: RequestCreate, sig: str = Query(...
                 "longitude": payload.geoAtRequest.longitude}
             if payload.geoAtRequest else None
         ),
+        **denormalized(household, container),
     }
-    await db.collection_requests.insert_one(doc)
+    try:
+        await db.insert("collection_requests", doc)
+    except Exception:
+        # Nothing was created: leave the resident's token usable for a retry
+        await release_action(db, payload.containerId, sig)
+        raise
+    await counts.bump(db, "collection_requests", {"requested": 1})
+    await timeline.append(db, timeline.request_events(doc))
+    get_broker().publish_local("created", request_event_payload(doc))
     return {"id": req_id, "status": "requested"}
 
 
@@ -63,17 +92,32 @@ class RequestListOut(BaseModel):
     status: str
     requestedAt: str
     assignedTo: str | None = None
+    community: str | None = None
+    villaNumber: str | None = None
+    containerSerial: str | None = None
+    version: int | None = None
+    # Present only when requested via expand=
+    household: dict | None = None
+    container: dict | None = None
 
 
-@router.get("/collection-requests", response_model=List[RequestListOut])
+@router.get("/collection-requests", response_model=List[RequestListOut], response_model_exclude_unset=True)
 async def list_collection_requests(
+    response: Response,
     status: Literal["requested", "completed", "any"] = Query("any"),
     householdId: str | None = None,
     assignedTo: str | None = None,
+    community: str | None = None,
     limit: int = 50,
     sortBy: Literal["requestedAt", "status", "householdId"] = "requestedAt",
-    sortDir: Literal["asc", "desc"] = "desc"
+    sortDir: Literal["asc", "desc"] = "desc",
+    expand: str | None = Query(None, description="household,container"),
+    count: bool = Query(False, description="Set X-Total-Count with the total number of matches"),
 ):
+    try:
+        expand_set = parse_expand(expand)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     db = get_db()
     q = {}
     if status != "any":
@@ -82,20 +126,16 @@ async def list_collection_requests(
         q["householdId"] = householdId
     if assignedTo:
         q["assignedTo"] = assignedTo
+    if community:
+        q["community"] = community
     sort_field = sortBy
     sort_direction = -1 if sortDir == "desc" else 1
-    cur = db.collection_requests.find(q).sort(sort_field, sort_direction).limit(min(limit, 200))
-    results: List[RequestListOut] = []
-    async for d in cur:
-        results.append(RequestListOut(
-            id=d["_id"],
-            householdId=d.get("householdId"),
-            containerId=d.get("containerId"),
-            status=d.get("status"),
-            requestedAt=d.get("requestedAt"),
-            assignedTo=d.get("assignedTo"),
-        ))
-    return results
+    rows = await counts.with_total(db, "collection_requests", q, CollectionRequestRepository(db).find(
+        q, sort=[(sort_field, sort_direction)], limit=min(limit, 200), names=REQUEST_LIST_FIELDS), response, count)
+    return await embed(db, [r.to_api(REQUEST_LIST_FIELDS) for r in rows], expand_set, {
+        "household": (("householdId", "household"),),
+        "container": (("containerId", "container"),),
+    })
 
 
 @router.get("/collection-requests/check-pending")
@@ -109,17 +149,142 @@ async def check_pending(containerId: str = Query(...), householdId: str = Query(
     return {"pending": bool(exists)}
 
 
+def _sse(event_id: str, kind: str, data: dict) -> str:
+    return f"id: {event_id}\nevent: {kind}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.get("/collection-requests/stream")
+async def stream_collection_requests(
+    request: Request,
+    status: Literal["requested", "completed", "cancelled", "any"] = Query("any"),
+    assignedTo: str | None = None,
+    lastEventId: str | None = None,
+):
+    """
+    Server-Sent Events feed of request creations ("created"), assignments ("assigned")
+    and status changes ("status"). Reconnect with the Last-Event-ID header (or the
+    lastEventId query param) to receive only missed events; a "reset" event means the
+    token is no longer replayable and the client should refetch the list once.
+    """
+    db = get_db()
+    ensure_feed(db)
+    broker = get_broker()
+    q, backlog, reset = broker.subscribe(request.headers.get("last-event-id") or lastEventId)
+
+    def wanted(data: dict) -> bool:
+        if status != "any" and data.get("status") != status:
+            return False
+        if assignedTo and data.get("assignedTo") != assignedTo:
+            return False
+        return True
+
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+            if reset:
+                yield _sse(broker.current_token(), "reset", {})
+            for item in backlog:
+                event_id, kind, data = broker.format(item)
+                if wanted(data):
+                    yield _sse(event_id, kind, data)
+            while True:
+                try:
+                    item = await asyncio.wait_for(q.get(), timeout=settings.EVENTS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                event_id, kind, data = broker.format(item)
+                if wanted(data):
+                    yield _sse(event_id, kind, data)
+                if q.empty() and not broker.is_subscribed(q):
+                    # Dropped as a slow consumer; the client resumes from its last id.
+                    return
+        finally:
+            broker.unsubscribe(q)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+class ClaimIn(BaseModel):
+    driverId: str
+    limit: int = Field(1, ge=1)
+    near: GeoPoint | None = None
+
+
+class ClaimedOut(BaseModel):
+    id: str
+    householdId: str
+    containerId: str
+    requestedAt: str
+    leaseExpiresAt: str
+    geoAtRequest: GeoPoint | None = None
+    distanceKm: float | None = None
+
+
+def _claimed_out(doc: dict) -> dict:
+    return {
+        "id": doc["_id"],
+        "householdId": doc.get("householdId"),
+        "containerId": doc.get("containerId"),
+        "requestedAt": to_iso(doc.get("requestedAt")),
+        "leaseExpiresAt": to_iso(doc.get("leaseExpiresAt")),
+        "geoAtRequest": doc.get("geoAtRequest"),
+        "distanceKm": doc.get("distanceKm"),
+    }
+
+
+@router.post("/collection-requests/claim", response_model=List[ClaimedOut])
+async def claim_collection_requests(payload: ClaimIn):
+    """
+    Atomically assign up to `limit` open requests to a driver, oldest first or nearest
+    to `near`. Claims hold a lease; unless the driver completes the request or renews
+    the lease it returns to the pool when the lease expires.
+    """
+    db = get_db()
+    near = payload.near.model_dump() if payload.near else None
+    docs = await claim_requests(db, payload.driverId, min(payload.limit, settings.CLAIM_MAX_BATCH), near)
+    return [_claimed_out(d) for d in docs]
+
+
+class LeaseRenewIn(BaseModel):
+    driverId: str
+
+
+@router.post("/collection-requests/{request_id}/lease", response_model=ClaimedOut)
+async def renew_collection_request_lease(request_id: str, payload: LeaseRenewIn):
+    db = get_db()
+    doc = await renew_lease(db, request_id, payload.driverId)
+    if doc is None:
+        raise HTTPException(status_code=409, detail="Lease not held by this driver or already expired")
+    return _claimed_out(doc)
+
+
 class AssignIn(BaseModel):
     assignedTo: str
 
 
 @router.patch("/collection-requests/{request_id}/assign")
-async def assign_request(request_id: str, payload: AssignIn):
+async def assign_request(request_id: str, payload: AssignIn, response: Response, if_match: str | None = Header(None)):
+    expected = versions.expected(if_match)
     db = get_db()
-    res = await db.collection_requests.update_one({"_id": request_id}, {"$set": {"assignedTo": payload.assignedTo}})
-    if res.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Request not found")
-    return {"ok": True}
+    q = {"_id": request_id} if expected is None else {"_id": request_id, **versions.match(expected)}
+    doc = await db.collection_requests.find_one_and_update(
+        # A manual assignment is firm: drop any claim lease
+        q, {"$set": {"assignedTo": payload.assignedTo, "updatedAt": utcnow()},
+            "$unset": {"leaseExpiresAt": ""}, "$inc": {"version": 1}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if doc is None:
+        raise await versions.cas_failure(db.collection_requests, request_id, expected, "Request not found")
+    get_broker().publish_local("assigned", request_event_payload(doc))
+    response.headers["ETag"] = versions.etag(doc["version"])
+    return {"ok": True, "version": doc["version"]}
 
 
 class StatusUpdateIn(BaseModel):
@@ -129,14 +294,26 @@ class StatusUpdateIn(BaseModel):
 
 
 @router.patch("/collection-requests/{request_id}/status")
-async def update_request_status(request_id: str, payload: StatusUpdateIn):
+async def update_request_status(
+    request_id: str, payload: StatusUpdateIn, response: Response, if_match: str | None = Header(None),
+):
+    expected = versions.expected(if_match)
     db = get_db()
-    res = await db.collection_requests.update_one(
-        {"_id": request_id}, {"$set": {"status": payload.status, "updateNote": payload.note, "updatedBy": payload.updatedBy}}
-    )
-    if res.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Request not found")
-    return {"ok": True}
+    now = utcnow()
+    changes = {"status": payload.status, "updateNote": payload.note, "updatedBy": payload.updatedBy,
+               "updatedAt": now}
+    q = {"_id": request_id} if expected is None else {"_id": request_id, **versions.match(expected)}
+    # Read the previous status with the update (per-status counters), then apply the change locally
+    before = await db.collection_requests.find_one_and_update(q, {"$set": changes, "$inc": {"version": 1}})
+    if before is None:
+        raise await versions.cas_failure(db.collection_requests, request_id, expected, "Request not found")
+    version = versions.current(before) + 1
+    doc = {**before, **changes, "version": version}
+    await counts.bump(db, "collection_requests", counts.status_delta(before.get("status"), payload.status))
+    await timeline.append(db, timeline.status_events(doc, payload.status, now, payload.updatedBy, version))
+    get_broker().publish_local("status", request_event_payload(doc))
+    response.headers["ETag"] = versions.etag(version)
+    return {"ok": True, "version": version}
 
 
 class ManualStartIn(BaseModel):
@@ -149,16 +326,19 @@ class ManualStartIn(BaseModel):
 @router.post("/collections/start-manual", response_model=RequestOut)
 async def start_manual_collection(payload: ManualStartIn):
     db = get_db()
-    container = await db.containers.find_one({"_id": payload.containerId})
-    if not container or container.get("assignedHouseholdId") != payload.householdId:
+    container, household = await asyncio.gather(
+        ContainerRepository(db).get(payload.containerId), HouseholdRepository(db).get(payload.householdId))
+    if not container or container.assignedHouseholdId != payload.householdId:
         raise HTTPException(status_code=400, detail="Container not assigned to household")
-    now = datetime.now(timezone.utc).isoformat()
+    now = utcnow()
     req_id = new_id("req")
     doc = {
         "_id": req_id,
         "householdId": payload.householdId,
         "containerId": payload.containerId,
         "requestedAt": now,
+        "updatedAt": now,
+        "version": 1,
         "requestSource": "manual",
         "requestedBy": payload.requestedBy,
         "status": "requested",
@@ -167,6 +347,15 @@ async def start_manual_collection(payload: ManualStartIn):
                 "longitude": payload.geoAtRequest.longitude}
             if payload.geoAtRequest else None
         ),
+        **denormalized(household, container),
     }
-    await db.collection_requests.insert_one(doc)
+    try:
+        await db.insert("collection_requests", doc)
+    except Exception:
+        # Nothing was created: leave the resident's token usable for a retry
+        await release_action(db, payload.containerId, sig)
+        raise
+    await counts.bump(db, "collection_requests", {"requested": 1})
+    await timeline.append(db, timeline.request_events(doc))
+    get_broker().publish_local("created", request_event_payload(doc))
     return {"id": req_id, "status": "requested"}
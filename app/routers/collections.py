@@ -1,7 +1,10 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
 from typing import List, Literal
 from app.dependencies.db import get_db
+from app.repositories.collection_requests import SUMMARY_FIELDS, CollectionRequestRepository
+from app.services.expand import embed, parse_expand
+from app.utils.time import parse_ts, to_iso, ts_range
 
 router = APIRouter()
 
@@ -16,19 +19,31 @@ class CollectionSummaryOut(BaseModel):
     weightKg: float | None = None
     performedBy: str | None = None
     assignedTo: str | None = None
+    community: str | None = None
+    villaNumber: str | None = None
+    containerSerial: str | None = None
+    # Present only when requested via expand=
+    household: dict | None = None
+    container: dict | None = None
 
 
-@router.get("/collections", response_model=List[CollectionSummaryOut])
+@router.get("/collections", response_model=List[CollectionSummaryOut], response_model_exclude_unset=True)
 async def list_collections_summary(
     status: Literal["requested", "completed", "any"] = Query("any"),
     dateFrom: str | None = None,
     dateTo: str | None = None,
     householdId: str | None = None,
     assignedTo: str | None = None,
+    community: str | None = None,
     limit: int = 100,
     sortBy: Literal["requestedAt", "status", "householdId"] = "requestedAt",
-    sortDir: Literal["asc", "desc"] = "desc"
+    sortDir: Literal["asc", "desc"] = "desc",
+    expand: str | None = Query(None, description="household,container"),
 ):
+    try:
+        expand_set = parse_expand(expand)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     db = get_db()
     q = {}
     if status != "any":
@@ -37,32 +52,41 @@ async def list_collections_summary(
         q["householdId"] = householdId
     if assignedTo:
         q["assignedTo"] = assignedTo
+    if community:
+        q["community"] = community
     
     # Date range filtering
     if dateFrom or dateTo:
-        date_filter = {}
-        if dateFrom:
-            date_filter["$gte"] = dateFrom
-        if dateTo:
-            date_filter["$lte"] = dateTo
-        q["requestedAt"] = date_filter
+        try:
+            start = parse_ts(dateFrom) if dateFrom else None
+            end = parse_ts(dateTo) if dateTo else None
+        except ValueError:
+            raise HTTPException(status_code=400, detail="dateFrom/dateTo must be ISO-8601")
+        q.update(ts_range("requestedAt", start, end))
     
     sort_field = sortBy
     sort_direction = -1 if sortDir == "desc" else 1
-    cur = db.collection_requests.find(q).sort(sort_field, sort_direction).limit(min(limit, 500))
-    
-    results: List[CollectionSummaryOut] = []
-    async for d in cur:
-        metrics = d.get("metrics") or {}
-        results.append(CollectionSummaryOut(
-            id=d["_id"],
-            householdId=d.get("householdId"),
-            containerId=d.get("containerId"),
-            requestedAt=d.get("requestedAt"),
-            status=d.get("status"),
-            volumeL=metrics.get("volumeL"),
-            weightKg=metrics.get("weightKg"),
-            performedBy=metrics.get("measuredBy"),
-            assignedTo=d.get("assignedTo"),
-        ))
-    return results
+    rows = await CollectionRequestRepository(db).find(
+        q, sort=[(sort_field, sort_direction)], limit=min(limit, 500), names=SUMMARY_FIELDS)
+
+    results = []
+    for r in rows:
+        metrics = r.metrics or {}
+        results.append({
+            "id": r.id,
+            "householdId": r.householdId,
+            "containerId": r.containerId,
+            "requestedAt": to_iso(r.requestedAt),
+            "status": r.status,
+            "volumeL": metrics.get("volumeL"),
+            "weightKg": metrics.get("weightKg"),
+            "performedBy": metrics.get("measuredBy"),
+            "assignedTo": r.assignedTo,
+            "community": r.community,
+            "villaNumber": r.villaNumber,
+            "containerSerial": r.containerSerial,
+        })
+    return await embed(db, results, expand_set, {
+        "household": (("householdId", "household"),),
+        "container": (("containerId", "container"),),
+    })
@@ -1,8 +1,13 @@
-from fastapi import APIRouter, HTTPException, Query
-from pydantic import BaseModel
-from datetime import datetime, timezone
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from app.dependencies.db import get_db
+from app.repositories.containers import ContainerRepository
+from app.services import archive, timeline
+from app.services.bulk_import import Importer, detect_format
+from app.services.qr import sign_action
 from app.utils.ids import new_id
+from app.utils.time import parse_ts, utcnow
 from typing import List, Literal
 
 router = APIRouter()
@@ -14,29 +19,74 @@ class ContainerCreate(BaseModel):
     type: str | None = "wheelieBin"
 
 
-@router.post("/containers")
-async def create_container(payload: ContainerCreate):
-    db = get_db()
-    now = datetime.now(timezone.utc).isoformat()
-    cid = new_id("container")
-    doc = {
-        "_id": cid, "serial": payload.serial, "state": "new",
+def _container_doc(payload: ContainerCreate, now) -> dict:
+    return {
+        "_id": new_id("container"), "serial": payload.serial, "state": "new",
         "attributes": {"capacityL": payload.capacityL, "type": payload.type},
-        "assignedHouseholdId": None, "qrVersion": 1, "createdAt": now,
+        "assignedHouseholdId": None, "qrVersion": 1, "createdAt": now, "updatedAt": now, "version": 1,
         "history": {}
     }
+
+
+@router.post("/containers")
+async def create_container(payload: ContainerCreate):
+    db = get_db()
+    doc = _container_doc(payload, utcnow())
     await db.containers.insert_one(doc)
-    return {"id": cid}
+    return {"id": doc["_id"]}
+
+
+@router.post("/containers:import")
+async def import_containers(
+    request: Request,
+    format: Literal["ndjson", "csv"] | None = None,
+    signQr: bool = False,
+):
+    """
+    Register containers in bulk from an NDJSON or CSV body (columns: serial, capacityL,
+    type), read incrementally and inserted in chunks. Once the body is imported, responds
+    with one NDJSON line per row and a final summary line; with signQr=true each created container carries a fresh `sig`.
+    """
+    db = get_db()
+    now = utcnow()
+    importer = Importer(
+        db.containers, ContainerCreate,
+        build=lambda item: _container_doc(item, now),
+        result=(lambda doc: {"serial": doc["serial"], "sig": sign_action(doc["_id"])}) if signQr
+        else (lambda doc: {"serial": doc["serial"]}),
+    )
+    await importer.run(request.stream(), detect_format(request.headers.get("content-type"), format))
+    summary = importer.summary()
+    return StreamingResponse(
+        importer.stream_results(),
+        media_type="application/x-ndjson",
+        headers={"X-Import-Created": str(summary["created"]), "X-Import-Errors": str(summary["errors"])},
+    )
+
+
+class BatchGetIn(BaseModel):
+    ids: List[str] = Field(..., max_length=500)
+
+
+@router.post("/containers:batchGet")
+async def batch_get_containers(payload: BatchGetIn):
+    """Containers by id in one `$in` query; ids that do not exist are listed in `missing`."""
+    db = get_db()
+    found = await ContainerRepository(db).get_many(payload.ids)
+    ids = list(dict.fromkeys(payload.ids))
+    return {
+        "items": [found[i].to_api() for i in ids if i in found],
+        "missing": [i for i in ids if i not in found],
+    }
 
 
 @router.get("/containers/{container_id}")
 async def get_container(container_id: str):
     db = get_db()
-    c = await db.containers.find_one({"_id": container_id})
+    c = await ContainerRepository(db).get(container_id)
     if not c:
         raise HTTPException(status_code=404, detail="Not found")
-    c["id"] = c.pop("_id")
-    return c
+    return c.to_api()
 
 
 @router.get("/containers")
@@ -52,19 +102,27 @@ async def list_containers(
         q["assignedHouseholdId"] = None
     sort_field = sortBy
     sort_direction = -1 if sortDir == "desc" else 1
-    cur = db.containers.find(q).sort(sort_field, sort_direction).limit(min(limit, 200))
-    return [{"id": d["_id"], **{k: v for k, v in d.items() if k != "_id"}} async for d in cur]
+    # This list returns whole documents, so there is nothing to project away
+    rows = await ContainerRepository(db).find(
+        q, sort=[(sort_field, sort_direction)], limit=min(limit, 200), full=True)
+    return [r.to_api() for r in rows]
 
 
 @router.get("/containers/{container_id}/history")
-async def get_container_history(container_id: str):
+async def get_container_history(container_id: str, dateFrom: str | None = None):
+    """Full history, or from `dateFrom` on; archived rows are only read when the range reaches them."""
     db = get_db()
-    container = await db.containers.find_one({"_id": container_id})
+    container = await ContainerRepository(db).get(container_id)
     if not container:
         raise HTTPException(status_code=404, detail="Container not found")
+    try:
+        since = parse_ts(dateFrom) if dateFrom else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="dateFrom must be ISO-8601")
+    span = {"since": since, "not_before": container.createdAt}
 
     # Container assignment history
-    assn_cur = db.container_assignments.find({"containerId": container_id}).sort("assignedAt", 1)
+    assn_rows = await archive.find_history(db, "container_assignments", {"containerId": container_id}, **span)
     assignments = [
         {
             "householdId": d.get("householdId"),
@@ -74,16 +132,16 @@ async def get_container_history(container_id: str):
             "assignmentReason": d.get("assignmentReason"),
             "unassignmentReason": d.get("unassignmentReason"),
         }
-        async for d in assn_cur
+        for d in assn_rows
     ]
 
     # Deployments involving this container
-    dep_cur = db.deployments.find({
+    dep_rows = await archive.find_history(db, "deployments", {
         "$or": [
             {"installedContainerId": container_id},
             {"removedContainerId": container_id}
         ]
-    }).sort("performedAt", 1)
+    }, **span)
     deployments = [
         {
             "type": d.get("type"),
@@ -93,11 +151,11 @@ async def get_container_history(container_id: str):
             "installedContainerId": d.get("installedContainerId"),
             "removedContainerId": d.get("removedContainerId"),
         }
-        async for d in dep_cur
+        for d in dep_rows
     ]
 
     # Collection requests involving this container
-    req_cur = db.collection_requests.find({"containerId": container_id}).sort("requestedAt", 1)
+    req_rows = await archive.find_history(db, "collection_requests", {"containerId": container_id}, **span)
     collections = [
         {
             "requestId": d.get("_id"),
@@ -108,17 +166,33 @@ async def get_container_history(container_id: str):
             "metrics": d.get("metrics"),
             "swap": d.get("swap"),
         }
-        async for d in req_cur
+        for d in req_rows
     ]
 
     return {
         "container": {
-            "id": container["_id"],
-            "serial": container.get("serial"),
-            "currentHouseholdId": container.get("assignedHouseholdId"),
-            "state": container.get("state"),
+            "id": container.id,
+            "serial": container.serial,
+            "currentHouseholdId": container.assignedHouseholdId,
+            "state": container.state,
         },
         "assignments": assignments,
         "deployments": deployments,
         "collections": collections,
     }
+
+
+@router.get("/containers/{container_id}/timeline")
+async def get_container_timeline(
+    container_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: str | None = None,
+    order: Literal["asc", "desc"] = "desc",
+):
+    """Deployments, swaps and collection events for this container from `entity_events`, paged by `cursor`."""
+    db = get_db()
+    try:
+        items, next_cursor = await timeline.read(db, container_id, limit, cursor, newest_first=order == "desc")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"items": items, "nextCursor": next_cursor}
@@ -1,9 +1,17 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Query, Response
 from pydantic import BaseModel
-from datetime import datetime, timezone
+from pymongo import ReturnDocument
+from app.core.config import settings
 from app.dependencies.db import get_db
-from app.services.swap import perform_swap
+from app.repositories.containers import ContainerRepository
+from app.repositories.deployments import LIST_FIELDS as DEPLOYMENT_LIST_FIELDS, DeploymentRepository
+from app.repositories.households import HouseholdRepository
+from app.services import outbox, timeline
+from app.services.expand import embed, parse_expand
+from app.services.swap import SwapFailed, perform_swap, perform_swaps
+from app.utils import versions
 from app.utils.ids import new_id
+from app.utils.time import utcnow
 from typing import List, Literal
 
 router = APIRouter()
@@ -24,10 +32,31 @@ async def swap_endpoint(payload: SwapIn):
     try:
         result = await perform_swap(payload.model_dump())
         return {"ok": True, "deploymentId": result["deploymentId"]}
-    except Exception as e:
+    except versions.VersionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except SwapFailed as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+class SwapBatchIn(BaseModel):
+    swaps: List[SwapIn]
+
+
+@router.post("/deployments/swap/batch")
+async def swap_batch_endpoint(payload: SwapBatchIn):
+    """
+    Submit a driver's queued swaps in one call, applied in order. Each swap gets its own
+    result; a failed swap does not stop the others.
+    """
+    if len(payload.swaps) > settings.SWAP_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {settings.SWAP_BATCH_MAX} swaps per call")
+    results = await perform_swaps([s.model_dump() for s in payload.swaps])
+    applied = sum(1 for r in results if r["ok"])
+    return {"applied": applied, "failed": len(results) - applied, "results": results}
+
+
 class DeploymentPerformIn(BaseModel):
     householdId: str
     containerId: str
@@ -37,32 +66,46 @@ class DeploymentPerformIn(BaseModel):
 @router.post("/deployments/perform")
 async def perform_deployment(payload: DeploymentPerformIn):
     db = get_db()
-    now = datetime.now(timezone.utc).isoformat()
+    now = utcnow()
 
-    household = await db.households.find_one({"_id": payload.householdId})
+    household = await HouseholdRepository(db).get(payload.householdId)
     if not household:
         raise HTTPException(status_code=404, detail="Household not found")
 
-    container = await db.containers.find_one({"_id": payload.containerId})
+    container = await ContainerRepository(db).get(payload.containerId)
     if not container:
         raise HTTPException(status_code=404, detail="Container not found")
-    if container.get("assignedHouseholdId"):
+    if container.assignedHouseholdId:
         raise HTTPException(status_code=400, detail="Container already assigned")
 
-    # Assign container to household
-    await db.containers.update_one(
-        {"_id": payload.containerId},
-        {"$set": {"assignedHouseholdId": payload.householdId, "history.lastAssignedAt": now}},
+    # Assign container to household; compare-and-set on what was just validated
+    res = await db.containers.update_one(
+        {"_id": payload.containerId, "assignedHouseholdId": None, **versions.match(versions.current(container))},
+        {"$set": {"assignedHouseholdId": payload.householdId, "history.lastAssignedAt": now, "updatedAt": now},
+         "$inc": {"version": 1}},
     )
+    if res.matched_count == 0:
+        raise HTTPException(status_code=409, detail="Container was modified concurrently")
 
-    await db.households.update_one(
-        {"_id": payload.householdId},
-        {"$set": {"currentContainerId": payload.containerId, "lastDeploymentAt": now}},
+    res = await db.households.update_one(
+        {"_id": payload.householdId, **versions.match(versions.current(household))},
+        {"$set": {"currentContainerId": payload.containerId, "lastDeploymentAt": now, "updatedAt": now},
+         "$inc": {"version": 1}},
     )
+    if res.matched_count == 0:
+        # Give the container back before reporting the conflict
+        await db.containers.update_one(
+            {"_id": payload.containerId, **versions.match(versions.current(container) + 1)},
+            {"$set": {"assignedHouseholdId": None,
+                      "history.lastAssignedAt": (container.history or {}).get("lastAssignedAt"),
+                      "updatedAt": now},
+             "$inc": {"version": 1}},
+        )
+        raise HTTPException(status_code=409, detail="Household was modified concurrently")
 
     # Open a container assignment ledger record
     await db.container_assignments.insert_one({
-        "_id": f"assn_{payload.containerId}_{now}",
+        "_id": f"assn_{payload.containerId}_{now.isoformat()}",
         "containerId": payload.containerId,
         "householdId": payload.householdId,
         "assignedAt": now,
@@ -73,20 +116,22 @@ async def perform_deployment(payload: DeploymentPerformIn):
 
     # Deployment record
     dep_id = new_id("dep")
-    await db.deployments.insert_one({
+    dep_doc = {
         "_id": dep_id,
         "type": "deployment",
         "performedAt": now,
         "performedBy": payload.performedBy,
         "householdId": payload.householdId,
         "installedContainerId": payload.containerId,
-    })
+        "updatedAt": now,
+        "version": 1,
+    }
+    await db.deployments.insert_one(dep_doc)
+    await timeline.append(db, timeline.deployment_events(dep_doc))
 
     # If there is a signup linked to this household in awaiting_deployment, activate it
-    await db.signups.update_many(
-        {"linkedHouseholdId": payload.householdId, "status": "awaiting_deployment"},
-        {"$set": {"status": "active", "updatedAt": now}},
-    )
+    # (applied by the outbox worker after we return)
+    await outbox.enqueue(db, "signups.activate", {"householdId": payload.householdId, "at": now})
 
     return {"ok": True, "deploymentId": dep_id}
 
@@ -100,9 +145,9 @@ class DeploymentAssignIn(BaseModel):
 @router.post("/deployments/assign")
 async def create_deployment_assignment(payload: DeploymentAssignIn):
     db = get_db()
-    now = datetime.now(timezone.utc).isoformat()
+    now = utcnow()
     # Ensure household exists
-    h = await db.households.find_one({"_id": payload.householdId})
+    h = await HouseholdRepository(db).get(payload.householdId)
     if not h:
         raise HTTPException(status_code=404, detail="Household not found")
     dep_id = new_id("dep_task")
@@ -113,6 +158,8 @@ async def create_deployment_assignment(payload: DeploymentAssignIn):
         "assignedTo": payload.assignedTo,
         "householdId": payload.householdId,
         "createdAt": now,
+        "updatedAt": now,
+        "version": 1,
         "notes": payload.notes,
     }
     await db.deployments.insert_one(doc)
@@ -127,17 +174,29 @@ class DeploymentListOut(BaseModel):
     assignedTo: str | None = None
     performedAt: str | None = None
     createdAt: str | None = None
+    installedContainerId: str | None = None
+    removedContainerId: str | None = None
+    version: int | None = None
+    # Present only when requested via expand=
+    household: dict | None = None
+    installedContainer: dict | None = None
+    removedContainer: dict | None = None
 
 
-@router.get("/deployments", response_model=List[DeploymentListOut])
+@router.get("/deployments", response_model=List[DeploymentListOut], response_model_exclude_unset=True)
 async def list_deployments(
     assignedTo: str | None = None,
     status: Literal["assigned", "in_progress", "completed", "any"] = "any",
     type: Literal["deployment", "swap", "deployment_task", "any"] = "any",
     limit: int = 100,
     sortBy: Literal["performedAt", "createdAt", "type", "status"] = "performedAt",
-    sortDir: Literal["asc", "desc"] = "desc"
+    sortDir: Literal["asc", "desc"] = "desc",
+    expand: str | None = Query(None, description="household,container"),
 ):
+    try:
+        expand_set = parse_expand(expand)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     db = get_db()
     q: dict = {}
     if assignedTo:
@@ -148,15 +207,12 @@ async def list_deployments(
         q["type"] = type
     sort_field = sortBy
     sort_direction = -1 if sortDir == "desc" else 1
-    cur = db.deployments.find(q).sort(sort_field, sort_direction).limit(min(limit, 200))
-    results: List[DeploymentListOut] = []
-    async for d in cur:
-        results.append(DeploymentListOut(
-            id=d["_id"], type=d.get("type"), status=d.get("status"),
-            householdId=d.get("householdId"), assignedTo=d.get("assignedTo"),
-            performedAt=d.get("performedAt"), createdAt=d.get("createdAt"),
-        ))
-    return results
+    rows = await DeploymentRepository(db).find(
+        q, sort=[(sort_field, sort_direction)], limit=min(limit, 200), names=DEPLOYMENT_LIST_FIELDS)
+    return await embed(db, [r.to_api(DEPLOYMENT_LIST_FIELDS) for r in rows], expand_set, {
+        "household": (("householdId", "household"),),
+        "container": (("installedContainerId", "installedContainer"), ("removedContainerId", "removedContainer")),
+    })
 
 
 class DeploymentAssignUpdateIn(BaseModel):
@@ -164,12 +220,10 @@ class DeploymentAssignUpdateIn(BaseModel):
 
 
 @router.patch("/deployments/{deployment_id}/assign")
-async def update_deployment_assignment(deployment_id: str, payload: DeploymentAssignUpdateIn):
-    db = get_db()
-    res = await db.deployments.update_one({"_id": deployment_id}, {"$set": {"assignedTo": payload.assignedTo}})
-    if res.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Deployment not found")
-    return {"ok": True}
+async def update_deployment_assignment(
+    deployment_id: str, payload: DeploymentAssignUpdateIn, response: Response, if_match: str | None = Header(None),
+):
+    return await _update_deployment(deployment_id, {"assignedTo": payload.assignedTo}, response, if_match)
 
 
 class DeploymentStatusUpdateIn(BaseModel):
@@ -177,9 +231,21 @@ class DeploymentStatusUpdateIn(BaseModel):
 
 
 @router.patch("/deployments/{deployment_id}/status")
-async def update_deployment_status(deployment_id: str, payload: DeploymentStatusUpdateIn):
+async def update_deployment_status(
+    deployment_id: str, payload: DeploymentStatusUpdateIn, response: Response, if_match: str | None = Header(None),
+):
+    return await _update_deployment(deployment_id, {"status": payload.status}, response, if_match)
+
+
+async def _update_deployment(deployment_id: str, changes: dict, response: Response, if_match: str | None) -> dict:
+    expected = versions.expected(if_match)
     db = get_db()
-    res = await db.deployments.update_one({"_id": deployment_id}, {"$set": {"status": payload.status}})
-    if res.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Deployment not found")
-    return {"ok": True}
+    q = {"_id": deployment_id} if expected is None else {"_id": deployment_id, **versions.match(expected)}
+    doc = await db.deployments.find_one_and_update(
+        q, {"$set": {**changes, "updatedAt": utcnow()}, "$inc": {"version": 1}},
+        projection={"version": 1}, return_document=ReturnDocument.AFTER,
+    )
+    if doc is None:
+        raise await versions.cas_failure(db.deployments, deployment_id, expected, "Deployment not found")
+    response.headers["ETag"] = versions.etag(doc["version"])
+    return {"ok": True, "version": doc["version"]}
@@ -1,7 +1,17 @@
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.dependencies.db import get_db
+from app.services import readiness
 router = APIRouter()
 
 
 @router.get("/health")
 async def health():
     return {"ok": True}
+
+
+@router.get("/ready")
+async def ready():
+    # Served from the cached background ping so probes never queue behind Mongo
+    is_ready, body = readiness.status(get_db())
+    return JSONResponse(body, status_code=200 if is_ready else 503)
@@ -1,9 +1,13 @@
-from fastapi import APIRouter, HTTPException, Query
-from pydantic import BaseModel, EmailStr
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, EmailStr, Field, model_validator
 from typing import List, Literal
-from datetime import datetime, timezone
 from app.dependencies.db import get_db
+from app.repositories.households import LIST_FIELDS as HOUSEHOLD_LIST_FIELDS, HouseholdRepository
+from app.services import archive, counts, search, timeline
+from app.services.bulk_import import Importer, detect_format
 from app.utils.ids import new_id
+from app.utils.time import parse_ts, utcnow
 
 router = APIRouter()
 
@@ -23,13 +27,9 @@ class HouseholdCreate(BaseModel):
     primaryContact: Contact
 
 
-@router.post("/households")
-async def create_household(payload: HouseholdCreate):
-    db = get_db()
-    now = datetime.now(timezone.utc).isoformat()
-    hid = new_id("hh")
-    doc = {
-        "_id": hid,
+def _household_doc(payload: HouseholdCreate, now) -> dict:
+    return search.with_search_keys("households", {
+        "_id": new_id("hh"),
         "villaNumber": payload.villaNumber,
         "community": payload.community,
         "addressText": payload.addressText,
@@ -38,21 +38,83 @@ async def create_household(payload: HouseholdCreate):
         "status": "active",
         "createdAt": now,
         "updatedAt": now,
+        "version": 1,
         "currentContainerId": None,
         "previousContainerIds": []
-    }
+    })
+
+
+@router.post("/households")
+async def create_household(payload: HouseholdCreate):
+    db = get_db()
+    doc = _household_doc(payload, utcnow())
     await db.households.insert_one(doc)
-    return {"id": hid}
+    search.index_doc("households", doc)
+    return {"id": doc["_id"]}
+
+
+class HouseholdImportRow(HouseholdCreate):
+    @model_validator(mode="before")
+    @classmethod
+    def _flat_contact(cls, data):
+        # CSV rows carry the contact as flat fullName/phone/email columns
+        if isinstance(data, dict) and "primaryContact" not in data:
+            data = {**data, "primaryContact": {k: data.get(k) for k in ("fullName", "phone", "email")}}
+        return data
+
+
+async def _index_households(docs: list[dict]):
+    for doc in docs:
+        search.index_doc("households", doc)
+
+
+@router.post("/households:import")
+async def import_households(request: Request, format: Literal["ndjson", "csv"] | None = None):
+    """
+    Import households in bulk from an NDJSON body (same fields as POST /households) or
+    CSV (villaNumber, community, addressText, latitude, longitude, fullName, phone,
+    email), read incrementally and inserted in chunks. Once the body is imported, responds
+    with one NDJSON line per row and a final summary line.
+    """
+    db = get_db()
+    now = utcnow()
+    importer = Importer(
+        db.households, HouseholdImportRow,
+        build=lambda item: _household_doc(item, now),
+        after_insert=_index_households,
+    )
+    await importer.run(request.stream(), detect_format(request.headers.get("content-type"), format))
+    summary = importer.summary()
+    return StreamingResponse(
+        importer.stream_results(),
+        media_type="application/x-ndjson",
+        headers={"X-Import-Created": str(summary["created"]), "X-Import-Errors": str(summary["errors"])},
+    )
+
+
+class BatchGetIn(BaseModel):
+    ids: List[str] = Field(..., max_length=500)
+
+
+@router.post("/households:batchGet")
+async def batch_get_households(payload: BatchGetIn):
+    """Households by id in one `$in` query; ids that do not exist are listed in `missing`."""
+    db = get_db()
+    found = await HouseholdRepository(db).get_many(payload.ids)
+    ids = list(dict.fromkeys(payload.ids))
+    return {
+        "items": [found[i].to_api() for i in ids if i in found],
+        "missing": [i for i in ids if i not in found],
+    }
 
 
 @router.get("/households/{household_id}")
 async def get_household(household_id: str):
     db = get_db()
-    h = await db.households.find_one({"_id": household_id})
+    h = await HouseholdRepository(db).get(household_id)
     if not h:
         raise HTTPException(status_code=404, detail="Not found")
-    h["id"] = h.pop("_id")
-    return h
+    return h.to_api()
 
 
 class HouseholdListOut(BaseModel):
@@ -66,12 +128,14 @@ class HouseholdListOut(BaseModel):
 
 @router.get("/households", response_model=List[HouseholdListOut])
 async def list_households(
+    response: Response,
     community: str | None = None,
     status: str | None = None,
     hasContainer: bool | None = None,
     limit: int = Query(50, ge=1, le=200),
     sortBy: Literal["createdAt", "villaNumber", "community"] = "createdAt",
-    sortDir: Literal["asc", "desc"] = "desc"
+    sortDir: Literal["asc", "desc"] = "desc",
+    count: bool = Query(False, description="Set X-Total-Count with the total number of matches"),
 ):
     db = get_db()
     q: dict = {}
@@ -86,29 +150,26 @@ async def list_households(
 
     sort_field = sortBy
     sort_direction = -1 if sortDir == "desc" else 1
-    cur = db.households.find(q).sort(sort_field, sort_direction).limit(limit)
-    results: List[HouseholdListOut] = []
-    async for d in cur:
-        results.append(HouseholdListOut(
-            id=d["_id"],
-            villaNumber=d.get("villaNumber"),
-            community=d.get("community"),
-            addressText=d.get("addressText"),
-            status=d.get("status"),
-            currentContainerId=d.get("currentContainerId"),
-        ))
-    return results
+    rows = await counts.with_total(db, "households", q, HouseholdRepository(db).find(
+        q, sort=[(sort_field, sort_direction)], limit=limit, names=HOUSEHOLD_LIST_FIELDS), response, count)
+    return [r.to_api(HOUSEHOLD_LIST_FIELDS) for r in rows]
 
 
 @router.get("/households/{household_id}/history")
-async def get_household_history(household_id: str):
+async def get_household_history(household_id: str, dateFrom: str | None = None):
+    """Full history, or from `dateFrom` on; archived rows are only read when the range reaches them."""
     db = get_db()
-    h = await db.households.find_one({"_id": household_id})
+    h = await HouseholdRepository(db).get(household_id)
     if not h:
         raise HTTPException(status_code=404, detail="Not found")
+    try:
+        since = parse_ts(dateFrom) if dateFrom else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="dateFrom must be ISO-8601")
+    span = {"since": since, "not_before": h.createdAt}
 
     # Container assignment history
-    assn_cur = db.container_assignments.find({"householdId": household_id}).sort("assignedAt", 1)
+    assn_rows = await archive.find_history(db, "container_assignments", {"householdId": household_id}, **span)
     assignments = [
         {
             "containerId": d.get("containerId"),
@@ -116,11 +177,11 @@ async def get_household_history(household_id: str):
             "unassignedAt": d.get("unassignedAt"),
             "assignmentReason": d.get("assignmentReason"),
         }
-        async for d in assn_cur
+        for d in assn_rows
     ]
 
     # Deployments and swaps
-    dep_cur = db.deployments.find({"householdId": household_id}).sort("performedAt", 1)
+    dep_rows = await archive.find_history(db, "deployments", {"householdId": household_id}, **span)
     deployments = [
         {
             "type": d.get("type"),
@@ -129,13 +190,15 @@ async def get_household_history(household_id: str):
             "installedContainerId": d.get("installedContainerId"),
             "removedContainerId": d.get("removedContainerId"),
         }
-        async for d in dep_cur
+        for d in dep_rows
     ]
 
     # Total collected volume (from completed collection requests with metrics)
     total_volume = 0.0
-    cur = db.collection_requests.find({"householdId": household_id, "status": "completed"})
-    async for r in cur:
+    completed = await archive.find_history(
+        db, "collection_requests", {"householdId": household_id, "status": "completed"},
+        projection={"metrics": 1, "requestedAt": 1}, **span)
+    for r in completed:
         metrics = r.get("metrics") or {}
         if metrics.get("volumeL") is not None:
             try:
@@ -144,8 +207,24 @@ async def get_household_history(household_id: str):
                 pass
 
     return {
-        "household": {"id": h["_id"], "currentContainerId": h.get("currentContainerId")},
+        "household": {"id": h.id, "currentContainerId": h.currentContainerId},
         "assignments": assignments,
         "deployments": deployments,
         "totalVolumeCollectedL": total_volume,
     }
+
+
+@router.get("/households/{household_id}/timeline")
+async def get_household_timeline(
+    household_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: str | None = None,
+    order: Literal["asc", "desc"] = "desc",
+):
+    """Deployments, swaps and collection events for this household from `entity_events`, paged by `cursor`."""
+    db = get_db()
+    try:
+        items, next_cursor = await timeline.read(db, household_id, limit, cursor, newest_first=order == "desc")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"items": items, "nextCursor": next_cursor}
@@ -1,5 +1,13 @@
+from typing import Literal
+
 from fastapi import APIRouter, HTTPException, Query
-from app.services.qr import sign_action, verify_action
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+
+from app.core.config import settings
+from app.dependencies.db import get_db
+from app.services import labels
+from app.services.qr import sign_action, verify_many
 
 router = APIRouter()
 
@@ -10,5 +18,74 @@ def qr_sign(containerId: str = Query(...)):
 
 
 @router.get("/qr/verify")
-def qr_verify(containerId: str = Query(...), sig: str = Query(...)):
-    return {"valid": verify_action(containerId, sig)}
+async def qr_verify(containerId: str = Query(...), sig: str = Query(...)):
+    reason, = await verify_many(get_db(), [(containerId, sig)])
+    return {"valid": reason is None, "reason": reason}
+
+
+class VerifyItem(BaseModel):
+    containerId: str
+    sig: str
+
+
+class VerifyBatchIn(BaseModel):
+    items: list[VerifyItem] = Field(..., min_length=1, max_length=500)
+    consume: bool = False
+
+
+@router.post("/qr/verify/batch")
+async def qr_verify_batch(payload: VerifyBatchIn):
+    """Verify many scanned codes at once; with consume=true valid tokens are also marked used."""
+    reasons = await verify_many(get_db(), [(i.containerId, i.sig) for i in payload.items], payload.consume)
+    return {"results": [
+        {"containerId": i.containerId, "valid": r is None, "reason": r}
+        for i, r in zip(payload.items, reasons)
+    ]}
+
+
+class LabelsIn(BaseModel):
+    containerIds: list[str] | None = Field(None, min_length=1)
+    serialFrom: str | None = None
+    serialTo: str | None = None
+    format: Literal["zip", "sheet"] = "zip"
+    columns: int = Field(4, ge=1, le=10)
+    rows: int = Field(6, ge=1, le=20)
+
+
+@router.post("/qr/labels")
+async def qr_labels(payload: LabelsIn):
+    """
+    Signed QR labels as SVG for a list of containers or an inclusive serial range:
+    a ZIP with one `<serial>.svg` per container, or one sheet with A4 pages.
+    """
+    if not labels.label_url_configured():
+        # A payload that is not a URL prints labels that open nothing when scanned
+        raise HTTPException(status_code=503, detail="QR_LABEL_BASE_URL is not configured")
+    by_ids = payload.containerIds is not None
+    if by_ids == (payload.serialFrom is not None or payload.serialTo is not None):
+        raise HTTPException(status_code=400, detail="Give either containerIds or serialFrom/serialTo")
+    db = get_db()
+    limit = settings.QR_LABELS_MAX
+    if by_ids:
+        ids = list(dict.fromkeys(payload.containerIds))
+        if len(ids) > limit:
+            raise HTTPException(status_code=400, detail=f"At most {limit} labels per call")
+        found = {d["_id"]: d async for d in db.containers.find({"_id": {"$in": ids}}, {"serial": 1})}
+        missing = [i for i in ids if i not in found]
+        items = [{"id": i, "serial": found[i].get("serial")} for i in ids if i in found]
+    else:
+        q = {"serial": {k: v for k, v in (("$gte", payload.serialFrom), ("$lte", payload.serialTo)) if v is not None}}
+        docs = [d async for d in db.containers.find(q, {"serial": 1}).sort("serial", 1).limit(limit + 1)]
+        if len(docs) > limit:
+            raise HTTPException(status_code=400, detail=f"Range covers more than {limit} containers")
+        missing = []
+        items = [{"id": d["_id"], "serial": d.get("serial")} for d in docs]
+    if not items:
+        raise HTTPException(status_code=404, detail="No matching containers")
+
+    headers = {"X-Labels-Count": str(len(items)), "X-Labels-Missing": str(len(missing))}
+    if payload.format == "sheet":
+        return StreamingResponse(labels.sheet_stream(items, payload.columns, payload.rows),
+                                 media_type="image/svg+xml", headers=headers)
+    headers["Content-Disposition"] = 'attachment; filename="qr-labels.zip"'
+    return StreamingResponse(labels.zip_stream(items), media_type="application/zip", headers=headers)
@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Query
+from pydantic import BaseModel
+from typing import List, Literal
+from app.dependencies.db import get_db
+from app.services import search as search_service
+
+router = APIRouter()
+
+
+class SearchHitOut(BaseModel):
+    type: Literal["household", "signup"]
+    id: str
+    label: str | None = None
+    phone: str | None = None
+    villaNumber: str | None = None
+    community: str | None = None
+    addressText: str | None = None
+    status: str | None = None
+    score: float
+
+
+@router.get("/search", response_model=List[SearchHitOut])
+async def search(
+    q: str = Query(..., min_length=1, max_length=100),
+    type: Literal["households", "signups", "all"] = "all",
+    limit: int = Query(20, ge=1, le=50),
+):
+    """Type-ahead over names, phone numbers, villa numbers and addresses, best matches first."""
+    db = get_db()
+    kinds = ["households", "signups"] if type == "all" else [type]
+    return await search_service.search(db, q, kinds, limit)
@@ -1,8 +1,12 @@
-from datetime import datetime, timezone
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Response
 from pydantic import BaseModel, EmailStr
 from app.dependencies.db import get_db
+from app.repositories.containers import ContainerRepository
+from app.repositories.signups import LIST_FIELDS as SIGNUP_LIST_FIELDS, SignupRepository
+from app.services import counts, search, timeline
+from app.utils import versions
 from app.utils.ids import new_id
+from app.utils.time import utcnow
 from typing import List, Literal
 
 
@@ -32,7 +36,7 @@ class SignupOut(BaseModel):
 @router.post("/signups", response_model=SignupOut)
 async def create_signup(payload: SignupCreate):
     db = get_db()
-    now = datetime.now(timezone.utc).isoformat()
+    now = utcnow()
     signup_id = new_id("signup")
     doc = {
         "_id": signup_id,
@@ -49,7 +53,9 @@ async def create_signup(payload: SignupCreate):
         "linkedHouseholdId": None,
         "source": "flyer_qr_v1",
     }
-    await db.signups.insert_one(doc)
+    await db.insert("signups", search.with_search_keys("signups", doc))
+    await counts.bump(db, "signups", {"pending": 1})
+    search.index_doc("signups", doc)
     return {"id": signup_id, "status": "pending"}
 
 
@@ -69,34 +75,20 @@ class SignupListOut(BaseModel):
 
 @router.get("/signups", response_model=List[SignupListOut])
 async def list_active_signups(
+    response: Response,
     sortBy: Literal["createdAt", "status", "fullName"] = "createdAt",
-    sortDir: Literal["asc", "desc"] = "desc"
+    sortDir: Literal["asc", "desc"] = "desc",
+    count: bool = Query(False, description="Set X-Total-Count with the total number of matches"),
 ):
     db = get_db()
     # Query all signups where status is not "inactive" or "deleted"
+    q = {"status": {"$in": ["pending", "awaiting_deployment", "active"]}}
     sort_field = sortBy
     sort_direction = -1 if sortDir == "desc" else 1
-    cursor = db.signups.find({"status": {"$in": ["pending", "awaiting_deployment", "active"]}}).sort(sort_field, sort_direction)
-    results = []
-    async for doc in cursor:
-        results.append(
-            SignupListOut(
-                id=doc["_id"],
-                fullName=doc.get("fullName"),
-                phone=doc.get("phone"),
-                email=doc.get("email"),
-                addressText=doc.get("addressText"),
-                villaNumber=doc.get("villaNumber"),
-                community=doc.get("community"),
-                location=GeoPoint(
-                    latitude=doc["location"]["latitude"],
-                    longitude=doc["location"]["longitude"],
-                ),
-                status=doc.get("status"),
-                createdAt=doc.get("createdAt"),
-            )
-        )
-    return results
+    rows = await counts.with_total(db, "signups", q, SignupRepository(db).find(
+        q, sort=[(sort_field, sort_direction)], names=SIGNUP_LIST_FIELDS,
+    ), response, count)
+    return [r.to_api(SIGNUP_LIST_FIELDS) for r in rows]
 
 
 class BatchProcessPayload(BaseModel):
@@ -113,52 +105,61 @@ class BatchProcessResult(BaseModel):
 @router.post("/signups/awaiting-deployment/batch", response_model=List[BatchProcessResult])
 async def move_pending_to_awaiting_deployment(payload: BatchProcessPayload):
     db = get_db()
-    now = datetime.now(timezone.utc).isoformat()
+    now = utcnow()
     results: List[BatchProcessResult] = []
+    status_changes: dict[str, int] = {}
+    signups = await SignupRepository(db).get_many(payload.signupIds)
 
     for signup_id in payload.signupIds:
-        signup = await db.signups.find_one({"_id": signup_id})
+        signup = signups.get(signup_id)
         if not signup:
             results.append(BatchProcessResult(signupId=signup_id, householdId=None, status="skipped", message="signup not found"))
             continue
 
-        if signup.get("status") != "pending":
-            results.append(BatchProcessResult(signupId=signup_id, householdId=signup.get("linkedHouseholdId"), status="skipped", message=f"status is {signup.get('status')}, expected pending"))
+        if signup.status != "pending":
+            results.append(BatchProcessResult(signupId=signup_id, householdId=signup.linkedHouseholdId, status="skipped", message=f"status is {signup.status}, expected pending"))
             continue
 
         # Create household from signup details
         household_id = new_id("hh")
         household_doc = {
             "_id": household_id,
-            "villaNumber": signup.get("villaNumber"),
-            "community": signup.get("community"),
-            "addressText": signup.get("addressText"),
+            "villaNumber": signup.villaNumber,
+            "community": signup.community,
+            "addressText": signup.addressText,
             "location": {
-                "latitude": signup["location"]["latitude"],
-                "longitude": signup["location"]["longitude"],
+                "latitude": signup.location["latitude"],
+                "longitude": signup.location["longitude"],
             },
             "primaryContact": {
-                "fullName": signup.get("fullName"),
-                "phone": signup.get("phone"),
-                "email": signup.get("email"),
+                "fullName": signup.fullName,
+                "phone": signup.phone,
+                "email": signup.email,
             },
             "status": "active",
             "createdAt": now,
             "updatedAt": now,
+            "version": 1,
             "currentContainerId": None,
             "previousContainerIds": [],
         }
 
-        await db.households.insert_one(household_doc)
+        await db.households.insert_one(search.with_search_keys("households", household_doc))
+        search.index_doc("households", household_doc)
 
         # Update signup to awaiting_deployment and link household
         await db.signups.update_one(
             {"_id": signup_id},
             {"$set": {"status": "awaiting_deployment", "linkedHouseholdId": household_id, "updatedAt": now}},
         )
+        # A duplicate id later in the payload must see the new status
+        signup.status = "awaiting_deployment"
+        signup.linkedHouseholdId = household_id
+        counts.merge(status_changes, counts.status_delta("pending", "awaiting_deployment"))
 
         results.append(BatchProcessResult(signupId=signup_id, householdId=household_id, status="updated", message=None))
 
+    await counts.bump(db, "signups", status_changes)
     return results
 
 
@@ -184,13 +185,13 @@ class AdHocDeployOut(BaseModel):
 @router.post("/signups/ad-hoc-deploy", response_model=AdHocDeployOut)
 async def ad_hoc_signup_and_deploy(payload: AdHocDeployIn):
     db = get_db()
-    now = datetime.now(timezone.utc).isoformat()
+    now = utcnow()
 
     # Validate container
-    container = await db.containers.find_one({"_id": payload.containerId})
+    container = await ContainerRepository(db).get(payload.containerId)
     if not container:
         raise HTTPException(status_code=404, detail="Container not found")
-    if container.get("assignedHouseholdId"):
+    if container.assignedHouseholdId:
         raise HTTPException(status_code=400, detail="Container already assigned")
 
     # Create signup (will end as active)
@@ -227,25 +228,29 @@ async def ad_hoc_signup_and_deploy(payload: AdHocDeployIn):
         "status": "active",
         "createdAt": now,
         "updatedAt": now,
-        "currentContainerId": None,
+        "version": 1,
+        "currentContainerId": payload.containerId,
+        "lastDeploymentAt": now,
         "previousContainerIds": [],
     }
 
-    # Persist signup and household
-    await db.signups.insert_one(signup_doc)
-    await db.households.insert_one(household_doc)
-
-    # Assign container to household
-    await db.containers.update_one(
-        {"_id": payload.containerId},
-        {"$set": {"assignedHouseholdId": household_id, "history.lastAssignedAt": now}},
-    )
-    await db.households.update_one(
-        {"_id": household_id},
-        {"$set": {"currentContainerId": payload.containerId, "lastDeploymentAt": now}},
+    # Assign container to household first (compare-and-set): a concurrent deployment of
+    # the same container gets 409 before anything else is written
+    res = await db.containers.update_one(
+        {"_id": payload.containerId, "assignedHouseholdId": None, **versions.match(versions.current(container))},
+        {"$set": {"assignedHouseholdId": household_id, "history.lastAssignedAt": now, "updatedAt": now},
+         "$inc": {"version": 1}},
     )
+    if res.matched_count == 0:
+        raise HTTPException(status_code=409, detail="Container was modified concurrently")
+
+    # Persist signup and household
+    await db.signups.insert_one(search.with_search_keys("signups", signup_doc))
+    await db.households.insert_one(search.with_search_keys("households", household_doc))
+    search.index_doc("signups", signup_doc)
+    search.index_doc("households", household_doc)
     await db.container_assignments.insert_one({
-        "_id": f"assn_{payload.containerId}_{now}",
+        "_id": f"assn_{payload.containerId}_{now.isoformat()}",
         "containerId": payload.containerId,
         "householdId": household_id,
         "assignedAt": now,
@@ -256,58 +261,51 @@ async def ad_hoc_signup_and_deploy(payload: AdHocDeployIn):
 
     # Deployment record
     deployment_id = new_id("dep")
-    await db.deployments.insert_one({
+    dep_doc = {
         "_id": deployment_id,
         "type": "deployment",
         "performedAt": now,
         "performedBy": payload.performedBy,
         "householdId": household_id,
         "installedContainerId": payload.containerId,
-    })
+        "updatedAt": now,
+        "version": 1,
+    }
+    await db.deployments.insert_one(dep_doc)
+    await timeline.append(db, timeline.deployment_events(dep_doc))
 
     # Activate signup and link household
     await db.signups.update_one(
         {"_id": signup_id},
         {"$set": {"status": "active", "linkedHouseholdId": household_id, "updatedAt": now}},
     )
+    await counts.bump(db, "signups", {"active": 1})
 
     return AdHocDeployOut(signupId=signup_id, householdId=household_id, deploymentId=deployment_id, status="active")
 
 
 @router.get("/signups/awaiting-deployment", response_model=List[SignupListOut])
-async def list_awaiting_deployment_signups():
+async def list_awaiting_deployment_signups(
+    response: Response,
+    count: bool = Query(False, description="Set X-Total-Count with the total number of matches"),
+):
     db = get_db()
-    cursor = db.signups.find({"status": "awaiting_deployment"})
-    results: List[SignupListOut] = []
-    async for doc in cursor:
-        results.append(
-            SignupListOut(
-                id=doc["_id"],
-                fullName=doc.get("fullName"),
-                phone=doc.get("phone"),
-                email=doc.get("email"),
-                addressText=doc.get("addressText"),
-                villaNumber=doc.get("villaNumber"),
-                community=doc.get("community"),
-                location=GeoPoint(
-                    latitude=doc["location"]["latitude"],
-                    longitude=doc["location"]["longitude"],
-                ),
-                status=doc.get("status"),
-                createdAt=doc.get("createdAt"),
-            )
-        )
-    return results
+    q = {"status": "awaiting_deployment"}
+    rows = await counts.with_total(
+        db, "signups", q, SignupRepository(db).find(q, names=SIGNUP_LIST_FIELDS), response, count)
+    return [r.to_api(SIGNUP_LIST_FIELDS) for r in rows]
 
 
 # OMS: list-all with filters
 @router.get("/signups/all", response_model=List[SignupListOut])
 async def list_all_signups(
+    response: Response,
     status: Literal["pending", "awaiting_deployment", "active", "inactive", "deleted", "any"] = Query("any"),
     community: str | None = None,
     limit: int = Query(100, ge=1, le=500),
     sortBy: Literal["createdAt", "status", "fullName"] = "createdAt",
-    sortDir: Literal["asc", "desc"] = "desc"
+    sortDir: Literal["asc", "desc"] = "desc",
+    count: bool = Query(False, description="Set X-Total-Count with the total number of matches"),
 ):
     db = get_db()
     q: dict = {}
@@ -317,27 +315,9 @@ async def list_all_signups(
         q["community"] = community
     sort_field = sortBy
     sort_direction = -1 if sortDir == "desc" else 1
-    cursor = db.signups.find(q).sort(sort_field, sort_direction).limit(limit)
-    results: List[SignupListOut] = []
-    async for doc in cursor:
-        results.append(
-            SignupListOut(
-                id=doc["_id"],
-                fullName=doc.get("fullName"),
-                phone=doc.get("phone"),
-                email=doc.get("email"),
-                addressText=doc.get("addressText"),
-                villaNumber=doc.get("villaNumber"),
-                community=doc.get("community"),
-                location=GeoPoint(
-                    latitude=doc["location"]["latitude"],
-                    longitude=doc["location"]["longitude"],
-                ),
-                status=doc.get("status"),
-                createdAt=doc.get("createdAt"),
-            )
-        )
-    return results
+    rows = await counts.with_total(db, "signups", q, SignupRepository(db).find(
+        q, sort=[(sort_field, sort_direction)], limit=limit, names=SIGNUP_LIST_FIELDS), response, count)
+    return [r.to_api(SIGNUP_LIST_FIELDS) for r in rows]
 
 
 class SignupStatusUpdateItem(BaseModel):
@@ -360,20 +340,25 @@ class SignupStatusBatchOut(BaseModel):
 @router.patch("/signups/status/batch", response_model=SignupStatusBatchOut)
 async def batch_update_signup_status(payload: SignupStatusBatchIn):
     db = get_db()
-    now = datetime.now(timezone.utc).isoformat()
+    now = utcnow()
     updated = 0
     skipped = 0
     errors = 0
+    status_changes: dict[str, int] = {}
     for item in payload.items:
         try:
-            res = await db.signups.update_one(
+            # The previous status comes back with the update, for the per-status counters
+            before = await db.signups.find_one_and_update(
                 {"_id": item.signupId},
                 {"$set": {"status": item.status, "updatedAt": now, "statusReason": item.reason, "statusUpdatedBy": item.updatedBy}},
+                projection={"status": 1},
             )
-            if res.matched_count == 0:
+            if before is None:
                 skipped += 1
             else:
                 updated += 1
+                counts.merge(status_changes, counts.status_delta(before.get("status"), item.status))
         except Exception:
             errors += 1
+    await counts.bump(db, "signups", status_changes)
     return SignupStatusBatchOut(updated=updated, skipped=skipped, errors=errors)
@@ -0,0 +1,95 @@
+import asyncio
+from datetime import timedelta
+
+from fastapi import APIRouter, HTTPException, Query
+
+from app.core.config import settings
+from app.dependencies.db import get_db
+from app.repositories.collection_requests import LIST_FIELDS as REQUEST_LIST_FIELDS, CollectionRequestRepository
+from app.repositories.containers import ContainerRepository
+from app.repositories.deployments import LIST_FIELDS as DEPLOYMENT_LIST_FIELDS, DeploymentRepository
+from app.repositories.households import HouseholdRepository
+from app.utils.time import parse_ts, to_iso, ts_range, utcnow
+
+router = APIRouter()
+
+REQUEST_SYNC_FIELDS = REQUEST_LIST_FIELDS + ("requestSource", "geoAtRequest", "updatedAt")
+TASK_SYNC_FIELDS = DEPLOYMENT_LIST_FIELDS + ("notes", "updatedAt")
+HOUSEHOLD_SYNC_FIELDS = ("villaNumber", "community", "addressText", "location", "primaryContact", "status",
+                         "currentContainerId", "updatedAt", "version")
+CONTAINER_SYNC_FIELDS = ("serial", "state", "attributes", "assignedHouseholdId", "updatedAt", "version")
+
+OPEN_TASK_STATUSES = ["assigned", "in_progress"]
+
+
+def _changed(q: dict, since) -> dict:
+    return q if since is None else {"$and": [q, ts_range("updatedAt", since)]}
+
+
+def _referenced(ids: set, fresh: set, since) -> dict:
+    if since is None or not ids:
+        return {"_id": {"$in": list(ids)}}
+    return {"_id": {"$in": list(ids)}, "$or": [{"_id": {"$in": list(fresh)}}, ts_range("updatedAt", since)]}
+
+
+async def _all(cur) -> list[dict]:
+    return [d async for d in cur]
+
+
+@router.get("/sync")
+async def sync(
+    assignedTo: str,
+    since: str | None = Query(None, description="watermark from the previous /sync response"),
+):
+    """
+    Delta of a driver's work since `since`: collection requests and deployment tasks
+    assigned to them that changed, plus the households and containers those reference
+    that changed or were not referenced before. Without `since` the driver's whole open
+    work is returned. Clients upsert by id and drop local requests/tasks missing from
+    openRequestIds/openTaskIds (completed elsewhere or reassigned).
+    """
+    try:
+        watermark = parse_ts(since) if since else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid since")
+    db = get_db()
+    # Taken before reading so nothing written during this call falls between two syncs
+    now = utcnow()
+    changed_since = watermark - timedelta(seconds=settings.SYNC_OVERLAP_SECONDS) if watermark else None
+
+    open_requests_q = {"assignedTo": assignedTo, "status": "requested"}
+    open_tasks_q = {"assignedTo": assignedTo, "type": "deployment_task", "status": {"$in": OPEN_TASK_STATUSES}}
+    requests_q = open_requests_q if watermark is None else _changed({"assignedTo": assignedTo}, changed_since)
+    tasks_q = open_tasks_q if watermark is None else _changed(
+        {"assignedTo": assignedTo, "type": "deployment_task"}, changed_since)
+
+    open_requests, open_tasks, requests, tasks = await asyncio.gather(
+        _all(db.collection_requests.find(open_requests_q, {"householdId": 1, "containerId": 1})),
+        _all(db.deployments.find(open_tasks_q, {"householdId": 1})),
+        CollectionRequestRepository(db).find(requests_q, sort=[("updatedAt", 1)], names=REQUEST_SYNC_FIELDS),
+        DeploymentRepository(db).find(tasks_q, sort=[("updatedAt", 1)], names=TASK_SYNC_FIELDS),
+    )
+
+    # Referenced by open work: send if changed, or if a request/task pointing at it is new to the client
+    household_ids = {d.get("householdId") for d in open_requests + open_tasks} - {None}
+    container_ids = {d.get("containerId") for d in open_requests} - {None}
+    fresh_households = {r.householdId for r in requests + tasks} & household_ids
+    fresh_containers = {r.containerId for r in requests} & container_ids
+
+    households, containers = await asyncio.gather(
+        HouseholdRepository(db).find(
+            _referenced(household_ids, fresh_households, changed_since), names=HOUSEHOLD_SYNC_FIELDS),
+        ContainerRepository(db).find(
+            _referenced(container_ids, fresh_containers, changed_since), names=CONTAINER_SYNC_FIELDS),
+    )
+
+    return {
+        "watermark": to_iso(now),
+        "full": watermark is None,
+        "requests": [r.to_api(REQUEST_SYNC_FIELDS) for r in requests],
+        "tasks": [t.to_api(TASK_SYNC_FIELDS) for t in tasks],
+        "households": [h.to_api(HOUSEHOLD_SYNC_FIELDS) for h in households],
+        "containers": [c.to_api(CONTAINER_SYNC_FIELDS) for c in containers],
+        "openRequestIds": [d["_id"] for d in open_requests],
+        "openTaskIds": [d["_id"] for d in open_tasks],
+    }
@@ -1,8 +1,8 @@
-from datetime import datetime, timezone
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List
 from app.dependencies.db import get_db
+from app.utils.time import to_iso, utcnow
 import hashlib
 import os
 
@@ -28,7 +28,7 @@ class UserOut(BaseModel):
 @router.post("/users", response_model=UserOut)
 async def create_user(payload: UserCreate):
     db = get_db()
-    now = datetime.now(timezone.utc).isoformat()
+    now = utcnow()
     # generate salt per user
     salt = os.urandom(16).hex()
     pwd_hash = hash_password(payload.password, salt)
@@ -45,14 +45,14 @@ async def create_user(payload: UserCreate):
     except Exception as e:
         # likely duplicate username
         raise HTTPException(status_code=400, detail="Username already exists")
-    return {"id": doc["_id"], "username": payload.username, "createdAt": now}
+    return {"id": doc["_id"], "username": payload.username, "createdAt": to_iso(now)}
 
 
 @router.get("/users", response_model=List[UserOut])
 async def list_users(limit: int = 100):
     db = get_db()
     cur = db.users.find({}, {"passwordHash": 0, "passwordSalt": 0}).limit(min(limit, 200))
-    return [UserOut(id=d["_id"], username=d.get("username"), createdAt=d.get("createdAt")) async for d in cur]
+    return [UserOut(id=d["_id"], username=d.get("username"), createdAt=to_iso(d.get("createdAt"))) async for d in cur]
 
 
 @router.get("/users/{user_id}")
@@ -72,7 +72,7 @@ class UserUpdate(BaseModel):
 @router.patch("/users/{user_id}")
 async def update_user(user_id: str, payload: UserUpdate):
     db = get_db()
-    now = datetime.now(timezone.utc).isoformat()
+    now = utcnow()
     update = {"updatedAt": now}
     if payload.password:
         salt = os.urandom(16).hex()
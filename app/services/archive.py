@@ -0,0 +1,274 @@
+"""
+Hot/cold archival of finished history rows.
+
+Completed/cancelled collection requests, closed container assignments and
+performed deployments/swaps older than ARCHIVE_AFTER_DAYS are moved to
+`<collection>_archive` in `_id`-ordered chunks: copy (duplicates ignored), then
+delete from the hot collection. A crash between the two steps leaves a row in both
+places, which the next run and the readers tolerate. Readers cache the watermark
+for a minute, so a run waits that long after advancing it before moving anything.
+
+Per collection, `meta` holds a watermark ("archive:<collection>" -> `before`): the
+archive only ever contains rows whose history time is earlier than it. Readers
+(`find_history`) query the archive only when the range they need starts before the
+watermark, so recent history and dashboards stay on the hot, RAM-sized collections.
+
+Runs in the background with ARCHIVE_ENABLED=true, or once via
+`python -m app.jobs.archive`. A lease in `meta` ("archive:lease") lets one run at a
+time go ahead across instances; the others skip their turn. A background run stops
+between chunks at shutdown and resumes on the next run.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from app.core.config import settings
+from app.services import counts
+from app.utils.ids import new_id
+from app.utils.time import parse_ts, ts_range, utcnow
+
+log = logging.getLogger("uvicorn.error")
+
+DUPLICATE_KEY = 11000
+_EPOCH = datetime.min.replace(tzinfo=timezone.utc)
+
+# collection -> (archival filter built from the cutoff, history time field readers sort/range on).
+# ts_range also matches rows still holding ISO-string timestamps (DB_LEGACY_STRING_TIMESTAMPS)
+ARCHIVED = {
+    "collection_requests": (
+        lambda cutoff: {"status": {"$in": ["completed", "cancelled"]}, **ts_range("requestedAt", before=cutoff)},
+        "requestedAt",
+    ),
+    # assignedAt <= unassignedAt, so closed rows are also earlier than the cutoff by assignedAt
+    "container_assignments": (lambda cutoff: ts_range("unassignedAt", before=cutoff), "assignedAt"),
+    # deployment_task documents are open work, never archived
+    "deployments": (
+        lambda cutoff: {"type": {"$in": ["deployment", "swap"]}, **ts_range("performedAt", before=cutoff)},
+        "performedAt",
+    ),
+}
+
+_watermarks: dict[str, tuple[float, datetime | None]] = {}
+_WATERMARK_TTL_SECONDS = 60.0
+_LEASE_ID = "archive:lease"
+# Renewed before every chunk; longer than the watermark wait
+_LEASE_SECONDS = 300
+
+
+def archive_name(name: str) -> str:
+    return f"{name}_archive"
+
+
+async def watermark(db, name: str) -> datetime | None:
+    """The archive holds only rows earlier than this (None: nothing archived yet). Cached briefly."""
+    hit = _watermarks.get(name)
+    if hit and time.monotonic() - hit[0] < _WATERMARK_TTL_SECONDS:
+        return hit[1]
+    doc = await db.meta.find_one({"_id": f"archive:{name}"})
+    value = doc.get("before") if doc else None
+    _watermarks[name] = (time.monotonic(), value)
+    return value
+
+
+def _as_dt(value) -> datetime | None:
+    # Legacy documents may still carry ISO-string timestamps
+    if isinstance(value, str):
+        try:
+            return parse_ts(value)
+        except ValueError:
+            return None
+    return value if isinstance(value, datetime) else None
+
+
+def _sort_key(field: str):
+    def key(d):
+        ts = _as_dt(d.get(field))
+        return (ts is None, ts or _EPOCH)
+    return key
+
+
+async def find_history(db, name: str, q: dict, since: datetime | None = None,
+                       not_before=None, projection: dict | None = None) -> list[dict]:
+    """
+    Rows matching `q` (and history time >= `since`), sorted by history time. The archive
+    is read too unless the range starts at or after the watermark; `not_before` (e.g.
+    the entity's createdAt) is a known lower bound that narrows the range without filtering.
+    """
+    field = ARCHIVED[name][1]
+    if since is not None:
+        q = {"$and": [q, ts_range(field, since)]}
+    starts = max((t for t in (since, _as_dt(not_before)) if t is not None), default=None)
+    hot = db.db[name].find(q, projection).sort(field, 1)
+    mark = await watermark(db, name)
+    if mark is None or (starts is not None and starts >= mark):
+        return [d async for d in hot]
+
+    cold = db.db[archive_name(name)].find(q, projection).sort(field, 1)
+    hot_rows, cold_rows = await asyncio.gather(_all(hot), _all(cold))
+    seen = {d["_id"] for d in hot_rows}
+    # A row caught between copy and delete is in both; the hot copy wins
+    rows = [d for d in cold_rows if d["_id"] not in seen] + hot_rows
+    rows.sort(key=_sort_key(field))
+    return rows
+
+
+async def _all(cur) -> list[dict]:
+    return [d async for d in cur]
+
+
+async def _set_watermark(db, name: str, cutoff: datetime):
+    # Only ever moves forward: older cutoffs are already covered
+    await db.meta.update_one(
+        {"_id": f"archive:{name}", "$or": [{"before": {"$lt": cutoff}}, {"before": {"$exists": False}}]},
+        {"$set": {"before": cutoff}},
+        upsert=True,
+    )
+    _watermarks.pop(name, None)
+
+
+async def _copy(archive, docs: list[dict]):
+    try:
+        await archive.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        # Already copied by an interrupted run
+        if any(err.get("code") != DUPLICATE_KEY for err in (e.details or {}).get("writeErrors", [])):
+            raise
+
+
+class _Lease:
+    """One archiver at a time across instances: a `meta` document held until `until`."""
+
+    def __init__(self, db):
+        self.db = db
+        self.owner = new_id("archiver")
+
+    async def hold(self) -> bool:
+        """Take or renew the lease; False if another run holds it."""
+        now = utcnow()
+        try:
+            await self.db.meta.update_one(
+                {"_id": _LEASE_ID, "$or": [{"owner": self.owner}, {"until": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "until": now + timedelta(seconds=_LEASE_SECONDS)}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def release(self):
+        await self.db.meta.update_one({"_id": _LEASE_ID, "owner": self.owner}, {"$set": {"until": utcnow()}})
+
+
+async def _wait(stop: asyncio.Event | None, seconds: float) -> bool:
+    """Sleep `seconds`, or less if `stop` is set; True if stopping."""
+    if stop is None:
+        await asyncio.sleep(seconds)
+        return False
+    try:
+        await asyncio.wait_for(stop.wait(), timeout=seconds)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+
+async def _delete_counted(db, hot, name: str, q: dict, docs: list[dict]) -> int:
+    # Per status, so the counter delta is what this run deleted, not what it read: a row
+    # another run already moved is not subtracted twice
+    by_status: dict = {}
+    for d in docs:
+        by_status.setdefault(d.get("status"), []).append(d["_id"])
+    delta: dict[str, int] = {}
+    for status, ids in by_status.items():
+        res = await hot.delete_many({**q, "status": status, "_id": {"$in": ids}})
+        counts.merge(delta, {status: -res.deleted_count})
+    # Counters (count=true) describe the hot collection that lists read
+    await counts.bump(db, name, delta)
+    return -sum(delta.values())
+
+
+async def archive_collection(db, name: str, cutoff: datetime, chunk_size: int, pause: float,
+                             stop: asyncio.Event | None = None, lease: _Lease | None = None) -> int:
+    build, _ = ARCHIVED[name]
+    q = build(cutoff)
+    hot, archive = db.db[name], db.db[archive_name(name)]
+    if await hot.find_one(q, {"_id": 1}) is None:
+        return 0
+    try:
+        await _set_watermark(db, name, cutoff)
+    except DuplicateKeyError:
+        # The stored watermark is already at or past this cutoff
+        pass
+    # Readers cache the watermark; let every instance see the new one before rows move
+    if await _wait(stop, _WATERMARK_TTL_SECONDS):
+        return 0
+
+    moved = 0
+    last_id = None
+    while True:
+        # Stopping between chunks is safe: the next run picks up where this one left off
+        if stop is not None and stop.is_set():
+            break
+        if lease is not None and not await lease.hold():
+            log.warning("archive %s: lease lost to another run, stopping", name)
+            break
+        page_q = {**q, "_id": {"$gt": last_id}} if last_id is not None else q
+        docs = [d async for d in hot.find(page_q).sort("_id", 1).limit(chunk_size)]
+        if not docs:
+            break
+        last_id = docs[-1]["_id"]
+        await _copy(archive, docs)
+        ids = [d["_id"] for d in docs]
+        # Re-check the filter: a row that changed since it was read stays hot
+        if name in counts.COUNTED:
+            moved += await _delete_counted(db, hot, name, q, docs)
+        else:
+            moved += (await hot.delete_many({**q, "_id": {"$in": ids}})).deleted_count
+        still_hot = {d["_id"] async for d in hot.find({"_id": {"$in": ids}}, {"_id": 1})}
+        if still_hot:
+            await archive.delete_many({"_id": {"$in": list(still_hot)}})
+        log.info("archive %s: %d moved so far (at _id=%s)", name, moved, last_id)
+        if pause and await _wait(stop, pause):
+            break
+    return moved
+
+
+async def archive_all(db, names: list[str] | None = None, older_than_days: int | None = None,
+                      chunk_size: int | None = None, pause: float | None = None,
+                      stop: asyncio.Event | None = None) -> dict[str, int]:
+    days = settings.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    cutoff = utcnow() - timedelta(days=days)
+    lease = _Lease(db)
+    if not await lease.hold():
+        log.info("Archival skipped: another run holds the lease")
+        return {}
+    out = {}
+    try:
+        for name in names or list(ARCHIVED):
+            if stop is not None and stop.is_set():
+                break
+            out[name] = await archive_collection(
+                db, name, cutoff,
+                chunk_size or settings.ARCHIVE_CHUNK_SIZE,
+                settings.ARCHIVE_PAUSE_SECONDS if pause is None else pause,
+                stop, lease,
+            )
+    finally:
+        await lease.release()
+    return out
+
+
+async def run_archiver(db, stop: asyncio.Event):
+    while not stop.is_set():
+        try:
+            moved = await archive_all(db, stop=stop)
+            if any(moved.values()):
+                log.info("Archived %s", moved)
+        except Exception as e:
+            log.warning("Archival run failed, will retry. Details: %s", e)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.ARCHIVE_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
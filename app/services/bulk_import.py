@@ -0,0 +1,197 @@
+"""
+Bulk import (`POST /containers:import`, `POST /households:import`).
+
+The request body (NDJSON or CSV with a header row) is read incrementally, each row
+is validated on its own, valid rows are inserted with `insert_many` in chunks of
+BULK_IMPORT_CHUNK_SIZE, and per-row results are written to a spooled temporary file
+(memory up to 1 MB, disk beyond). The response is sent once the whole upload has been
+imported (its headers carry the totals); the spool is then streamed out as NDJSON.
+Memory stays bounded by one chunk plus one line regardless of the upload size.
+"""
+import csv
+import json
+import tempfile
+from typing import AsyncIterator, Callable
+
+from pydantic import BaseModel, ValidationError
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from app.core.config import settings
+
+MAX_LINE_BYTES = 64 * 1024
+
+
+class ImportTooLarge(Exception):
+    pass
+
+
+async def lines(stream: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    buf = b""
+    async for chunk in stream:
+        parts = (buf + chunk).split(b"\n")
+        buf = parts.pop()
+        for line in parts:
+            yield line.rstrip(b"\r")
+        if len(buf) > MAX_LINE_BYTES:
+            raise ImportTooLarge(f"line longer than {MAX_LINE_BYTES} bytes")
+    if buf:
+        yield buf.rstrip(b"\r")
+
+
+async def rows(stream: AsyncIterator[bytes], fmt: str) -> AsyncIterator[tuple[int, dict | None, str | None]]:
+    """(row number, parsed row, parse error). CSV quoted fields may not contain newlines."""
+    header = None
+    n = 0
+    async for raw in lines(stream):
+        if not raw.strip():
+            continue
+        try:
+            line = raw.decode("utf-8-sig")
+        except UnicodeDecodeError as e:
+            if fmt == "csv" and header is None:
+                # Undecodable column names fail every row's validation instead
+                line = raw.decode("utf-8-sig", errors="replace")
+            else:
+                n += 1
+                yield n, None, f"invalid UTF-8 at byte {e.start}"
+                continue
+        if fmt == "csv" and header is None:
+            header = [h.strip() for h in next(csv.reader([line]))]
+            continue
+        n += 1
+        if fmt == "csv":
+            values = next(csv.reader([line]))
+            if len(values) != len(header):
+                yield n, None, f"expected {len(header)} columns, got {len(values)}"
+                continue
+            # Empty CSV cells are "not given"
+            yield n, {k: v for k, v in zip(header, values) if v != ""}, None
+        else:
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield n, None, f"invalid JSON: {e}"
+                continue
+            if not isinstance(row, dict):
+                yield n, None, "expected a JSON object"
+                continue
+            yield n, row, None
+
+
+def _validation_message(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors())
+
+
+class Importer:
+    """
+    build(model) -> document; result(doc) -> extra fields for the "created" line.
+    after_insert(docs) runs once per inserted chunk (search index, counters...).
+    """
+
+    def __init__(self, collection, model: type[BaseModel], build: Callable[[BaseModel], dict],
+                 result: Callable[[dict], dict] | None = None, after_insert=None):
+        self.collection = collection
+        self.model = model
+        self.build = build
+        self.result = result or (lambda doc: {})
+        self.after_insert = after_insert
+        self.out = tempfile.SpooledTemporaryFile(max_size=1024 * 1024, mode="w+b")
+        self.created = 0
+        self.errors = 0
+        self.total = 0
+        self.aborted: str | None = None
+        self._chunk: list[tuple[int, dict]] = []
+
+    def _write(self, line: dict):
+        self.out.write(json.dumps(line, default=str).encode() + b"\n")
+
+    def _error(self, row: int, message: str):
+        self.errors += 1
+        self._write({"row": row, "status": "error", "error": message})
+
+    async def _flush(self):
+        if not self._chunk:
+            return
+        chunk, self._chunk = self._chunk, []
+        failed: dict[int, str] = {}
+        try:
+            await self.collection.insert_many([doc for _, doc in chunk], ordered=False)
+        except BulkWriteError as e:
+            for err in (e.details or {}).get("writeErrors", []):
+                failed[err["index"]] = err.get("errmsg", "write failed")
+        except PyMongoError as e:
+            # Some of the chunk may have been written: report none of it as created
+            for row, _ in chunk:
+                self._error(row, f"not confirmed, database error: {e}")
+            raise
+        inserted = []
+        for i, (row, doc) in enumerate(chunk):
+            if i in failed:
+                self._error(row, failed[i])
+            else:
+                self.created += 1
+                inserted.append(doc)
+                self._write({"row": row, "status": "created", "id": doc["_id"], **self.result(doc)})
+        if inserted and self.after_insert:
+            await self.after_insert(inserted)
+
+    async def run(self, stream: AsyncIterator[bytes], fmt: str):
+        """
+        Rows already inserted stay inserted, and are reported, if the upload is cut short
+        or the database fails (see `aborted`).
+        """
+        try:
+            try:
+                await self._run(stream, fmt)
+            except ImportTooLarge as e:
+                self.aborted = str(e)
+            await self._flush()
+        except PyMongoError as e:
+            self.aborted = f"database error: {e}"
+        except BaseException:
+            self.out.close()
+            raise
+
+    async def _run(self, stream: AsyncIterator[bytes], fmt: str):
+        async for row_no, row, parse_error in rows(stream, fmt):
+            if row_no > settings.BULK_IMPORT_MAX_ROWS:
+                raise ImportTooLarge(f"more than {settings.BULK_IMPORT_MAX_ROWS} rows")
+            self.total = row_no
+            if parse_error:
+                self._error(row_no, parse_error)
+                continue
+            try:
+                item = self.model.model_validate(row)
+            except ValidationError as e:
+                self._error(row_no, _validation_message(e))
+                continue
+            self._chunk.append((row_no, self.build(item)))
+            if len(self._chunk) >= settings.BULK_IMPORT_CHUNK_SIZE:
+                await self._flush()
+
+    def summary(self) -> dict:
+        out = {"rows": self.total, "created": self.created, "errors": self.errors}
+        if self.aborted:
+            out["aborted"] = self.aborted
+        return out
+
+    def stream_results(self):
+        """Per-row NDJSON lines followed by one {"summary": ...} line; closes the spool."""
+        self.out.seek(0)
+        try:
+            while True:
+                block = self.out.read(64 * 1024)
+                if not block:
+                    break
+                yield block
+            yield json.dumps({"summary": self.summary()}).encode() + b"\n"
+        finally:
+            self.out.close()
+
+
+def detect_format(content_type: str | None, fmt: str | None) -> str:
+    if fmt:
+        return fmt
+    if content_type and "csv" in content_type:
+        return "csv"
+    return "ndjson"
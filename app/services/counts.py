@@ -0,0 +1,163 @@
+"""
+Total counts for list endpoints (`count=true` -> `X-Total-Count`).
+
+- No filter: `estimated_document_count` (collection metadata, no scan).
+- Status-only filter on signups / collection_requests: per-status counters kept in
+  the `counters` collection by the write paths, once seeded by `reconcile()`.
+- Anything else: `count_documents`, cached for COUNT_CACHE_TTL_SECONDS per filter.
+
+Counters are approximate. A write path bumps them after its own write, so a failure in
+between leaves them off by that write; `run_reconciler` recounts every
+COUNTS_RECONCILE_INTERVAL_SECONDS (off by default: enable it on one instance, or run
+`python -m app.migrations.counters` on a schedule) to bound the drift. Increments go to one of
+COUNTER_SHARDS documents ("<collection>:<n>") picked at random, so concurrent writers
+do not all queue on one document; a total is the base document ("<collection>", set by
+the recount) plus every shard.
+"""
+import asyncio
+import json
+import logging
+import random
+import re
+import time
+from collections import OrderedDict
+
+from app.core.config import settings
+from app.utils.time import utcnow
+
+log = logging.getLogger("uvicorn.error")
+
+# Collections whose per-status counters are maintained by the write paths
+COUNTED = ("signups", "collection_requests")
+
+_cache: OrderedDict[str, tuple[float, int]] = OrderedDict()
+_CACHE_MAX = 1000
+
+
+def status_delta(old: str | None, new: str | None, n: int = 1) -> dict[str, int]:
+    """Counter change for n documents moving old -> new (None = not counted yet / gone)."""
+    if old == new or n == 0:
+        return {}
+    delta = {}
+    if old:
+        delta[old] = -n
+    if new:
+        delta[new] = delta.get(new, 0) + n
+    return delta
+
+
+def merge(total: dict[str, int], delta: dict[str, int]) -> dict[str, int]:
+    for k, v in delta.items():
+        total[k] = total.get(k, 0) + v
+    return total
+
+
+async def bump(db, collection: str, delta: dict[str, int], session=None):
+    delta = {k: v for k, v in delta.items() if v}
+    if not delta:
+        return
+    shard = random.randrange(max(1, settings.COUNTER_SHARDS))
+    await db.counters.update_one(
+        {"_id": f"{collection}:{shard}"},
+        {"$inc": {f"byStatus.{status}": n for status, n in delta.items()}},
+        upsert=True,
+        session=session,
+    )
+
+
+def _docs_q(collection: str) -> dict:
+    # The base document and its shards; an anchored prefix regex on _id uses the index
+    return {"_id": {"$regex": f"^{re.escape(collection)}(:[0-9]+)?$"}}
+
+
+async def _shard_totals(db, collection: str) -> dict[str, int]:
+    totals: dict[str, int] = {}
+    async for doc in db.counters.find(_docs_q(collection), {"byStatus": 1}):
+        if doc["_id"] != collection:
+            merge(totals, doc.get("byStatus") or {})
+    return totals
+
+
+async def reconcile(db, collection: str) -> dict[str, int]:
+    """
+    Recount per-status totals from the collection and make base + shards equal to them.
+    Shards are never reset (a concurrent bump would be lost); the base absorbs the
+    difference instead. Writes landing while the aggregation runs can still leave the
+    result off by those writes until the next recount.
+    """
+    by_status: dict[str, int] = {}
+    async for row in db.db[collection].aggregate([{"$group": {"_id": "$status", "n": {"$sum": 1}}}]):
+        if row["_id"]:
+            by_status[str(row["_id"])] = row["n"]
+    shards = await _shard_totals(db, collection)
+    base = {s: by_status.get(s, 0) - shards.get(s, 0) for s in set(by_status) | set(shards)}
+    await db.counters.replace_one(
+        {"_id": collection},
+        {"_id": collection, "byStatus": base, "seeded": True, "seededAt": utcnow()},
+        upsert=True,
+    )
+    return by_status
+
+
+async def run_reconciler(db, stop: asyncio.Event):
+    interval = settings.COUNTS_RECONCILE_INTERVAL_SECONDS
+    while not stop.is_set():
+        # First recount one interval after startup, not during it
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+            return
+        except asyncio.TimeoutError:
+            pass
+        for name in COUNTED:
+            try:
+                log.info("Recounted %s: %s", name, await reconcile(db, name))
+            except Exception as e:
+                log.warning("Counter recount of %s failed, will retry. Details: %s", name, e)
+
+
+def _statuses(q: dict) -> list[str] | None:
+    """The statuses a status-only filter selects, or None if the filter is anything else."""
+    if set(q) != {"status"}:
+        return None
+    value = q["status"]
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, dict) and set(value) == {"$in"}:
+        return list(value["$in"])
+    return None
+
+
+async def total(db, collection: str, q: dict) -> int:
+    coll = db.db[collection]
+    if not q:
+        return await coll.estimated_document_count()
+
+    statuses = _statuses(q)
+    if collection in COUNTED and statuses is not None:
+        docs = [d async for d in db.counters.find(_docs_q(collection))]
+        if any(d["_id"] == collection and d.get("seeded") for d in docs):
+            by_status: dict[str, int] = {}
+            for d in docs:
+                merge(by_status, d.get("byStatus") or {})
+            return max(0, sum(by_status.get(s, 0) for s in statuses))
+
+    key = f"{collection}:{json.dumps(q, sort_keys=True, default=str)}"
+    hit = _cache.get(key)
+    now = time.monotonic()
+    if hit and now - hit[0] < settings.COUNT_CACHE_TTL_SECONDS:
+        return hit[1]
+    n = await coll.count_documents(q)
+    _cache[key] = (now, n)
+    _cache.move_to_end(key)
+    while len(_cache) > _CACHE_MAX:
+        _cache.popitem(last=False)
+    return n
+
+
+async def with_total(db, collection: str, q: dict, rows, response, count: bool):
+    """Await the page query; with count=True also set X-Total-Count, counted concurrently."""
+    if not count:
+        return await rows
+    page, n = await asyncio.gather(rows, total(db, collection, q))
+    response.headers["X-Total-Count"] = str(n)
+    return page
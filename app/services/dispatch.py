@@ -0,0 +1,105 @@
+import math
+from datetime import timedelta
+
+from pymongo import ReturnDocument
+
+from app.core.config import settings
+from app.repositories.households import HouseholdRepository
+from app.services.events import get_broker, request_event_payload
+from app.utils.time import utcnow
+
+
+def claimable(now) -> dict:
+    """Open requests nobody holds: never assigned, or the claimant's lease ran out."""
+    return {
+        "status": "requested",
+        "$or": [
+            {"assignedTo": None},
+            {"leaseExpiresAt": {"$lt": now}},
+        ],
+    }
+
+
+def haversine_km(a: dict, b: dict) -> float:
+    lat1, lon1 = math.radians(a["latitude"]), math.radians(a["longitude"])
+    lat2, lon2 = math.radians(b["latitude"]), math.radians(b["longitude"])
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(h))
+
+
+async def _claim_one(db, q: dict, driver_id: str, now, sort=None) -> dict | None:
+    doc = await db.collection_requests.find_one_and_update(
+        q,
+        {"$set": {
+            "assignedTo": driver_id,
+            "claimedAt": now,
+            "leaseExpiresAt": now + timedelta(seconds=settings.CLAIM_LEASE_SECONDS),
+            "updatedAt": now,
+        }, "$inc": {"version": 1}},
+        sort=sort,
+        return_document=ReturnDocument.AFTER,
+    )
+    if doc is not None:
+        get_broker().publish_local("assigned", request_event_payload(doc))
+    return doc
+
+
+async def claim_requests(db, driver_id: str, limit: int, near: dict | None = None) -> list[dict]:
+    """
+    Atomically hand the next `limit` open requests to `driver_id`.
+
+    Each request is taken with one find_one_and_update whose filter re-checks that it
+    is still claimable, so two dispatchers can never both get it. Without `near` the
+    oldest requests win; with it, a window of the oldest candidates is ranked by
+    distance and claimed nearest-first, skipping any taken in the meantime.
+    """
+    now = utcnow()
+    q = claimable(now)
+
+    if near is None:
+        claimed = []
+        for _ in range(limit):
+            doc = await _claim_one(db, q, driver_id, now, sort=[("requestedAt", 1)])
+            if doc is None:
+                break
+            claimed.append(doc)
+        return claimed
+
+    candidates = [
+        d async for d in db.collection_requests.find(
+            q, {"householdId": 1, "geoAtRequest": 1}
+        ).sort("requestedAt", 1).limit(settings.CLAIM_PROXIMITY_CANDIDATES)
+    ]
+    # Requests without a scan location fall back to the household's stored location
+    households = await HouseholdRepository(db).get_many(
+        d["householdId"] for d in candidates if not d.get("geoAtRequest"))
+
+    ranked = []
+    for d in candidates:
+        geo = d.get("geoAtRequest")
+        if not geo:
+            h = households.get(d.get("householdId"))
+            geo = h.location if h else None
+        ranked.append((haversine_km(near, geo) if geo else math.inf, d["_id"]))
+    ranked.sort()
+
+    claimed = []
+    for distance, req_id in ranked:
+        if len(claimed) >= limit:
+            break
+        doc = await _claim_one(db, {"_id": req_id, **q}, driver_id, now)
+        if doc is not None:
+            doc["distanceKm"] = None if distance == math.inf else round(distance, 3)
+            claimed.append(doc)
+    return claimed
+
+
+async def renew_lease(db, request_id: str, driver_id: str) -> dict | None:
+    now = utcnow()
+    return await db.collection_requests.find_one_and_update(
+        {"_id": request_id, "status": "requested", "assignedTo": driver_id,
+         "leaseExpiresAt": {"$gte": now}},
+        {"$set": {"leaseExpiresAt": now + timedelta(seconds=settings.CLAIM_LEASE_SECONDS), "updatedAt": now},
+         "$inc": {"version": 1}},
+        return_document=ReturnDocument.AFTER,
+    )
@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from app.core.config import settings
+from app.utils.time import to_iso
+
+log = logging.getLogger("uvicorn.error")
+
+# Fields pushed to stream subscribers for every collection request event.
+REQUEST_EVENT_FIELDS = ("householdId", "containerId", "status", "requestedAt", "assignedTo")
+
+
+def request_event_payload(doc: dict) -> dict:
+    data = {"id": doc["_id"], **{f: doc.get(f) for f in REQUEST_EVENT_FIELDS}}
+    data["requestedAt"] = to_iso(data["requestedAt"])
+    return data
+
+
+class EventBroker:
+    """
+    In-process fan-out of collection request events.
+
+    Events get a resume token "<epoch>-<seq>" and are kept in a bounded replay
+    buffer, so a client reconnecting with Last-Event-ID only receives what it missed.
+    Tokens from another process (restart, other instance) or older than the buffer
+    yield a single "reset" event telling the client to refetch the list once.
+    """
+
+    def __init__(self, buffer_size: int):
+        self.epoch = format(int(time.time()), "x")
+        self._seq = 0
+        self._buffer: deque[tuple[int, str, dict]] = deque(maxlen=buffer_size)
+        self._subscribers: set[asyncio.Queue] = set()
+        # Set while the change stream feed is running; write paths then stay quiet
+        # so every event is delivered exactly once.
+        self.external_feed = False
+
+    def _token(self, seq: int) -> str:
+        return f"{self.epoch}-{seq}"
+
+    def publish(self, kind: str, data: dict):
+        self._seq += 1
+        item = (self._seq, kind, data)
+        self._buffer.append(item)
+        for q in list(self._subscribers):
+            try:
+                q.put_nowait(item)
+            except asyncio.QueueFull:
+                # Slow consumer: drop it; it drains its queue, disconnects and
+                # replays the rest from the buffer on reconnect.
+                self._subscribers.discard(q)
+
+    def publish_local(self, kind: str, data: dict):
+        """Publish from a write path unless change streams already feed the broker."""
+        if not self.external_feed:
+            self.publish(kind, data)
+
+    def subscribe(self, last_event_id: str | None) -> tuple[asyncio.Queue, list, bool]:
+        """
+        Register a subscriber. Returns (queue, backlog, reset) where backlog holds
+        buffered events after last_event_id and reset is True if the token is unusable.
+        """
+        q: asyncio.Queue = asyncio.Queue(maxsize=settings.EVENTS_BUFFER_SIZE)
+        self._subscribers.add(q)
+        if not last_event_id:
+            return q, [], False
+        epoch, _, seq_str = last_event_id.partition("-")
+        try:
+            seq = int(seq_str)
+        except ValueError:
+            return q, [], True
+        oldest = self._buffer[0][0] if self._buffer else self._seq + 1
+        if epoch != self.epoch or seq > self._seq or seq < oldest - 1:
+            return q, [], True
+        return q, [item for item in self._buffer if item[0] > seq], False
+
+    def unsubscribe(self, q: asyncio.Queue):
+        self._subscribers.discard(q)
+
+    def is_subscribed(self, q: asyncio.Queue) -> bool:
+        return q in self._subscribers
+
+    def current_token(self) -> str:
+        return self._token(self._seq)
+
+    def format(self, item: tuple[int, str, dict]) -> tuple[str, str, dict]:
+        seq, kind, data = item
+        return self._token(seq), kind, data
+
+
+_broker: EventBroker | None = None
+_feed_task: asyncio.Task | None = None
+
+
+def get_broker() -> EventBroker:
+    global _broker
+    if _broker is None:
+        _broker = EventBroker(settings.EVENTS_BUFFER_SIZE)
+    return _broker
+
+
+def _change_kind(change: dict) -> str | None:
+    op = change.get("operationType")
+    if op == "insert":
+        return "created"
+    if op in ("update", "replace"):
+        fields = (change.get("updateDescription") or {}).get("updatedFields") or {}
+        if "status" in fields or op == "replace":
+            return "status"
+        if "assignedTo" in fields:
+            return "assigned"
+    return None
+
+
+async def _run_change_stream(db, broker: EventBroker):
+    resume_token = None
+    attached = False
+    while True:
+        try:
+            async with db.collection_requests.watch(
+                full_document="updateLookup", resume_after=resume_token
+            ) as stream:
+                broker.external_feed = attached = True
+                log.info("collection_requests change stream attached.")
+                async for change in stream:
+                    resume_token = stream.resume_token
+                    kind = _change_kind(change)
+                    doc = change.get("fullDocument")
+                    if kind and doc:
+                        broker.publish(kind, request_event_payload(doc))
+        except asyncio.CancelledError:
+            broker.external_feed = False
+            raise
+        except Exception as e:
+            broker.external_feed = False
+            if not attached:
+                # Backend without change streams (e.g. Firestore): stay on in-process events.
+                log.warning("Change streams unavailable, using in-process events. Details: %s", e)
+                return
+            log.warning("Change stream interrupted, resuming. Details: %s", e)
+            await asyncio.sleep(1)
+
+
+def ensure_feed(db):
+    """Start the change stream feed once, on first subscriber, if enabled."""
+    global _feed_task
+    if settings.EVENTS_CHANGE_STREAMS and _feed_task is None:
+        _feed_task = asyncio.create_task(_run_change_stream(db, get_broker()))
@@ -0,0 +1,52 @@
+"""
+`expand=household,container` on list endpoints: related documents for a whole page
+are loaded with one `$in` per collection (through the request identity map) and
+embedded next to their id fields.
+"""
+import asyncio
+
+from app.repositories.containers import ContainerRepository
+from app.repositories.households import HouseholdRepository
+
+# What gets embedded: enough to render a row without a follow-up call
+HOUSEHOLD_FIELDS = ("villaNumber", "community", "addressText", "status", "currentContainerId")
+CONTAINER_FIELDS = ("serial", "state", "assignedHouseholdId")
+
+_REPOS = {
+    "household": (HouseholdRepository, HOUSEHOLD_FIELDS),
+    "container": (ContainerRepository, CONTAINER_FIELDS),
+}
+
+
+def parse_expand(raw: str | None) -> set[str]:
+    if not raw:
+        return set()
+    wanted = {p.strip() for p in raw.split(",") if p.strip()}
+    unknown = wanted - set(_REPOS)
+    if unknown:
+        raise ValueError(f"Unknown expand value(s): {', '.join(sorted(unknown))}")
+    return wanted
+
+
+async def embed(db, rows: list[dict], expand: set[str], links: dict[str, tuple[tuple[str, str], ...]]) -> list[dict]:
+    """
+    links maps an expand name to (id field, embedded key) pairs, e.g.
+    {"container": (("installedContainerId", "installedContainer"), ("removedContainerId", "removedContainer"))}.
+    Rows whose id is missing or dangling get None.
+    """
+    names = [n for n in expand if n in links]
+    if not names or not rows:
+        return rows
+
+    async def load(name: str):
+        repo_cls, _ = _REPOS[name]
+        ids = [row.get(id_field) for row in rows for id_field, _ in links[name]]
+        return name, await repo_cls(db).get_many(i for i in ids if i)
+
+    for name, found in await asyncio.gather(*(load(n) for n in names)):
+        fields = _REPOS[name][1]
+        for row in rows:
+            for id_field, key in links[name]:
+                rec = found.get(row.get(id_field))
+                row[key] = rec.to_api(fields) if rec else None
+    return rows
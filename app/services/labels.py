@@ -0,0 +1,150 @@
+"""
+Printable QR labels (`POST /qr/labels`).
+
+Each container gets a fresh `sign_action` token encoded into a QR symbol
+(app/services/qrencode.py). Encoding is CPU-bound (~20 ms per symbol), so batches
+of payloads are fanned out to a process pool and the results are streamed back in
+order, with at most a few batches in flight: a ZIP of one SVG per container, or
+one SVG sheet laid out in A4 pages.
+"""
+import asyncio
+import multiprocessing
+import os
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator
+from urllib.parse import quote
+
+from app.core import metrics
+from app.core.config import settings
+from app.services.qr import sign_action
+from app.services.qrencode import render_paths, svg_element
+
+BATCH_SIZE = 25
+PAGE_W_MM, PAGE_H_MM, MARGIN_MM = 210, 297, 10
+
+_pool: ProcessPoolExecutor | None = None
+_stats = {"labels": 0, "batches": 0, "workers": 0}
+
+
+def _workers() -> int:
+    return settings.QR_LABEL_WORKERS or os.cpu_count() or 1
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the API process has Mongo driver threads running
+        _pool = ProcessPoolExecutor(max_workers=_workers(), mp_context=multiprocessing.get_context("spawn"))
+        _stats["workers"] = _workers()
+        metrics.register("qr_labels", lambda: dict(_stats))
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def label_content(container_id: str, sig: str) -> str:
+    return settings.QR_LABEL_URL.format(baseUrl=settings.QR_LABEL_BASE_URL.rstrip("/"),
+                                        containerId=quote(container_id, safe=""), sig=quote(sig, safe=""))
+
+
+def label_url_configured() -> bool:
+    """Whether labels would open a web page when scanned with a phone camera."""
+    return label_content("x", "x").startswith(("https://", "http://"))
+
+
+async def render(items: list[dict]) -> AsyncIterator[tuple[dict, str, int]]:
+    """(item, path data, size) in input order; items carry `id` and `serial`."""
+    now = int(time.time())
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    pending: deque = deque()
+    batches = [items[i:i + BATCH_SIZE] for i in range(0, len(items), BATCH_SIZE)]
+    ahead = _workers() * 2
+    try:
+        for batch in batches:
+            contents = [label_content(it["id"], sign_action(it["id"], now)) for it in batch]
+            pending.append((batch, loop.run_in_executor(pool, render_paths, contents, settings.QR_LABEL_ECC)))
+            if len(pending) < ahead:
+                continue
+            async for out in _drain_one(pending):
+                yield out
+        while pending:
+            async for out in _drain_one(pending):
+                yield out
+    finally:
+        for _, fut in pending:
+            fut.cancel()
+
+
+async def _drain_one(pending: deque):
+    batch, fut = pending.popleft()
+    results = await fut
+    _stats["batches"] += 1
+    _stats["labels"] += len(batch)
+    for item, (path, size) in zip(batch, results):
+        yield item, path, size
+
+
+def _file_name(item: dict) -> str:
+    name = item.get("serial") or item["id"]
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in name) + ".svg"
+
+
+class _Sink:
+    """Write-only file object for ZipFile; bytes are handed out as they are produced."""
+
+    def __init__(self):
+        self.parts: list[bytes] = []
+
+    def write(self, b) -> int:
+        self.parts.append(bytes(b))
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data, self.parts = b"".join(self.parts), []
+        return data
+
+
+async def zip_stream(items: list[dict]) -> AsyncIterator[bytes]:
+    sink = _Sink()
+    # An unseekable target makes ZipFile write data descriptors, so nothing is buffered
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        async for item, path, size in render(items):
+            zf.writestr(_file_name(item), svg_element(path, size, item.get("serial") or item["id"]))
+            yield sink.take()
+    yield sink.take()
+
+
+async def sheet_stream(items: list[dict], columns: int, rows: int) -> AsyncIterator[bytes]:
+    """One SVG, pages stacked vertically (PAGE_H_MM apart), `columns` x `rows` labels per page."""
+    per_page = columns * rows
+    pages = max(1, -(-len(items) // per_page))
+    cell_w = (PAGE_W_MM - 2 * MARGIN_MM) / columns
+    cell_h = (PAGE_H_MM - 2 * MARGIN_MM) / rows
+    yield (f'<svg xmlns="http://www.w3.org/2000/svg" width="{PAGE_W_MM}mm" height="{PAGE_H_MM * pages}mm" '
+           f'viewBox="0 0 {PAGE_W_MM} {PAGE_H_MM * pages}">').encode()
+    n = 0
+    async for item, path, size in render(items):
+        page, slot = divmod(n, per_page)
+        if slot == 0:
+            if page:
+                yield b"</g>"
+            yield f'<g id="page-{page + 1}"><rect y="{page * PAGE_H_MM}" width="{PAGE_W_MM}" height="{PAGE_H_MM}" fill="#fff"/>'.encode()
+        row, col = divmod(slot, columns)
+        x = MARGIN_MM + col * cell_w
+        y = page * PAGE_H_MM + MARGIN_MM + row * cell_h
+        attrs = f' x="{x:.2f}" y="{y:.2f}" width="{cell_w:.2f}" height="{cell_h:.2f}"'
+        yield svg_element(path, size, item.get("serial") or item["id"], attrs).encode()
+        n += 1
+    yield (b"</g>" if n else b"") + b"</svg>"
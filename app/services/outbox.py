@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import Awaitable, Callable
+
+from app.core import metrics
+from app.core.config import settings
+from app.services import counts
+from app.utils.ids import new_id
+from app.utils.time import utcnow
+
+log = logging.getLogger("uvicorn.error")
+
+# kind -> async handler(db, payload). Handlers must be idempotent: an entry can run
+# more than once if a worker dies between applying it and marking it done.
+HANDLERS: dict[str, Callable[..., Awaitable[None]]] = {}
+
+
+def handler(kind: str):
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+@handler("signups.activate")
+async def _activate_signups(db, payload: dict):
+    # Signups linked to a freshly deployed household move awaiting_deployment -> active
+    res = await db.signups.update_many(
+        {"linkedHouseholdId": payload["householdId"], "status": "awaiting_deployment"},
+        {"$set": {"status": "active", "updatedAt": payload["at"]}},
+    )
+    await counts.bump(db, "signups", counts.status_delta("awaiting_deployment", "active", res.modified_count))
+
+
+@handler("households.previousContainer")
+async def _remember_previous_container(db, payload: dict):
+    # No longer enqueued (swaps $addToSet with the household update); drains older entries
+    await db.households.update_one(
+        {"_id": payload["householdId"]},
+        {"$addToSet": {"previousContainerIds": payload["containerId"]}, "$set": {"updatedAt": utcnow()}},
+    )
+
+
+def outbox_doc(kind: str, payload: dict) -> dict:
+    now = utcnow()
+    return {
+        "_id": new_id("outbox"),
+        "kind": kind,
+        "payload": payload,
+        "status": "pending",
+        "attempts": 0,
+        "createdAt": now,
+        "availableAt": now,
+        "lastError": None,
+    }
+
+
+async def enqueue(db, kind: str, payload: dict, session=None) -> str:
+    """
+    Record a side effect next to the primary write (pass the transaction session when
+    there is one). The worker applies it after the request has returned.
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown outbox kind: {kind}")
+    doc = outbox_doc(kind, payload)
+    await db.outbox.insert_one(doc, session=session)
+    if _worker is not None:
+        _worker.wake.set()
+    return doc["_id"]
+
+
+async def enqueue_many(db, kind: str, payloads: list[dict]) -> list[str]:
+    """enqueue() for a batch of side effects of one kind, in a single insert."""
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown outbox kind: {kind}")
+    if not payloads:
+        return []
+    docs = [outbox_doc(kind, p) for p in payloads]
+    await db.outbox.insert_many(docs)
+    if _worker is not None:
+        _worker.wake.set()
+    return [d["_id"] for d in docs]
+
+
+class OutboxWorker:
+    """
+    Drains the outbox collection in batches.
+
+    A batch is claimed with one update_many tagging entries with a claim token, so
+    several API instances can run workers side by side. Failed entries are retried with
+    exponential backoff until OUTBOX_MAX_ATTEMPTS, then parked as "failed". Entries
+    stuck in "processing" past their lease (crashed worker) become claimable again.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.wake = asyncio.Event()
+        self._sem = asyncio.Semaphore(settings.OUTBOX_CONCURRENCY)
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+        self.lag_seconds: float | None = None
+        self.last_apply_delay_seconds: float | None = None
+        self._lag_checked = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "processed": self.processed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "lagSeconds": self.lag_seconds,
+            "lastApplyDelaySeconds": self.last_apply_delay_seconds,
+        }
+
+    async def run(self, stop: asyncio.Event):
+        log.info("Outbox worker started.")
+        while not stop.is_set():
+            try:
+                await self._refresh_lag()
+                batch = await self._claim_batch()
+            except Exception as e:
+                log.warning("Outbox poll failed, retrying. Details: %s", e)
+                batch = []
+            if batch:
+                await asyncio.gather(*(self._apply(doc) for doc in batch), return_exceptions=True)
+                continue
+            # Idle: sleep until the poll interval elapses, an enqueue wakes us, or shutdown
+            self.wake.clear()
+            waiters = [asyncio.create_task(stop.wait()), asyncio.create_task(self.wake.wait())]
+            await asyncio.wait(waiters, timeout=settings.OUTBOX_POLL_SECONDS,
+                               return_when=asyncio.FIRST_COMPLETED)
+            for w in waiters:
+                w.cancel()
+        log.info("Outbox worker stopped.")
+
+    async def _claim_batch(self) -> list[dict]:
+        now = utcnow()
+        claimable = {"$or": [
+            {"status": "pending", "availableAt": {"$lte": now}},
+            {"status": "processing", "leaseUntil": {"$lt": now}},
+        ]}
+        ids = [d["_id"] async for d in self.db.outbox.find(claimable, {"_id": 1})
+               .sort("availableAt", 1).limit(settings.OUTBOX_BATCH_SIZE)]
+        if not ids:
+            return []
+        token = new_id("claim")
+        lease = now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+        await self.db.outbox.update_many(
+            {"_id": {"$in": ids}, **claimable},
+            {"$set": {"status": "processing", "claim": token, "leaseUntil": lease},
+             "$inc": {"attempts": 1}},
+        )
+        return [d async for d in self.db.outbox.find({"claim": token})]
+
+    async def _apply(self, doc: dict):
+        async with self._sem:
+            try:
+                await HANDLERS[doc["kind"]](self.db, doc["payload"])
+            except Exception as e:
+                await self._fail(doc, e)
+                return
+            # Applied entries are removed so the claim scan stays small
+            await self.db.outbox.delete_one({"_id": doc["_id"], "claim": doc["claim"]})
+            self.processed += 1
+            self.last_apply_delay_seconds = round((utcnow() - doc["createdAt"]).total_seconds(), 3)
+
+    async def _fail(self, doc: dict, error: Exception):
+        attempts = doc.get("attempts", 1)
+        if attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            self.failed += 1
+            log.error("Outbox entry %s (%s) failed permanently: %s", doc["_id"], doc["kind"], error)
+            update = {"status": "failed", "lastError": str(error)}
+        else:
+            self.retried += 1
+            delay = min(settings.OUTBOX_BACKOFF_BASE_SECONDS * 2 ** (attempts - 1),
+                        settings.OUTBOX_BACKOFF_MAX_SECONDS)
+            retry_at = utcnow() + timedelta(seconds=delay)
+            update = {"status": "pending", "availableAt": retry_at, "lastError": str(error)}
+        await self.db.outbox.update_one({"_id": doc["_id"], "claim": doc["claim"]}, {"$set": update})
+
+    async def _refresh_lag(self):
+        # Age of the oldest entry still waiting; checked at most every OUTBOX_LAG_INTERVAL_SECONDS
+        if time.monotonic() - self._lag_checked < settings.OUTBOX_LAG_INTERVAL_SECONDS:
+            return
+        self._lag_checked = time.monotonic()
+        oldest = await self.db.outbox.find_one(
+            {"status": {"$in": ["pending", "processing"]}}, {"createdAt": 1}, sort=[("createdAt", 1)])
+        if oldest is None:
+            self.lag_seconds = 0.0
+            return
+        self.lag_seconds = round((utcnow() - oldest["createdAt"]).total_seconds(), 3)
+        log.info("Outbox lag %.1fs (processed=%d retried=%d failed=%d)",
+                 self.lag_seconds, self.processed, self.retried, self.failed)
+
+
+_worker: OutboxWorker | None = None
+
+
+async def run_worker(db, stop: asyncio.Event):
+    global _worker
+    _worker = OutboxWorker(db)
+    metrics.register("outbox", _worker.stats)
+    await _worker.run(stop)
@@ -0,0 +1,152 @@
+"""
+On-demand sampling profiler (`GET /admin/profile`, PROFILER_ENABLED).
+
+While a profile runs, a daemon thread wakes every PROFILER_INTERVAL_MS, reads the
+current frame of the event-loop thread and of the executor threads (Motor's pymongo
+calls, run_in_executor work) via sys._current_frames(), and counts each stack. Nothing
+is installed in the interpreter (no settrace/setprofile), so code runs at full speed
+between samples; the cost is the time the sampler holds the GIL, which is measured and
+returned. One profile at a time per worker, at most PROFILER_MAX_SECONDS long.
+
+The result is collapsed stacks ("role;outer;...;inner count", the input format of
+flamegraph.pl and speedscope) plus a dump of the loop's asyncio tasks at the end.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from app.core.config import settings
+
+_lock = asyncio.Lock()
+_labels: dict = {}
+
+# Executor worker threads: concurrent.futures (Motor, labels) and asyncio's default executor
+EXECUTOR_PREFIXES = ("ThreadPoolExecutor", "asyncio_")
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _short(path: str) -> str:
+    marker = "site-packages" + os.sep
+    if marker in path:
+        return path.split(marker, 1)[1]
+    cwd = os.getcwd() + os.sep
+    return path[len(cwd):] if path.startswith(cwd) else os.path.basename(path)
+
+
+def _label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        label = _labels[code] = f"{code.co_name} ({_short(code.co_filename)}:{code.co_firstlineno})"
+    return label
+
+
+def _stack(frame, max_depth: int) -> tuple[str, ...]:
+    labels = []
+    while frame is not None and len(labels) < max_depth:
+        labels.append(_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return tuple(labels)
+
+
+def _idle(role: str, frame) -> bool:
+    code = frame.f_code
+    if role == "event-loop":
+        # Waiting in the selector for I/O
+        return code.co_name in ("select", "poll") and code.co_filename.endswith("selectors.py")
+    # Executor worker waiting for its next work item
+    return code.co_name == "_worker" and code.co_filename.endswith(os.path.join("concurrent", "futures", "thread.py"))
+
+
+class Sampler:
+    def __init__(self, loop_thread: int, interval: float, max_depth: int):
+        self.loop_thread = loop_thread
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.busy = Counter()
+        self.overhead = 0.0
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+
+    def _roles(self) -> dict[int, str]:
+        roles = {self.loop_thread: "event-loop"}
+        for t in threading.enumerate():
+            if t.ident != self.loop_thread and t.name.startswith(EXECUTOR_PREFIXES):
+                roles[t.ident] = "executor"
+        return roles
+
+    def _run(self):
+        while not self.stop.wait(self.interval):
+            t0 = time.perf_counter()
+            roles = self._roles()
+            for ident, frame in sys._current_frames().items():
+                role = roles.get(ident)
+                if role is None:
+                    continue
+                if _idle(role, frame):
+                    if role == "event-loop":
+                        self.stacks[(role, "(idle)")] += 1
+                    continue
+                self.busy[role] += 1
+                # Executor threads are folded together under one root
+                self.stacks[(role,) + _stack(frame, self.max_depth)] += 1
+            self.samples += 1
+            self.overhead += time.perf_counter() - t0
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{';'.join(stack)} {n}" for stack, n in self.stacks.most_common())
+
+
+def _task_dump(loop, max_depth: int) -> list[dict]:
+    out = []
+    for task in asyncio.all_tasks(loop):
+        coro = task.get_coro()
+        out.append({
+            "name": task.get_name(),
+            "coro": getattr(coro, "__qualname__", repr(coro)),
+            "done": task.done(),
+            # Innermost await last
+            "stack": [_label(f.f_code) + f" line {f.f_lineno}" for f in task.get_stack(limit=max_depth)],
+        })
+    out.sort(key=lambda t: t["name"])
+    return out
+
+
+async def profile(seconds: float, interval_ms: float) -> dict:
+    """Sample this worker for `seconds`; the loop keeps serving requests meanwhile."""
+    if _lock.locked():
+        raise ProfilerBusy()
+    async with _lock:
+        loop = asyncio.get_running_loop()
+        interval = max(interval_ms, 1.0) / 1000
+        sampler = Sampler(threading.get_ident(), interval, settings.PROFILER_MAX_DEPTH)
+        started = time.perf_counter()
+        sampler.thread.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            sampler.stop.set()
+            await loop.run_in_executor(None, sampler.thread.join)
+        elapsed = time.perf_counter() - started
+        samples = sampler.samples
+        return {
+            "pid": os.getpid(),
+            "seconds": round(elapsed, 3),
+            "intervalMs": interval * 1000,
+            "samples": samples,
+            # Share of samples in which the thread was running code (not waiting)
+            "loopBusy": round(sampler.busy["event-loop"] / samples, 3) if samples else 0.0,
+            "executorBusySamples": sampler.busy["executor"],
+            "overheadMs": round(sampler.overhead * 1000, 1),
+            "overheadPct": round(sampler.overhead / elapsed * 100, 2) if elapsed else 0.0,
+            "collapsed": sampler.collapsed(),
+            "tasks": _task_dump(loop, settings.PROFILER_MAX_DEPTH),
+        }
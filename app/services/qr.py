@@ -1,30 +1,184 @@
+import logging
 import time
 import hmac
 import hashlib
 import base64
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+from app.core import metrics
 from app.core.config import settings
 
+log = logging.getLogger("uvicorn.error")
+
+# Keyed HMAC state prepared once per secret; signing and verifying copy it instead of re-keying
+_template: tuple[str, "hmac.HMAC"] | None = None
+
+
+def _mac_template() -> "hmac.HMAC":
+    global _template
+    secret = settings.QR_HMAC_SECRET
+    if _template is None or _template[0] != secret:
+        _template = (secret, hmac.new(secret.encode(), digestmod=hashlib.sha256))
+    return _template[1]
+
+
+def _mac(container_id: str, ts: int) -> str:
+    mac = _mac_template().copy()
+    mac.update(f"{container_id}.{ts}".encode())
+    return base64.urlsafe_b64encode(mac.digest()).decode().rstrip("=")
+
 
 def sign_action(container_id: str, now: int | None = None) -> str:
     now = now or int(time.time())
-    msg = f"{container_id}.{now}".encode()
-    mac = hmac.new(settings.QR_HMAC_SECRET.encode(),
-                   msg, hashlib.sha256).digest()
-    tok = base64.urlsafe_b64encode(mac).decode().rstrip("=")
-    return f"{now}.{tok}"
+    return f"{now}.{_mac(container_id, now)}"
 
 
-def verify_action(container_id: str, token: str) -> bool:
+def check_action(container_id: str, token: str, now: int | None = None) -> tuple[int, str] | str:
+    """(ts, mac) of a valid token, or the reason it is not: malformed, expired, bad_signature."""
     try:
         ts_str, mac_b64 = token.split(".", 1)
         ts = int(ts_str)
-        if int(time.time()) - ts > settings.QR_SIG_TTL_SECONDS:
+    except (AttributeError, ValueError):
+        return "malformed"
+    if (now or int(time.time())) - ts > settings.QR_SIG_TTL_SECONDS:
+        return "expired"
+    if not hmac.compare_digest(mac_b64.encode(), _mac(container_id, ts).encode()):
+        return "bad_signature"
+    return ts, mac_b64
+
+
+def verify_action(container_id: str, token: str) -> bool:
+    return not isinstance(check_action(container_id, token), str)
+
+
+class ReplayCache:
+    """
+    Consumed (containerId, ts, mac) tuples until their token expires. Bounded: when
+    full, the oldest entries go first (tokens carry their own expiry, so an evicted
+    entry is at worst replayable until then).
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries: OrderedDict[str, int] = OrderedDict()
+        self.replays = 0
+        self.evicted = 0
+
+    def _prune(self, now: int):
+        while self.entries:
+            key, expires = next(iter(self.entries.items()))
+            if expires > now and len(self.entries) <= self.max_size:
+                break
+            self.entries.popitem(last=False)
+            if expires > now:
+                self.evicted += 1
+
+    def seen(self, key: str, now: int) -> bool:
+        expires = self.entries.get(key)
+        return expires is not None and expires > now
+
+    def consume(self, key: str, expires: int, now: int) -> bool:
+        """False if the key was already consumed."""
+        if self.seen(key, now):
+            self.replays += 1
             return False
-        msg = f"{container_id}.{ts}".encode()
-        expected = base64.urlsafe_b64encode(
-            hmac.new(settings.QR_HMAC_SECRET.encode(),
-                     msg, hashlib.sha256).digest()
-        ).decode().rstrip("=")
-        return hmac.compare_digest(mac_b64, expected)
-    except Exception:
+        self.entries[key] = expires
+        self._prune(now)
+        return True
+
+    def release(self, key: str):
+        self.entries.pop(key, None)
+
+    def stats(self) -> dict:
+        return {"store": settings.QR_REPLAY_STORE, "entries": len(self.entries),
+                "replays": self.replays, "evicted": self.evicted}
+
+
+_replay: ReplayCache | None = None
+
+
+def get_replay_cache() -> ReplayCache:
+    global _replay
+    if _replay is None:
+        _replay = ReplayCache(settings.QR_REPLAY_CACHE_SIZE)
+        metrics.register("qr_replay", _replay.stats)
+    return _replay
+
+
+def _replay_key(container_id: str, ts: int, mac: str) -> str:
+    return f"{container_id}.{ts}.{mac}"
+
+
+async def _consume(db, key: str, ts: int, now: int) -> bool:
+    cache = get_replay_cache()
+    expires = ts + settings.QR_SIG_TTL_SECONDS
+    if not cache.consume(key, expires, now):
         return False
+    if settings.QR_REPLAY_STORE == "mongo":
+        # Shared across instances; the TTL index drops the document once the token expired
+        try:
+            await db.qr_consumed.insert_one(
+                {"_id": key, "expiresAt": datetime.fromtimestamp(expires, timezone.utc)})
+        except DuplicateKeyError:
+            cache.replays += 1
+            return False
+    return True
+
+
+async def consume_action(db, container_id: str, token: str) -> str | None:
+    """Verify and mark a token used. None if it may be acted on, else the reason (incl. replayed)."""
+    now = int(time.time())
+    checked = check_action(container_id, token, now)
+    if isinstance(checked, str):
+        return checked
+    if settings.QR_REPLAY_STORE == "off":
+        return None
+    ts, mac = checked
+    if not await _consume(db, _replay_key(container_id, ts, mac), ts, now):
+        return "replayed"
+    return None
+
+
+async def release_action(db, container_id: str, token: str):
+    """Undo consume_action when the write the token was consumed for failed."""
+    checked = check_action(container_id, token, int(time.time()))
+    if isinstance(checked, str) or settings.QR_REPLAY_STORE == "off":
+        return
+    key = _replay_key(container_id, *checked)
+    get_replay_cache().release(key)
+    if settings.QR_REPLAY_STORE == "mongo":
+        try:
+            await db.qr_consumed.delete_one({"_id": key})
+        except Exception as e:
+            log.warning("Could not release QR token %s, it stays used: %s", key, e)
+
+
+async def verify_many(db, items: list[tuple[str, str]], consume: bool = False) -> list[str | None]:
+    """Reason per (containerId, token) like consume_action; without consume, tokens stay usable."""
+    now = int(time.time())
+    checked = [check_action(cid, tok, now) for cid, tok in items]
+    keys = [None if isinstance(c, str) else _replay_key(cid, *c) for (cid, _), c in zip(items, checked)]
+    reasons: list[str | None] = [c if isinstance(c, str) else None for c in checked]
+    if settings.QR_REPLAY_STORE == "off":
+        return reasons
+
+    cache = get_replay_cache()
+    used = {k for k in keys if k and cache.seen(k, now)}
+    if settings.QR_REPLAY_STORE == "mongo":
+        pending = [k for k in keys if k and k not in used]
+        if pending:
+            used.update([d["_id"] async for d in db.qr_consumed.find({"_id": {"$in": pending}}, {"_id": 1})])
+    for i, key in enumerate(keys):
+        if key is None:
+            continue
+        if key in used:
+            reasons[i] = "replayed"
+        elif consume:
+            if await _consume(db, key, checked[i][0], now):
+                used.add(key)
+            else:
+                reasons[i] = "replayed"
+    return reasons
@@ -0,0 +1,358 @@
+"""
+Self-contained QR code encoder (ISO/IEC 18004, byte mode) with SVG output.
+
+Only what label printing needs: byte-mode payloads, error correction levels
+L/M/Q/H, versions 1-40 and automatic mask selection. Pure functions on plain
+lists so they can run in a worker process (see app/services/labels.py).
+"""
+from xml.sax.saxutils import escape
+
+# Error correction codewords per block and number of blocks, indexed [level][version]
+_ECC_PER_BLOCK = {
+    "L": (-1, 7, 10, 15, 20, 26, 18, 20, 24, 30, 18, 20, 24, 26, 30, 22, 24, 28, 30, 28, 28,
+          28, 28, 30, 30, 26, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+    "M": (-1, 10, 16, 26, 18, 24, 16, 18, 22, 22, 26, 30, 22, 22, 24, 24, 28, 28, 26, 26, 26,
+          26, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28),
+    "Q": (-1, 13, 22, 18, 26, 18, 24, 18, 22, 20, 24, 28, 26, 24, 20, 30, 24, 28, 28, 26, 30,
+          28, 30, 30, 30, 30, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+    "H": (-1, 17, 28, 22, 16, 22, 28, 26, 26, 24, 28, 24, 28, 22, 24, 24, 30, 28, 28, 26, 28,
+          30, 24, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+}
+_NUM_BLOCKS = {
+    "L": (-1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 4, 4, 4, 4, 4, 6, 6, 6, 6, 7, 8,
+          8, 9, 9, 10, 12, 12, 12, 13, 14, 15, 16, 17, 18, 19, 19, 20, 21, 22, 24, 25),
+    "M": (-1, 1, 1, 1, 2, 2, 4, 4, 4, 5, 5, 5, 8, 9, 9, 10, 10, 11, 13, 14, 16,
+          17, 17, 18, 20, 21, 23, 25, 26, 28, 29, 31, 33, 35, 37, 38, 40, 43, 45, 47, 49),
+    "Q": (-1, 1, 1, 2, 2, 4, 4, 6, 6, 8, 8, 8, 10, 12, 16, 12, 17, 16, 18, 21, 20,
+          23, 23, 25, 27, 29, 34, 34, 35, 38, 40, 43, 45, 48, 51, 53, 56, 59, 62, 65, 68),
+    "H": (-1, 1, 1, 2, 4, 4, 4, 5, 6, 8, 8, 11, 11, 16, 16, 18, 16, 19, 21, 25, 25,
+          25, 34, 30, 32, 35, 37, 40, 42, 45, 48, 51, 54, 57, 60, 63, 66, 70, 74, 77, 81),
+}
+_FORMAT_BITS = {"L": 1, "M": 0, "Q": 3, "H": 2}
+
+_MASKS = (
+    lambda x, y: (x + y) % 2 == 0,
+    lambda x, y: y % 2 == 0,
+    lambda x, y: x % 3 == 0,
+    lambda x, y: (x + y) % 3 == 0,
+    lambda x, y: (x // 3 + y // 2) % 2 == 0,
+    lambda x, y: x * y % 2 + x * y % 3 == 0,
+    lambda x, y: (x * y % 2 + x * y % 3) % 2 == 0,
+    lambda x, y: ((x + y) % 2 + x * y % 3) % 2 == 0,
+)
+
+
+class DataTooLong(ValueError):
+    pass
+
+
+def _raw_modules(version: int) -> int:
+    """Data + ECC bits available in a symbol (everything but function patterns)."""
+    n = (16 * version + 128) * version + 64
+    if version >= 2:
+        align = version // 7 + 2
+        n -= (25 * align - 10) * align - 55
+        if version >= 7:
+            n -= 36
+    return n
+
+
+def _data_codewords(version: int, ecl: str) -> int:
+    return _raw_modules(version) // 8 - _ECC_PER_BLOCK[ecl][version] * _NUM_BLOCKS[ecl][version]
+
+
+# --- Reed-Solomon over GF(2^8), polynomial 0x11D ---
+
+def _gf_mul(x: int, y: int) -> int:
+    z = 0
+    for i in range(7, -1, -1):
+        z = (z << 1) ^ ((z >> 7) * 0x11D)
+        z ^= ((y >> i) & 1) * x
+    return z
+
+
+def _rs_divisor(degree: int) -> list[int]:
+    result = [0] * (degree - 1) + [1]
+    root = 1
+    for _ in range(degree):
+        for j in range(degree):
+            result[j] = _gf_mul(result[j], root)
+            if j + 1 < degree:
+                result[j] ^= result[j + 1]
+        root = _gf_mul(root, 0x02)
+    return result
+
+
+def _rs_remainder(data: list[int], divisor: list[int]) -> list[int]:
+    result = [0] * len(divisor)
+    for b in data:
+        factor = b ^ result.pop(0)
+        result.append(0)
+        for i, coef in enumerate(divisor):
+            result[i] ^= _gf_mul(coef, factor)
+    return result
+
+
+# --- Codewords ---
+
+def _codewords(data: bytes, version: int, ecl: str) -> list[int]:
+    capacity = _data_codewords(version, ecl) * 8
+    bits: list[int] = []
+
+    def put(value: int, n: int):
+        bits.extend((value >> i) & 1 for i in range(n - 1, -1, -1))
+
+    put(0b0100, 4)  # byte mode
+    put(len(data), 8 if version <= 9 else 16)
+    for b in data:
+        put(b, 8)
+    put(0, min(4, capacity - len(bits)))
+    put(0, -len(bits) % 8)
+    out = [int("".join(map(str, bits[i:i + 8])), 2) for i in range(0, len(bits), 8)]
+    pad = 0xEC
+    while len(out) < capacity // 8:
+        out.append(pad)
+        pad ^= 0xEC ^ 0x11
+    return _add_ecc(out, version, ecl)
+
+
+def _add_ecc(out: list[int], version: int, ecl: str) -> list[int]:
+    # Split into blocks, append ECC to each, then interleave
+    num_blocks = _NUM_BLOCKS[ecl][version]
+    ecc_len = _ECC_PER_BLOCK[ecl][version]
+    raw = _raw_modules(version) // 8
+    num_short = num_blocks - raw % num_blocks
+    short_len = raw // num_blocks
+    divisor = _rs_divisor(ecc_len)
+    blocks = []
+    k = 0
+    for i in range(num_blocks):
+        dat = out[k:k + short_len - ecc_len + (0 if i < num_short else 1)]
+        k += len(dat)
+        ecc = _rs_remainder(dat, divisor)
+        if i < num_short:
+            dat.append(0)
+        blocks.append(dat + ecc)
+    result = []
+    for i in range(len(blocks[0])):
+        for j, block in enumerate(blocks):
+            # Skip the padding byte of short blocks
+            if i != short_len - ecc_len or j >= num_short:
+                result.append(block[i])
+    return result
+
+
+# --- Matrix ---
+
+def _alignment_positions(version: int) -> list[int]:
+    if version == 1:
+        return []
+    size = version * 4 + 17
+    count = version // 7 + 2
+    step = (version * 8 + count * 3 + 5) // (count * 4 - 4) * 2
+    return [6] + [size - 7 - i * step for i in range(count - 1)][::-1]
+
+
+class _Symbol:
+    def __init__(self, version: int, ecl: str):
+        self.version = version
+        self.ecl = ecl
+        self.size = version * 4 + 17
+        self.modules = [[False] * self.size for _ in range(self.size)]
+        self.function = [[False] * self.size for _ in range(self.size)]
+        self._draw_function_patterns()
+
+    def _set(self, x: int, y: int, dark: bool):
+        self.modules[y][x] = dark
+        self.function[y][x] = True
+
+    def _draw_function_patterns(self):
+        size = self.size
+        for i in range(size):
+            self._set(6, i, i % 2 == 0)
+            self._set(i, 6, i % 2 == 0)
+        for cx, cy in ((3, 3), (size - 4, 3), (3, size - 4)):
+            for dy in range(-4, 5):
+                for dx in range(-4, 5):
+                    x, y = cx + dx, cy + dy
+                    if 0 <= x < size and 0 <= y < size:
+                        self._set(x, y, max(abs(dx), abs(dy)) not in (2, 4))
+        positions = _alignment_positions(self.version)
+        last = len(positions) - 1
+        for i, cy in enumerate(positions):
+            for j, cx in enumerate(positions):
+                # Corners taken by finder patterns
+                if (i, j) in ((0, 0), (0, last), (last, 0)):
+                    continue
+                for dy in range(-2, 3):
+                    for dx in range(-2, 3):
+                        self._set(cx + dx, cy + dy, max(abs(dx), abs(dy)) != 1)
+        self._draw_format_bits(0)  # reserve; redrawn with the chosen mask
+        if self.version >= 7:
+            rem = self.version
+            for _ in range(12):
+                rem = (rem << 1) ^ ((rem >> 11) * 0x1F25)
+            bits = self.version << 12 | rem
+            for i in range(18):
+                dark = (bits >> i) & 1 == 1
+                a, b = size - 11 + i % 3, i // 3
+                self._set(a, b, dark)
+                self._set(b, a, dark)
+
+    def _draw_format_bits(self, mask: int):
+        data = _FORMAT_BITS[self.ecl] << 3 | mask
+        rem = data
+        for _ in range(10):
+            rem = (rem << 1) ^ ((rem >> 9) * 0x537)
+        bits = (data << 10 | rem) ^ 0x5412
+
+        def bit(i):
+            return (bits >> i) & 1 == 1
+
+        size = self.size
+        for i in range(6):
+            self._set(8, i, bit(i))
+        self._set(8, 7, bit(6))
+        self._set(8, 8, bit(7))
+        self._set(7, 8, bit(8))
+        for i in range(9, 15):
+            self._set(14 - i, 8, bit(i))
+        for i in range(8):
+            self._set(size - 1 - i, 8, bit(i))
+        for i in range(8, 15):
+            self._set(8, size - 15 + i, bit(i))
+        self._set(8, size - 8, True)
+
+    def draw_codewords(self, codewords: list[int]):
+        size = self.size
+        total = len(codewords) * 8
+        i = 0
+        right = size - 1
+        while right >= 1:
+            if right == 6:
+                right = 5
+            upward = (right + 1) & 2 == 0
+            for vert in range(size):
+                y = size - 1 - vert if upward else vert
+                for x in (right, right - 1):
+                    if not self.function[y][x] and i < total:
+                        self.modules[y][x] = (codewords[i >> 3] >> (7 - (i & 7))) & 1 == 1
+                        i += 1
+            right -= 2
+
+    def apply_mask(self, mask: int):
+        fn = _MASKS[mask]
+        for y in range(self.size):
+            row, frow = self.modules[y], self.function[y]
+            for x in range(self.size):
+                if not frow[x] and fn(x, y):
+                    row[x] = not row[x]
+
+
+def _penalty(modules: list[list[bool]]) -> int:
+    size = len(modules)
+    rows = ["".join("1" if m else "0" for m in row) for row in modules]
+    cols = ["".join(row[x] for row in rows) for x in range(size)]
+    score = 0
+    for line in rows + cols:
+        # N1: runs of 5+ same-colour modules
+        run, prev = 0, None
+        for c in line:
+            if c == prev:
+                run += 1
+            else:
+                if run >= 5:
+                    score += run - 2
+                run, prev = 1, c
+        if run >= 5:
+            score += run - 2
+        # N3: finder-like 1:1:3:1:1 pattern with 4 light modules on either side
+        padded = "0000" + line + "0000"
+        for pattern in ("10111010000", "00001011101"):
+            start = padded.find(pattern)
+            while start != -1:
+                score += 40
+                start = padded.find(pattern, start + 1)
+    # N2: 2x2 blocks of one colour
+    for y in range(size - 1):
+        a, b = rows[y], rows[y + 1]
+        for x in range(size - 1):
+            if a[x] == a[x + 1] == b[x] == b[x + 1]:
+                score += 3
+    # N4: dark/light balance
+    dark = sum(r.count("1") for r in rows)
+    total = size * size
+    score += ((abs(dark * 20 - total * 10) + total - 1) // total - 1) * 10
+    return score
+
+
+def encode(data: bytes | str, ecl: str = "M", mask: int | None = None) -> list[list[bool]]:
+    """Module matrix (rows of booleans, True = dark) for the smallest version that fits."""
+    if isinstance(data, str):
+        data = data.encode()
+    for version in range(1, 41):
+        header_bits = 4 + (8 if version <= 9 else 16)
+        if header_bits + len(data) * 8 <= _data_codewords(version, ecl) * 8:
+            break
+    else:
+        raise DataTooLong(f"{len(data)} bytes do not fit in a QR code at level {ecl}")
+
+    symbol = _Symbol(version, ecl)
+    symbol.draw_codewords(_codewords(data, version, ecl))
+    if mask is None:
+        best = None
+        for m in range(8):
+            symbol.apply_mask(m)
+            symbol._draw_format_bits(m)
+            p = _penalty(symbol.modules)
+            if best is None or p < best[0]:
+                best = (p, m)
+            symbol.apply_mask(m)  # XOR again to undo
+        mask = best[1]
+    symbol.apply_mask(mask)
+    symbol._draw_format_bits(mask)
+    return symbol.modules
+
+
+def svg_path(modules: list[list[bool]], offset: int = 0) -> str:
+    """Path data drawing every dark module; horizontal runs are merged into one rectangle."""
+    parts = []
+    for y, row in enumerate(modules):
+        x = 0
+        size = len(row)
+        while x < size:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < size and row[x]:
+                x += 1
+            parts.append(f"M{start + offset} {y + offset}h{x - start}v1h{start - x}z")
+    return "".join(parts)
+
+
+def render_paths(contents: list[str], ecl: str = "M", border: int = 4) -> list[tuple[str, int]]:
+    """
+    (path data, symbol size incl. quiet zone) per payload. This is the CPU-heavy part
+    and is what runs in the worker processes.
+    """
+    out = []
+    for content in contents:
+        modules = encode(content, ecl)
+        out.append((svg_path(modules, border), len(modules) + 2 * border))
+    return out
+
+
+def svg_element(path: str, size: int, caption: str | None = None, attrs: str = "") -> str:
+    """An <svg> for one symbol (`size` units square plus caption); `attrs` places it in a sheet."""
+    height = size + (4 if caption else 0)
+    text = (f'<text x="{size / 2:g}" y="{size + 2.5:g}" font-family="monospace" font-size="2.4" '
+            f'text-anchor="middle">{escape(caption)}</text>') if caption else ""
+    return (f'<svg xmlns="http://www.w3.org/2000/svg"{attrs} viewBox="0 0 {size} {height}" '
+            f'shape-rendering="crispEdges"><rect width="{size}" height="{height}" fill="#fff"/>'
+            f'<path d="{path}" fill="#000"/>{text}</svg>')
+
+
+def to_svg(data: bytes | str, ecl: str = "M", caption: str | None = None) -> str:
+    (path, size), = render_paths([data], ecl)
+    return svg_element(path, size, caption)
@@ -0,0 +1,41 @@
+import asyncio
+import logging
+import time
+
+from app.core.config import settings
+
+log = logging.getLogger("uvicorn.error")
+
+# Last background ping result; /ready only reads this, it never touches Mongo itself.
+_state: dict = {"ok": False, "checkedAt": None, "latencyMs": None, "error": "not checked yet"}
+_checked_monotonic: float | None = None
+
+
+async def run_probe(db, stop: asyncio.Event):
+    global _checked_monotonic
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        try:
+            await asyncio.wait_for(db.ping(), timeout=settings.READY_PING_TIMEOUT_SECONDS)
+            if not _state["ok"]:
+                log.info("Mongo reachable, instance ready.")
+            _state.update(ok=True, error=None, latencyMs=round((time.perf_counter() - t0) * 1000, 1))
+        except Exception as e:
+            if _state["ok"]:
+                log.warning("Mongo ping failed, instance not ready. Details: %s", e)
+            _state.update(ok=False, error=str(e) or type(e).__name__, latencyMs=None)
+        _state["checkedAt"] = time.time()
+        _checked_monotonic = time.monotonic()
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.READY_PING_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+def status(db) -> tuple[bool, dict]:
+    stale = (
+        _checked_monotonic is None
+        or time.monotonic() - _checked_monotonic > settings.READY_PING_INTERVAL_SECONDS * 3
+    )
+    ready = _state["ok"] and not stale
+    return ready, {"ready": ready, "stale": stale, "db": dict(_state), "pool": db.pool_status()}
@@ -0,0 +1,265 @@
+"""
+Type-ahead search over households and signups.
+
+Each document stores `searchKeys`, a list of normalized, field-tagged tokens:
+
+    n:<name token>   a:<address token>   p:<phone digits>   v:<villa>   cv:<community><villa>
+
+A query term becomes anchored regexes ("^n:ahm", "^a:ahm", ...) on the multikey
+`searchKeys` index, i.e. bounded index range scans. With SEARCH_NGRAM_ENABLED the
+same keys also feed an in-process trigram index that answers infix queries without
+touching Mongo.
+"""
+import asyncio
+import logging
+import re
+import time
+import unicodedata
+
+from app.core import metrics
+from app.core.config import settings
+
+log = logging.getLogger("uvicorn.error")
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# Exact key hits outrank prefix hits; names/phones/villas outrank address words.
+_FIELD_WEIGHT = {"n": 3.0, "p": 3.0, "v": 2.5, "cv": 2.5, "a": 1.0}
+
+# Fields returned with each hit (and the only ones the search query reads)
+DISPLAY_FIELDS = {
+    "households": ("primaryContact", "villaNumber", "community", "addressText", "status"),
+    "signups": ("fullName", "phone", "villaNumber", "community", "addressText", "status"),
+}
+
+
+def normalize(text) -> str:
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", str(text))
+    return "".join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def tokens(text) -> list[str]:
+    return _TOKEN.findall(normalize(text))
+
+
+def digits(text) -> str:
+    return "".join(c for c in str(text or "") if c.isdigit())
+
+
+def search_keys(kind: str, doc: dict) -> list[str]:
+    """searchKeys for a household or signup document (kind = collection name)."""
+    if kind == "households":
+        name = (doc.get("primaryContact") or {}).get("fullName")
+        phone = (doc.get("primaryContact") or {}).get("phone")
+    else:
+        name, phone = doc.get("fullName"), doc.get("phone")
+    keys = [f"n:{t}" for t in tokens(name)]
+    keys += [f"a:{t}" for t in tokens(doc.get("addressText"))]
+    phone_digits = digits(phone).lstrip("0")
+    if phone_digits:
+        keys.append(f"p:{phone_digits}")
+        # National number without the country code, so "050 123..." finds "+971 50 123..."
+        if len(phone_digits) > 9:
+            keys.append(f"p:{phone_digits[-9:]}")
+    villa = "".join(tokens(doc.get("villaNumber")))
+    if villa:
+        keys.append(f"v:{villa}")
+        community = "".join(tokens(doc.get("community")))
+        if community:
+            keys.append(f"cv:{community}{villa}")
+    return list(dict.fromkeys(keys))
+
+
+def with_search_keys(kind: str, doc: dict) -> dict:
+    doc["searchKeys"] = search_keys(kind, doc)
+    return doc
+
+
+def query_terms(q: str) -> list[str]:
+    # A query without letters is a phone or villa number: keep its digits together
+    if not any(c.isalpha() for c in q):
+        d = digits(q)
+        return [d] if d else []
+    return tokens(q)[:5]
+
+
+def _prefixes(term: str) -> list[tuple[str, str]]:
+    """(field, value prefix) pairs a term may match."""
+    if term.isdigit():
+        pairs = [("v", term)]
+        if term.lstrip("0"):
+            pairs.append(("p", term.lstrip("0")))
+        return pairs
+    return [("n", term), ("a", term), ("v", term), ("cv", term)]
+
+
+def mongo_query(terms: list[str]) -> dict:
+    # One anchored regex per (field, prefix): each is a bounded scan of the searchKeys index
+    clauses = [
+        {"searchKeys": {"$in": [re.compile(f"^{f}:{re.escape(p)}") for f, p in _prefixes(t)]}}
+        for t in terms
+    ]
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def score(keys, terms: list[str]) -> float:
+    total = 0.0
+    for term in terms:
+        best = 0.0
+        for field, prefix in _prefixes(term):
+            for key in keys:
+                kf, _, value = key.partition(":")
+                if kf == field and value.startswith(prefix):
+                    best = max(best, _FIELD_WEIGHT[field] * (2.0 if value == prefix else 1.0))
+        total += best
+    return total
+
+
+def hit(kind: str, doc: dict, s: float) -> dict:
+    if kind == "households":
+        contact = doc.get("primaryContact") or {}
+        label, phone = contact.get("fullName"), contact.get("phone")
+    else:
+        label, phone = doc.get("fullName"), doc.get("phone")
+    return {
+        "type": kind[:-1],
+        "id": doc["_id"],
+        "label": label,
+        "phone": phone,
+        "villaNumber": doc.get("villaNumber"),
+        "community": doc.get("community"),
+        "addressText": doc.get("addressText"),
+        "status": doc.get("status"),
+        "score": round(s, 2),
+    }
+
+
+def rank(hits: list[dict], limit: int) -> list[dict]:
+    hits.sort(key=lambda h: (-h["score"], (h["label"] or "").lower(), h["id"]))
+    return hits[:limit]
+
+
+async def search_mongo(db, kinds: list[str], terms: list[str], limit: int) -> list[dict]:
+    q = mongo_query(terms)
+    # Over-fetch a little so ranking has something to choose from, but stay bounded
+    fetch = min(limit * 3, 200)
+
+    async def one(kind: str):
+        projection = {"searchKeys": 1, **{f: 1 for f in DISPLAY_FIELDS[kind]}}
+        return kind, [d async for d in db.db[kind].find(q, projection).limit(fetch)]
+
+    hits = []
+    for kind, docs in await asyncio.gather(*(one(k) for k in kinds)):
+        hits += [hit(kind, d, score(d.get("searchKeys") or [], terms)) for d in docs]
+    return rank(hits, limit)
+
+
+class NgramIndex:
+    """
+    In-memory trigram index over searchKeys values. Matches terms anywhere inside a
+    key (e.g. "1234" inside a phone number), rebuilt periodically from Mongo and
+    updated in-process by this instance's writes.
+    """
+
+    def __init__(self):
+        self.docs: dict[tuple[str, str], dict] = {}
+        self.grams: dict[str, set[tuple[str, str]]] = {}
+        self.ready = False
+        self.built_at: float | None = None
+
+    @staticmethod
+    def _grams(value: str) -> set[str]:
+        return {value[i:i + 3] for i in range(len(value) - 2)}
+
+    def add(self, kind: str, doc: dict):
+        ref = (kind, doc["_id"])
+        self.remove(ref)
+        keys = doc.get("searchKeys") or search_keys(kind, doc)
+        self.docs[ref] = {**{f: doc.get(f) for f in DISPLAY_FIELDS[kind]}, "_id": doc["_id"], "searchKeys": keys}
+        for key in keys:
+            for g in self._grams(key.partition(":")[2]):
+                self.grams.setdefault(g, set()).add(ref)
+
+    def remove(self, ref: tuple[str, str]):
+        doc = self.docs.pop(ref, None)
+        if doc is None:
+            return
+        for key in doc["searchKeys"]:
+            for g in self._grams(key.partition(":")[2]):
+                refs = self.grams.get(g)
+                if refs is not None:
+                    refs.discard(ref)
+
+    def search(self, kinds: list[str], terms: list[str], limit: int) -> list[dict] | None:
+        """None when a term is too short for trigrams (caller falls back to Mongo)."""
+        # Phone keys are stored without leading zeros
+        terms = [t.lstrip("0") or t if t.isdigit() else t for t in terms]
+        if not self.ready or any(len(t) < 3 for t in terms):
+            return None
+        candidates = None
+        for term in terms:
+            refs = set.intersection(*(self.grams.get(g, set()) for g in self._grams(term)))
+            candidates = refs if candidates is None else candidates & refs
+            if not candidates:
+                return []
+        hits = []
+        for kind, _id in candidates:
+            if kind not in kinds:
+                continue
+            doc = self.docs[(kind, _id)]
+            values = [k.partition(":")[2] for k in doc["searchKeys"]]
+            if not all(any(t in v for v in values) for t in terms):
+                continue
+            # Prefix matches keep their weight; infix-only matches rank below them
+            s = score(doc["searchKeys"], terms) or 0.5 * len(terms)
+            hits.append(hit(kind, doc, s))
+        return rank(hits, limit)
+
+    async def rebuild(self, db):
+        fresh = NgramIndex()
+        for kind in DISPLAY_FIELDS:
+            projection = {"searchKeys": 1, **{f: 1 for f in DISPLAY_FIELDS[kind]}}
+            async for d in db.db[kind].find({}, projection):
+                fresh.add(kind, d)
+        self.docs, self.grams = fresh.docs, fresh.grams
+        self.ready = True
+        self.built_at = time.time()
+
+    def stats(self) -> dict:
+        return {"ready": self.ready, "docs": len(self.docs), "grams": len(self.grams), "builtAt": self.built_at}
+
+
+ngram_index = NgramIndex()
+
+
+def index_doc(kind: str, doc: dict):
+    """Called by write paths after inserting a household/signup."""
+    if settings.SEARCH_NGRAM_ENABLED and ngram_index.ready:
+        ngram_index.add(kind, doc)
+
+
+async def run_ngram_index(db, stop: asyncio.Event):
+    metrics.register("search", ngram_index.stats)
+    while not stop.is_set():
+        try:
+            await ngram_index.rebuild(db)
+            log.info("Search n-gram index built: %d documents.", len(ngram_index.docs))
+        except Exception as e:
+            log.warning("Search n-gram index build failed, serving from Mongo. Details: %s", e)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.SEARCH_NGRAM_REFRESH_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def search(db, q: str, kinds: list[str], limit: int) -> list[dict]:
+    terms = query_terms(q)
+    if not terms:
+        return []
+    if settings.SEARCH_NGRAM_ENABLED:
+        hits = ngram_index.search(kinds, terms, limit)
+        if hits is not None:
+            return hits
+    return await search_mongo(db, kinds, terms, limit)
@@ -1,90 +1,432 @@
-from datetime import datetime, timezone
-from motor.motor_asyncio import AsyncIOMotorClient
+"""
+Container swaps that complete a collection request (`POST /deployments/swap` and
+`/deployments/swap/batch`).
+
+A swap claims the installed container, the removed container, the household and the
+request, in that order, each with a compare-and-set on the version it was validated
+at; the ledger, deployment record and timeline follow once all four are claimed. A
+swap that loses any claim gets VersionConflict (409) and the claims it did win are
+undone, but only where the document still carries this swap's write.
+
+Where the deployment supports multi-document transactions (replica set, sharded
+cluster) each chunk of swaps runs in one, so nothing is left half-written if a write
+fails. Standalone servers run the same steps without one: a failed claim step undoes
+the chunk's claims, and if the follow-up writes fail once every claim has landed they
+are recorded in the outbox ("swaps.finish") and retried until they apply. The
+follow-ups are idempotent (deterministic ids, upserts), so a retry never duplicates
+them.
+
+A batch is validated up front against one `$in` read per collection and then written
+in chunks; the compare-and-sets of a chunk go out concurrently, one step at a time.
+"""
+import asyncio
+import logging
+
+from pymongo import UpdateOne
+
+from app.core import tracing
+from app.core.config import settings
 from app.dependencies.db import get_db
+from app.repositories.collection_requests import denormalized
+from app.services import counts, outbox, timeline
+from app.services.events import get_broker, request_event_payload
+from app.utils import versions
+from app.utils.time import utcnow
 
+log = logging.getLogger("uvicorn.error")
 
-async def perform_swap(payload: dict):
+# Claim order, with the tracing span and the name used in conflict messages
+CLAIM_STEPS = (
+    ("containers", "swap.claim_containers", "Container"),
+    ("households", "swap.claim_households", "Household"),
+    ("collection_requests", "swap.claim_requests", "Collection request"),
+)
+
+HOUSEHOLD_FIELDS = {"community": 1, "villaNumber": 1, "currentContainerId": 1, "lastSwapAt": 1,
+                    "previousContainerIds": 1, "version": 1}
+
+
+def check_swap(payload: dict, old: dict | None, new: dict | None, household: dict | None,
+               req: dict | None) -> str | None:
+    """Why the swap cannot be applied to these documents, or None."""
+    if not old or not new:
+        return "Container(s) not found"
+    if old.get("assignedHouseholdId") != payload["householdId"]:
+        return "Old container not assigned to household"
+    if new.get("assignedHouseholdId"):
+        return "New container must be unassigned"
+    if not household:
+        return "Household not found"
+    if not req:
+        return "Collection request not found"
+    if req.get("status") == "completed":
+        return "Collection request already completed"
+    return None
+
+
+def swap_deployment_id(request_id: str, version: int) -> str:
+    # A request can be reopened and swapped again: key by the version the swap wrote
+    return f"dep_swap_{request_id}_v{version}"
+
+
+def completion_fields(payload: dict, old: dict, new: dict, household: dict | None, now) -> dict:
+    # Complete collection request with metrics + swap block
+    return {
+        **denormalized(household, old),
+        "status": "completed",
+        "updatedAt": now,
+        "metrics": {
+            "volumeL": payload.get("volumeL"),
+            "weightKg": payload.get("weightKg"),
+            "measuredBy": payload["performedBy"]
+        },
+        "swap": {
+            "removedContainerId": payload["removedContainerId"],
+            "installedContainerId": payload["installedContainerId"],
+            "installedContainerSerial": new.get("serial"),
+            "performedAt": now, "performedBy": payload["performedBy"]
+        }
+    }
+
+
+def _now():
+    # BSON dates keep milliseconds: use the value that is stored, so the undo filter on
+    # updatedAt matches it exactly and ids derived from it survive an outbox round trip
+    now = utcnow()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+def _claims(payload: dict, old: dict, new: dict, household: dict, req: dict, now) -> dict[str, list[tuple]]:
+    """Per collection, (doc, update, expected, undo) for every document the swap claims."""
+    hh_id = payload["householdId"]
+    new_history, old_history = new.get("history") or {}, old.get("history") or {}
+    household_undo = {"$set": {"currentContainerId": household.get("currentContainerId"),
+                               "lastSwapAt": household.get("lastSwapAt")}}
+    if old["_id"] not in (household.get("previousContainerIds") or []):
+        household_undo["$pull"] = {"previousContainerIds": old["_id"]}
+    completion = completion_fields(payload, old, new, household, now)
+    restored = [k for k in completion if k != "updatedAt"]
+    request_undo = {"$set": {k: req[k] for k in restored if k in req}}
+    if any(k not in req for k in restored):
+        request_undo["$unset"] = {k: "" for k in restored if k not in req}
+    return {
+        "containers": [
+            (new, {"$set": {"assignedHouseholdId": hh_id, "history.lastAssignedAt": now, "updatedAt": now}},
+             {"assignedHouseholdId": None},
+             {"$set": {"assignedHouseholdId": None, "history.lastAssignedAt": new_history.get("lastAssignedAt")}}),
+            (old, {"$set": {"assignedHouseholdId": None, "history.lastUnassignedAt": now, "updatedAt": now}},
+             {"assignedHouseholdId": hh_id},
+             {"$set": {"assignedHouseholdId": hh_id, "history.lastUnassignedAt": old_history.get("lastUnassignedAt")}}),
+        ],
+        "households": [
+            (household, {"$set": {"currentContainerId": new["_id"], "lastSwapAt": now, "updatedAt": now},
+                         "$addToSet": {"previousContainerIds": old["_id"]}},
+             {}, household_undo),
+        ],
+        "collection_requests": [
+            (req, {"$set": completion}, {"status": {"$ne": "completed"}}, request_undo),
+        ],
+    }
+
+
+async def _each(fn, items: list, session) -> list:
+    # A session runs one operation at a time; without one they go out together
+    if session is not None:
+        return [await fn(item) for item in items]
+    return list(await asyncio.gather(*(fn(item) for item in items)))
+
+
+async def _cas_many(coll, claims: list[tuple], session=None) -> list[bool]:
+    """Compare-and-set each (doc, update, expected, undo); True where it applied."""
+    async def cas(claim) -> bool:
+        doc, update, expected, _ = claim
+        res = await coll.update_one(
+            {"_id": doc["_id"], **expected, **versions.match(versions.current(doc))},
+            {**update, "$inc": {"version": 1}},
+            session=session,
+        )
+        return res.matched_count == 1
+    return await _each(cas, claims, session)
+
+
+async def _undo_many(coll, claims: list[tuple], now, session=None):
     """
-    payload fields:
-      requestId, householdId, removedContainerId, installedContainerId, volumeL?, weightKg?, performedBy
+    Revert won claims where the document still carries this swap's write (version read
+    + 1 and updatedAt of this chunk); one changed since is left as is and logged.
+    """
+    async def undo(claim):
+        doc, _, _, restore = claim
+        res = await coll.update_one(
+            {"_id": doc["_id"], "updatedAt": now, **versions.match(versions.current(doc) + 1)},
+            {**restore, "$set": {**restore["$set"], "updatedAt": utcnow()}, "$inc": {"version": 1}},
+            session=session,
+        )
+        if res.matched_count == 0:
+            log.warning("Swap undo skipped %s %s: changed since it was claimed", coll.name, doc["_id"])
+    await _each(undo, claims, session)
+
+
+def _finish_spec(payload: dict, req: dict) -> dict:
+    # Everything _finish needs, small enough to store in an outbox entry
+    return {
+        "deploymentId": swap_deployment_id(req["_id"], versions.current(req) + 1),
+        "requestId": req["_id"],
+        "householdId": payload["householdId"],
+        "removedContainerId": payload["removedContainerId"],
+        "installedContainerId": payload["installedContainerId"],
+        "performedBy": payload["performedBy"],
+    }
+
+
+async def _finish(dbw, specs: list[dict], now, session=None) -> list[dict]:
+    """Ledger, deployment records and timeline of claimed swaps; safe to repeat."""
+    ledger_ops, dep_ops, dep_docs = [], [], []
+    for spec in specs:
+        hh_id, old_id, new_id = spec["householdId"], spec["removedContainerId"], spec["installedContainerId"]
+        # Ledger close/open
+        ledger_ops.append(UpdateOne(
+            {"containerId": old_id, "householdId": hh_id, "unassignedAt": None, "assignedAt": {"$lt": now}},
+            {"$set": {"unassignedAt": now, "unassignmentReason": "swap_out"}},
+        ))
+        assignment_id = f"assn_{new_id}_{now.isoformat()}"
+        ledger_ops.append(UpdateOne({"_id": assignment_id}, {"$setOnInsert": {
+            "containerId": new_id, "householdId": hh_id,
+            "assignedAt": now, "assignedBy": spec["performedBy"],
+            "assignmentReason": "swap_in", "unassignedAt": None
+        }}, upsert=True))
+        dep = {
+            "_id": spec["deploymentId"], "type": "swap", "performedAt": now,
+            "performedBy": spec["performedBy"],
+            "householdId": hh_id,
+            "requestId": spec["requestId"],
+            "removedContainerId": old_id,
+            "installedContainerId": new_id,
+            "updatedAt": now,
+            "version": 1,
+        }
+        dep_docs.append(dep)
+        dep_ops.append(UpdateOne({"_id": dep["_id"]}, {"$setOnInsert": {k: v for k, v in dep.items() if k != "_id"}}, upsert=True))
+    if session is None:
+        await asyncio.gather(
+            dbw.container_assignments.bulk_write(ledger_ops, ordered=False),
+            dbw.deployments.bulk_write(dep_ops, ordered=False),
+        )
+    else:
+        await dbw.container_assignments.bulk_write(ledger_ops, ordered=False, session=session)
+        await dbw.deployments.bulk_write(dep_ops, ordered=False, session=session)
+    await timeline.append(dbw, [e for dep in dep_docs for e in timeline.deployment_events(dep)], session=session)
+    return dep_docs
+
+
+@outbox.handler("swaps.finish")
+async def _finish_later(db, payload: dict):
+    # Follow-up writes of swaps whose claims landed but whose _finish failed
+    await _finish(db, payload["swaps"], payload["at"])
+
+
+WRITE_FAILED = "Swap could not be written; retry it"
+
+
+class SwapFailed(Exception):
+    """The swap was not applied because of a database error, not its input or a conflict."""
+
+
+def _failure(payload: dict, status: int, detail: str) -> dict:
+    return {"requestId": payload["requestId"], "ok": False, "status": status, "detail": detail}
+
+
+async def _apply_chunk(dbw, payloads: list[dict], chunk: list[int], read: dict, after: dict,
+                       session=None) -> tuple[dict[int, dict], list[tuple[dict, dict]]]:
+    """
+    Write the swaps at indexes `chunk`. Returns their results by index and (request
+    before, after) of the completed ones. Safe to re-run inside a retried transaction.
+    """
+    now = _now()
+    claims = {i: _claims(payloads[i], *read[i], now) for i in chunk}
+    results: dict[int, dict] = {}
+    won: dict[int, list[tuple[str, tuple]]] = {i: [] for i in chunk}
+    live = list(chunk)
+    try:
+        for coll_name, span_name, label in CLAIM_STEPS:
+            items = [(i, claim) for i in live for claim in claims[i][coll_name]]
+            with tracing.span(span_name, claims=len(items)):
+                applied = await _cas_many(dbw.db[coll_name], [claim for _, claim in items], session)
+            for (i, claim), ok in zip(items, applied):
+                if ok:
+                    won[i].append((coll_name, claim))
+                elif i not in results:
+                    results[i] = _failure(payloads[i], 409, f"{label} {claim[0]['_id']} was modified concurrently")
+            live = [i for i in live if i not in results]
+    except Exception:
+        if session is not None:
+            raise  # the transaction is aborted; the caller reports the chunk
+        # Which claims landed is unknown: undo all of them (the undo only matches our writes)
+        log.exception("Swap claims failed, undoing chunk of %d", len(chunk))
+        await _undo_chunk(dbw, [(name, c) for i in chunk for name, _, _ in CLAIM_STEPS for c in claims[i][name]], now)
+        return {i: results.get(i) or _failure(payloads[i], 500, WRITE_FAILED) for i in chunk}, []
+
+    undo = [(coll_name, claim) for i in results for coll_name, claim in won[i]]
+    if undo:
+        await _undo_chunk(dbw, undo, now, session)
+
+    completed = []
+    if live:
+        specs = [_finish_spec(payloads[i], read[i][3]) for i in live]
+        try:
+            with tracing.span("swap.finish", swaps=len(live)):
+                await _finish(dbw, specs, now, session)
+        except Exception as e:
+            if session is not None:
+                raise
+            await _finish_later_enqueue(dbw, specs, now, e)
+        for i, spec in zip(live, specs):
+            results[i] = {"requestId": payloads[i]["requestId"], "ok": True, "deploymentId": spec["deploymentId"]}
+            req = read[i][3]
+            completed.append((req, {**req, **claims[i]["collection_requests"][0][1]["$set"]}))
+            _settle(after[i], now)
+    return results, completed
+
+
+async def _undo_chunk(dbw, undo: list[tuple[str, tuple]], now, session=None):
+    with tracing.span("swap.undo", claims=len(undo)):
+        for coll_name, _, _ in CLAIM_STEPS:
+            claims = [c for name, c in undo if name == coll_name]
+            try:
+                await _undo_many(dbw.db[coll_name], claims, now, session)
+            except Exception:
+                if session is not None:
+                    raise
+                log.exception("Swap undo failed for %s %s", coll_name, [c[0]["_id"] for c in claims])
+
+
+async def _finish_later_enqueue(dbw, specs: list[dict], now, error: Exception):
+    # The swaps are done (every claim landed); only their records are missing
+    log.warning("Swap follow-up writes failed, deferring to the outbox: %s", error)
+    try:
+        await outbox.enqueue(dbw, "swaps.finish", {"swaps": specs, "at": now})
+    except Exception:
+        log.exception("Could not defer swap follow-ups %s", [s["deploymentId"] for s in specs])
+
+
+def _settle(after: tuple[dict, dict, dict], now):
+    # Later swaps in the batch read these: fill in what the write stamped, so their undo
+    # restores the right values
+    old, new, household = after
+    old["history"] = {**(old.get("history") or {}), "lastUnassignedAt": now}
+    new["history"] = {**(new.get("history") or {}), "lastAssignedAt": now}
+    household["lastSwapAt"] = now
+
+
+def _rounds(keys: dict[int, tuple]) -> list[list[int]]:
+    """Group swaps so that no container, household or request is written twice in one round."""
+    last: dict = {}
+    rounds: list[list[int]] = []
+    for i, ks in keys.items():
+        r = max((last.get(k, -1) for k in ks), default=-1) + 1
+        for k in ks:
+            last[k] = r
+        if r == len(rounds):
+            rounds.append([])
+        rounds[r].append(i)
+    return rounds
+
+
+async def perform_swaps(payloads: list[dict]) -> list[dict]:
+    """
+    Apply swaps in order; one result per payload: {requestId, ok, deploymentId} or
+    {requestId, ok: false, status (400 invalid / 409 conflict / 500 write failed), detail}. Later swaps are
+    validated against the effect of earlier ones in the same batch, so a container
+    installed by one swap can be removed by a later one.
     """
     dbw = get_db()
-    now = datetime.now(timezone.utc).isoformat()
+    container_ids = list({p[k] for p in payloads for k in ("removedContainerId", "installedContainerId")})
+    request_ids = list({p["requestId"] for p in payloads})
+    household_ids = list({p["householdId"] for p in payloads})
+    with tracing.span("swap.read"):
+        containers, requests, households = await asyncio.gather(
+            _by_id(dbw.containers.find({"_id": {"$in": container_ids}})),
+            _by_id(dbw.collection_requests.find({"_id": {"$in": request_ids}})),
+            _by_id(dbw.households.find({"_id": {"$in": household_ids}}, HOUSEHOLD_FIELDS)),
+        )
 
-    client: AsyncIOMotorClient = dbw.client
-    async with await client.start_session() as s:
+    results: list = [None] * len(payloads)
+    read: dict[int, tuple[dict, dict, dict, dict]] = {}
+    after: dict[int, tuple[dict, dict, dict]] = {}
+    keys: dict[int, tuple] = {}
+    with tracing.span("swap.validate", swaps=len(payloads)):
+        for i, p in enumerate(payloads):
+            old, new = containers.get(p["removedContainerId"]), containers.get(p["installedContainerId"])
+            household, req = households.get(p["householdId"]), requests.get(p["requestId"])
+            error = check_swap(p, old, new, household, req)
+            if error:
+                results[i] = _failure(p, 400, error)
+                continue
+            read[i] = (old, new, household, req)
+            keys[i] = (("c", old["_id"]), ("c", new["_id"]), ("h", household["_id"]), ("r", req["_id"]))
+            # What later swaps in this batch will find once this one is written
+            after[i] = (
+                {**old, "assignedHouseholdId": None, "version": versions.current(old) + 1},
+                {**new, "assignedHouseholdId": p["householdId"], "version": versions.current(new) + 1},
+                {**household, "currentContainerId": new["_id"], "version": versions.current(household) + 1,
+                 "previousContainerIds": list({*(household.get("previousContainerIds") or []), old["_id"]})},
+            )
+            containers[old["_id"]], containers[new["_id"]], households[household["_id"]] = after[i]
+            requests[req["_id"]] = {**req, "status": "completed", "version": versions.current(req) + 1}
+
+    transactions = await dbw.supports_transactions() if read else False
+    completed: list[tuple[dict, dict]] = []
+    size = max(1, settings.SWAP_BATCH_CHUNK_SIZE)
+    for round_ in _rounds(keys):
+        for start in range(0, len(round_), size):
+            chunk = round_[start:start + size]
+            try:
+                if transactions:
+                    async with await dbw.client.start_session() as s:
+                        chunk_results, chunk_completed = await s.with_transaction(
+                            lambda s: _apply_chunk(dbw, payloads, chunk, read, after, s))
+                else:
+                    chunk_results, chunk_completed = await _apply_chunk(dbw, payloads, chunk, read, after)
+            except Exception:
+                log.exception("Swap chunk of %d failed", len(chunk))
+                chunk_results, chunk_completed = {i: _failure(payloads[i], 500, WRITE_FAILED) for i in chunk}, []
+            for i, result in chunk_results.items():
+                results[i] = result
+            completed += chunk_completed
+
+    if completed:
+        # One counter bump per batch, after the swap writes (counters are approximate,
+        # see app/services/counts.py)
+        delta: dict[str, int] = {}
+        for before, _ in completed:
+            counts.merge(delta, counts.status_delta(before.get("status"), "completed"))
         try:
-            async with s.start_transaction():
-                old = await dbw.containers.find_one({"_id": payload["removedContainerId"]}, session=s)
-                new = await dbw.containers.find_one({"_id": payload["installedContainerId"]}, session=s)
-                if not old or not new:
-                    raise ValueError("Container(s) not found")
-                if old.get("assignedHouseholdId") != payload["householdId"]:
-                    raise ValueError("Old container not assigned to household")
-                if new.get("assignedHouseholdId"):
-                    raise ValueError("New container must be unassigned")
-
-                # Update pointers
-                await dbw.containers.update_one(
-                    {"_id": old["_id"]},
-                    {"$set": {"assignedHouseholdId": None,
-                              "history.lastUnassignedAt": now}},
-                    session=s,
-                )
-                await dbw.containers.update_one(
-                    {"_id": new["_id"]},
-                    {"$set": {
-                        "assignedHouseholdId": payload["householdId"], "history.lastAssignedAt": now}},
-                    session=s,
-                )
-                await dbw.households.update_one(
-                    {"_id": payload["householdId"]},
-                    {"$set": {"currentContainerId": new["_id"], "lastSwapAt": now},
-                     "$addToSet": {"previousContainerIds": old["_id"]}},
-                    upsert=True,
-                    session=s,
-                )
-                # Ledger close/open
-                await dbw.container_assignments.update_one(
-                    {"containerId": old["_id"],
-                        "householdId": payload["householdId"], "unassignedAt": None},
-                    {"$set": {"unassignedAt": now, "unassignmentReason": "swap_out"}},
-                    session=s,
-                )
-                await dbw.container_assignments.insert_one({
-                    "_id": f"assn_{new['_id']}_{now}",
-                    "containerId": new["_id"], "householdId": payload["householdId"],
-                    "assignedAt": now, "assignedBy": payload["performedBy"],
-                    "assignmentReason": "swap_in", "unassignedAt": None
-                }, session=s)
-
-                # Complete collection request with metrics + swap block
-                await dbw.collection_requests.update_one(
-                    {"_id": payload["requestId"]},
-                    {"$set": {
-                        "status": "completed",
-                        "metrics": {
-                            "volumeL": payload.get("volumeL"),
-                            "weightKg": payload.get("weightKg"),
-                            "measuredBy": payload["performedBy"]
-                        },
-                        "swap": {
-                            "removedContainerId": payload["removedContainerId"],
-                            "installedContainerId": payload["installedContainerId"],
-                            "performedAt": now, "performedBy": payload["performedBy"]
-                        }
-                    }},
-                    session=s,
-                )
-                # Deployment record
-                dep_id = f"dep_swap_{payload['requestId']}"
-                await dbw.deployments.insert_one({
-                    "_id": dep_id, "type": "swap", "performedAt": now, "performedBy": payload["performedBy"],
-                    "householdId": payload["householdId"],
-                    "removedContainerId": payload["removedContainerId"],
-                    "installedContainerId": payload["installedContainerId"]
-                }, session=s)
+            await counts.bump(dbw, "collection_requests", delta)
         except Exception as e:
-            # If the underlying platform does not support transactions, the exception may indicate that.
-            # You can handle a fallback best-effort path here if needed.
-            raise e
+            log.warning("Counter bump after swaps failed (the recount corrects it): %s", e)
+        broker = get_broker()
+        for _, req in completed:
+            broker.publish_local("status", request_event_payload(req))
+    return results
+
+
+async def _by_id(cur) -> dict:
+    return {d["_id"]: d async for d in cur}
+
+
+async def perform_swap(payload: dict):
+    """
+    payload fields:
+      requestId, householdId, removedContainerId, installedContainerId, volumeL?, weightKg?, performedBy
+
+    Raises ValueError if the swap does not fit the current documents, VersionConflict if
+    one of them changed while it was being applied and SwapFailed if it could not be
+    written.
+    """
+    result = (await perform_swaps([payload]))[0]
+    if result["ok"]:
+        return {"deploymentId": result["deploymentId"]}
+    if result["status"] == 409:
+        raise versions.VersionConflict(result["detail"])
+    if result["status"] == 500:
+        raise SwapFailed(result["detail"])
+    raise ValueError(result["detail"])
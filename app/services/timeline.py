@@ -0,0 +1,128 @@
+"""
+Append-only per-entity timeline (`entity_events`).
+
+Every event is derived from the document a write path just stored (a deployment,
+a collection request, a status change), and its `_id` is deterministic
+("<entityId>:<kind>:<refId>"). Live writes and the backfill
+(`python -m app.migrations.entity_events`) therefore produce identical events and
+re-appending one is a no-op.
+"""
+from datetime import datetime
+
+from pymongo.errors import BulkWriteError
+
+from app.utils.time import parse_ts, to_iso
+
+DUPLICATE_KEY = 11000
+
+
+def _ts(value) -> datetime | None:
+    # Backfilled documents may still carry ISO-string timestamps
+    if isinstance(value, str):
+        try:
+            return parse_ts(value)
+        except ValueError:
+            return None
+    return value
+
+
+def event(entity_type: str, entity_id: str, kind: str, ts, ref_id: str, **data) -> dict:
+    return {
+        "_id": f"{entity_id}:{kind}:{ref_id}",
+        "entityType": entity_type,
+        "entityId": entity_id,
+        "ts": _ts(ts),
+        "kind": kind,
+        "refId": ref_id,
+        "data": {k: v for k, v in data.items() if v is not None},
+    }
+
+
+def deployment_events(dep: dict) -> list[dict]:
+    ts, by = dep.get("performedAt"), dep.get("performedBy")
+    hh = dep.get("householdId")
+    if dep.get("type") == "deployment":
+        cid = dep.get("installedContainerId")
+        return [
+            event("household", hh, "deployment", ts, dep["_id"], containerId=cid, performedBy=by),
+            event("container", cid, "deployment", ts, dep["_id"], householdId=hh, performedBy=by),
+        ]
+    if dep.get("type") == "swap":
+        removed, installed = dep.get("removedContainerId"), dep.get("installedContainerId")
+        # Older swap deployments carry no requestId and are keyed "dep_swap_<requestId>"
+        request_id = dep.get("requestId") or dep["_id"].removeprefix("dep_swap_")
+        return [
+            event("household", hh, "swap", ts, dep["_id"], removedContainerId=removed,
+                  installedContainerId=installed, requestId=request_id, performedBy=by),
+            event("container", removed, "swap_out", ts, dep["_id"], householdId=hh,
+                  requestId=request_id, performedBy=by),
+            event("container", installed, "swap_in", ts, dep["_id"], householdId=hh, performedBy=by),
+        ]
+    # deployment_task documents are planning, not history
+    return []
+
+
+def request_events(req: dict) -> list[dict]:
+    ts = req.get("requestedAt")
+    data = {"source": req.get("requestSource"), "requestedBy": req.get("requestedBy")}
+    return [
+        event("household", req.get("householdId"), "collection_requested", ts, req["_id"],
+              containerId=req.get("containerId"), **data),
+        event("container", req.get("containerId"), "collection_requested", ts, req["_id"],
+              householdId=req.get("householdId"), **data),
+    ]
+
+
+def status_events(req: dict, status: str, ts, by: str | None = None, version: int | None = None) -> list[dict]:
+    # A request can reach the same status more than once (reopened, cancelled again):
+    # live writes key each transition by the version it produced. The backfill, which
+    # only knows the current status, uses the bare "<requestId>:<status>" ref.
+    ref = f"{req['_id']}:{status}" + (f":v{version}" if version else "")
+    return [
+        event("household", req.get("householdId"), "collection_status", ts, ref,
+              requestId=req["_id"], status=status, updatedBy=by),
+        event("container", req.get("containerId"), "collection_status", ts, ref,
+              requestId=req["_id"], status=status, updatedBy=by),
+    ]
+
+
+async def append(db, events: list[dict], session=None) -> int:
+    """Insert events, ignoring ones already present. Returns how many were new."""
+    events = [e for e in events if e["entityId"] and e["ts"] is not None]
+    if not events:
+        return 0
+    if session is not None:
+        # Inside a transaction a duplicate key would abort it; callers there write fresh ids
+        await db.entity_events.insert_many(events, session=session)
+        return len(events)
+    try:
+        res = await db.entity_events.insert_many(events, ordered=False)
+        return len(res.inserted_ids)
+    except BulkWriteError as e:
+        details = e.details or {}
+        if any(err.get("code") != DUPLICATE_KEY for err in details.get("writeErrors", [])):
+            raise
+        return details.get("nInserted", 0)
+
+
+def event_out(doc: dict) -> dict:
+    return {"ts": to_iso(doc.get("ts")), "kind": doc.get("kind"), "refId": doc.get("refId"), "data": doc.get("data") or {}}
+
+
+def encode_cursor(doc: dict) -> str:
+    return f"{to_iso(doc['ts'])}|{doc['_id']}"
+
+
+async def read(db, entity_id: str, limit: int, cursor: str | None = None, newest_first: bool = True):
+    """One indexed range scan on (entityId, ts, _id); returns (events, nextCursor)."""
+    q: dict = {"entityId": entity_id}
+    direction = -1 if newest_first else 1
+    if cursor:
+        ts_raw, _, last_id = cursor.partition("|")
+        ts = parse_ts(ts_raw)
+        op = "$lt" if newest_first else "$gt"
+        q["$or"] = [{"ts": {op: ts}}, {"ts": ts, "_id": {op: last_id}}]
+    cur = db.entity_events.find(q).sort([("ts", direction), ("_id", direction)]).limit(limit + 1)
+    docs = [d async for d in cur]
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return [event_out(d) for d in docs[:limit]], next_cursor
@@ -0,0 +1,52 @@
+from datetime import datetime, timezone
+
+from app.core.config import settings
+
+
+def utcnow() -> datetime:
+    """Timestamp for writes; stored as a native BSON date."""
+    return datetime.now(timezone.utc)
+
+
+def to_iso(value) -> str | None:
+    """
+    API output keeps ISO-8601 strings. Accepts BSON dates (aware when the client is
+    tz_aware) and legacy string values that have not been migrated yet.
+    """
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.isoformat()
+    return value
+
+
+def parse_ts(value: str) -> datetime:
+    """Parse an ISO-8601 date or datetime query param; naive values are taken as UTC."""
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def ts_range(field: str, start: datetime | None = None, end: datetime | None = None,
+             before: datetime | None = None) -> dict:
+    """
+    Query fragment for start <= field <= end (field < before, for an exclusive upper
+    bound). While DB_LEGACY_STRING_TIMESTAMPS is on
+    (i.e. until `python -m app.migrations.timestamps` has run) documents still holding
+    ISO strings are matched too.
+    """
+    dates: dict = {}
+    strings: dict = {}
+    if start:
+        dates["$gte"] = start
+        strings["$gte"] = start.isoformat()
+    if end:
+        dates["$lte"] = end
+        strings["$lte"] = end.isoformat()
+    if before:
+        dates["$lt"] = before
+        strings["$lt"] = before.isoformat()
+    if not settings.DB_LEGACY_STRING_TIMESTAMPS:
+        return {field: dates}
+    return {"$or": [{field: dates}, {field: strings}]}
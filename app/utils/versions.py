@@ -0,0 +1,44 @@
+"""
+Optimistic concurrency on containers, households, collection requests and
+deployments. Every write increments `version` (inserts start at 1; documents written
+before versioning count as 0). A compare-and-set update adds `match(expected)` to its
+filter: if another writer got there first nothing matches and the caller answers 409
+instead of overwriting.
+"""
+from fastapi import HTTPException
+
+
+class VersionConflict(Exception):
+    """The document changed since it was read (or since the client's If-Match)."""
+
+
+def current(doc) -> int:
+    value = doc.get("version") if isinstance(doc, dict) else getattr(doc, "version", None)
+    return value or 0
+
+
+def match(expected: int) -> dict:
+    # None also matches documents that predate the field
+    return {"version": expected if expected else None}
+
+
+def etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def expected(if_match: str | None) -> int | None:
+    """Expected version from an If-Match header (None when absent or `*`); 400 if malformed."""
+    if if_match is None or if_match.strip() == "*":
+        return None
+    try:
+        return int(if_match.strip().removeprefix("W/").strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid If-Match")
+
+
+async def cas_failure(coll, _id, expected: int | None, not_found: str) -> HTTPException:
+    """404 if the document is gone, else 409 with the version the client should re-read."""
+    doc = await coll.find_one({"_id": _id}, {"version": 1}) if expected is not None else None
+    if doc is None:
+        return HTTPException(status_code=404, detail=not_found)
+    return HTTPException(status_code=409, detail=f"Version mismatch: expected {expected}, current {current(doc)}")
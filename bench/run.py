@@ -0,0 +1,245 @@
+"""
+Load-test every router in-process against a local Mongo stand-in.
+
+Start a throwaway mongod (data on tmpfs, i.e. in memory):
+
+    docker compose --profile bench up -d mongo-bench
+
+then seed and run (defaults: 100k households, 1M collection requests):
+
+    python -m bench.run --out bench_output.json
+    python -m bench.run --reuse-data --only deployments --concurrency 32
+    python -m bench.run --reuse-data --compare baseline.json
+
+Requests go through httpx.AsyncClient over the ASGI transport, so the numbers cover
+routing, validation, serialization and Mongo but no network hop to the API. Mongo
+round trips are counted with a pymongo command listener. The JSON report is stable
+(sorted keys, no wall-clock timestamps) so reports from two commits diff cleanly;
+--compare exits non-zero when p95 latency regresses past --max-regression or a
+scenario needs more round trips than the baseline.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+from pymongo import MongoClient, monitoring
+
+from bench.scenarios import SCENARIOS, Context, Scenario
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def started(self, event):
+        with self._lock:
+            self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def _percentile(sorted_ms: list[float], pct: float) -> float:
+    if not sorted_ms:
+        return 0.0
+    k = max(0, min(len(sorted_ms) - 1, int(round(pct / 100 * len(sorted_ms) + 0.5)) - 1))
+    return round(sorted_ms[k], 3)
+
+
+def _pools(uri: str, db_name: str, size: int) -> dict:
+    db = MongoClient(uri)[db_name]
+    seen = set()
+    open_requests = []
+    for d in db.collection_requests.find({"status": "requested"}, {"householdId": 1, "containerId": 1}).limit(size * 4):
+        # Swaps need one open request per household: a swap changes the household's container
+        if d["householdId"] not in seen:
+            seen.add(d["householdId"])
+            open_requests.append((d["_id"], d["householdId"], d["containerId"]))
+    search_terms = {"name": [], "phone": [], "villa": []}
+    for d in db.households.find({}, {"primaryContact": 1, "villaNumber": 1, "community": 1}).limit(1000):
+        contact = d.get("primaryContact") or {}
+        search_terms["name"].append(contact["fullName"].split()[-1])
+        search_terms["phone"].append(contact["phone"][-7:])
+        search_terms["villa"].append(f"{d['community']} {d['villaNumber']}")
+    return {
+        "search_terms": search_terms,
+        "deployed": [(d["_id"], d["currentContainerId"]) for d in
+                     db.households.find({"currentContainerId": {"$ne": None}}, {"currentContainerId": 1}).limit(size)],
+        "undeployed": [d["_id"] for d in db.households.find({"currentContainerId": None}, {"_id": 1}).limit(size)],
+        "spares": [d["_id"] for d in db.containers.find({"assignedHouseholdId": None}, {"_id": 1}).limit(size)],
+        "open_requests": open_requests[:size],
+        "drivers": [d["_id"] for d in db.users.find({"_id": {"$regex": "^user_driver"}}, {"_id": 1})],
+    }
+
+
+async def _run_scenario(client, sc: Scenario, ctx: Context, total: int, concurrency: int,
+                        warmup: int, counter: CommandCounter) -> dict:
+    if sc.max_requests is not None:
+        total = min(total, sc.max_requests)
+    for pool in sc.consumes:
+        total = min(total, len(getattr(ctx, pool)) // sc.per_call)
+    if total <= 0:
+        return {"skipped": "empty pool"}
+
+    async def call():
+        method, path, kwargs = sc.build(ctx)
+        t0 = time.perf_counter()
+        r = await client.request(method, path, **kwargs)
+        return (time.perf_counter() - t0) * 1000, r.status_code
+
+    if not sc.writes:
+        for _ in range(min(warmup, total)):
+            await call()
+
+    latencies: list[float] = []
+    statuses: dict[str, int] = {}
+    remaining = iter(range(total))
+
+    async def worker():
+        for _ in remaining:
+            ms, status = await call()
+            latencies.append(ms)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    ops_before = counter.count
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, total))))
+    wall = time.perf_counter() - t0
+    ops = counter.count - ops_before
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "statuses": statuses,
+        "errors": sum(n for s, n in statuses.items() if int(s) >= 400),
+        "p50Ms": _percentile(latencies, 50),
+        "p95Ms": _percentile(latencies, 95),
+        "p99Ms": _percentile(latencies, 99),
+        "throughputRps": round(total / wall, 1) if wall else None,
+        "mongoOpsPerRequest": round(ops / total, 2),
+    }
+
+
+def compare(report: dict, baseline: dict, max_regression: float) -> bool:
+    ok = True
+    print(f"{'scenario':40} {'p95 base':>10} {'p95 now':>10} {'ops base':>9} {'ops now':>8}", file=sys.stderr)
+    for name, cur in sorted(report["scenarios"].items()):
+        base = baseline.get("scenarios", {}).get(name)
+        if not base or "p95Ms" not in base or "p95Ms" not in cur:
+            continue
+        flag = ""
+        if base["p95Ms"] and cur["p95Ms"] > base["p95Ms"] * (1 + max_regression):
+            flag += " SLOWER"
+        if cur["mongoOpsPerRequest"] > base["mongoOpsPerRequest"]:
+            flag += " MORE-ROUND-TRIPS"
+        ok = ok and not flag
+        print(f"{name:40} {base['p95Ms']:>10} {cur['p95Ms']:>10} {base['mongoOpsPerRequest']:>9} "
+              f"{cur['mongoOpsPerRequest']:>8}{flag}", file=sys.stderr)
+    return ok
+
+
+async def main(args) -> dict:
+    counter = CommandCounter()
+    monitoring.register(counter)
+
+    # Point the app at the bench database before it is imported
+    os.environ.update({
+        "MONGO_URI": args.uri, "MONGO_DB": args.db, "API_KEY": "",
+        "QR_HMAC_SECRET": "bench-secret", "OUTBOX_ENABLED": "false",
+    })
+    import httpx
+    from app.dependencies.db import get_db
+    from app.main import app
+    from app.core.config import settings
+    from app.services import counts as status_counts
+    from app.services.qr import sign_action
+    from bench.seed import seed
+
+    counts = None
+    if not args.reuse_data:
+        print(f"Seeding {args.households} households / {args.requests} requests...", file=sys.stderr)
+        counts = seed(args.uri, args.db, args.households, args.requests, args.seed)
+        # Seed the per-status counters the API keeps from here on
+        for name in status_counts.COUNTED:
+            await status_counts.reconcile(get_db(), name)
+    await get_db().ensure_indexes()
+
+    pools = _pools(args.uri, args.db, args.pool_size)
+    # QR tokens are single-use: never sign the same (container, second) twice
+    last_ts: dict[str, int] = {}
+
+    def sign(cid: str) -> str:
+        ts = max(int(time.time()), last_ts.get(cid, 0) + 1)
+        last_ts[cid] = ts
+        return sign_action(cid, ts)
+
+    ctx = Context(rnd=random.Random(args.seed), sign=sign, **pools)
+
+    transport = httpx.ASGITransport(app=app)
+    base_url = f"http://bench{settings.API_BASE_PATH}"
+    results = {}
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=120) as client:
+        await client.post("/users", json={"username": "bench", "password": "bench-pass"})
+        for sc in SCENARIOS:
+            if args.only and sc.router not in args.only and sc.name not in args.only:
+                continue
+            if args.read_only and sc.writes:
+                continue
+            print(f"  {sc.name}...", file=sys.stderr)
+            results[sc.name] = await _run_scenario(
+                client, sc, ctx, args.requests_per_scenario, args.concurrency, args.warmup, counter)
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "config": {
+            "households": args.households, "requests": args.requests, "seed": args.seed,
+            "concurrency": args.concurrency, "requestsPerScenario": args.requests_per_scenario,
+        },
+        "commit": commit,
+        "seeded": counts,
+        "scenarios": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default=os.getenv("BENCH_MONGO_URI", "mongodb://localhost:27018/?directConnection=true"))
+    parser.add_argument("--db", default="homecollection_bench")
+    parser.add_argument("--households", type=int, default=100_000)
+    parser.add_argument("--requests", type=int, default=1_000_000, help="collection requests to seed")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reuse-data", action="store_true", help="skip seeding (write scenarios mutate data)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests-per-scenario", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--pool-size", type=int, default=20_000)
+    parser.add_argument("--only", nargs="*", help="router modules or scenario names to run")
+    parser.add_argument("--read-only", action="store_true", help="skip scenarios that write")
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON report to diff against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed p95 slowdown ratio")
+    args = parser.parse_args()
+
+    report = asyncio.run(main(args))
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as f:
+            sys.exit(0 if compare(report, json.load(f), args.max_regression) else 1)
@@ -0,0 +1,156 @@
+"""
+One scenario per endpoint, grouped by router module. Each scenario builds the next
+request from a shared context of id pools; write scenarios that change assignment
+state consume their pool entries so every call is valid.
+"""
+import random
+from dataclasses import dataclass
+from typing import Callable
+
+
+@dataclass
+class Context:
+    rnd: random.Random
+    deployed: list[tuple[str, str]]            # (householdId, containerId) with a container
+    undeployed: list[str]                      # householdIds without a container
+    spares: list[str]                          # unassigned containerIds
+    open_requests: list[tuple[str, str, str]]  # (requestId, householdId, containerId), distinct households
+    drivers: list[str]
+    search_terms: dict[str, list[str]]          # "name" / "phone" / "villa" -> queries that hit
+    sign: Callable[[str], str]
+
+    def pick(self, pool):
+        return pool[self.rnd.randrange(len(pool))]
+
+
+@dataclass
+class Scenario:
+    name: str
+    router: str
+    build: Callable[[Context], tuple]
+    writes: bool = False
+    # Caps for endpoints that are unbounded by design (full table responses)
+    max_requests: int | None = None
+    # Pools consumed `per_call` entries per call, bounding the number of requests
+    consumes: tuple[str, ...] = ()
+    per_call: int = 1
+
+
+SWAP_BATCH = 20
+BATCH_GET = 100
+# Inside the seeded range (2023-2024), so a delta sync returns the last month of changes
+SYNC_SINCE = "2024-12-01T00:00:00+00:00"
+
+
+def _swap(ctx: Context):
+    req_id, hid, old = ctx.open_requests.pop()
+    return "POST", "/deployments/swap", {"json": {
+        "requestId": req_id, "householdId": hid, "removedContainerId": old,
+        "installedContainerId": ctx.spares.pop(), "volumeL": 18.5, "weightKg": 16.2,
+        "performedBy": ctx.pick(ctx.drivers)}}
+
+
+def _swap_batch(ctx: Context):
+    # A driver's route submitted after reconnecting
+    by = ctx.pick(ctx.drivers)
+    swaps = []
+    for _ in range(SWAP_BATCH):
+        req_id, hid, old = ctx.open_requests.pop()
+        swaps.append({"requestId": req_id, "householdId": hid, "removedContainerId": old,
+                      "installedContainerId": ctx.spares.pop(), "volumeL": 18.5, "weightKg": 16.2,
+                      "performedBy": by})
+    return "POST", "/deployments/swap/batch", {"json": {"swaps": swaps}}
+
+
+def _batch_get(ctx: Context, index: int) -> list[str]:
+    return [ctx.pick(ctx.deployed)[index] for _ in range(BATCH_GET)]
+
+
+def _perform(ctx: Context):
+    return "POST", "/deployments/perform", {"json": {
+        "householdId": ctx.undeployed.pop(), "containerId": ctx.spares.pop(), "performedBy": ctx.pick(ctx.drivers)}}
+
+
+def _create_request(ctx: Context):
+    hid, cid = ctx.pick(ctx.deployed)
+    return "POST", "/collection-requests", {"params": {"sig": ctx.sign(cid)},
+                                            "json": {"containerId": cid, "householdId": hid}}
+
+
+def _open_request_id(ctx: Context) -> str:
+    return ctx.pick(ctx.open_requests)[0]
+
+
+def _qr_verify(ctx: Context):
+    cid = ctx.pick(ctx.deployed)[1]
+    return "GET", "/qr/verify", {"params": {"containerId": cid, "sig": ctx.sign(cid)}}
+
+
+def _search(kind: str):
+    return lambda c: ("GET", "/search", {"params": {"q": c.pick(c.search_terms[kind])}})
+
+
+def _check_pending(ctx: Context):
+    hid, cid = ctx.pick(ctx.deployed)
+    return "GET", "/collection-requests/check-pending", {"params": {"householdId": hid, "containerId": cid}}
+
+
+SCENARIOS: list[Scenario] = [
+    Scenario("health", "health", lambda c: ("GET", "/health", {})),
+    Scenario("qr.sign", "qr", lambda c: ("GET", "/qr/sign", {"params": {"containerId": c.pick(c.deployed)[1]}})),
+    Scenario("qr.verify", "qr", _qr_verify),
+
+    Scenario("signups.listActive", "signups", lambda c: ("GET", "/signups", {}), max_requests=5),
+    Scenario("signups.listAwaiting", "signups", lambda c: ("GET", "/signups/awaiting-deployment", {}), max_requests=10),
+    Scenario("signups.listAll", "signups", lambda c: ("GET", "/signups/all", {"params": {"status": "active", "limit": 100}})),
+    Scenario("signups.create", "signups", lambda c: ("POST", "/signups", {"json": {
+        "fullName": "Bench User", "phone": f"+9715{c.rnd.randrange(10**7, 10**8)}", "email": "bench@example.com",
+        "addressText": "Bench Street", "villaNumber": "V1", "community": "Community A",
+        "location": {"latitude": 25.1, "longitude": 55.2}}}), writes=True),
+
+    Scenario("households.list", "households", lambda c: ("GET", "/households", {"params": {"community": "Community C", "limit": 50}})),
+    Scenario("households.get", "households", lambda c: ("GET", f"/households/{c.pick(c.deployed)[0]}", {})),
+    Scenario("households.history", "households", lambda c: ("GET", f"/households/{c.pick(c.deployed)[0]}/history", {})),
+    Scenario("households.batchGet", "households", lambda c: ("POST", "/households:batchGet", {"json": {"ids": _batch_get(c, 0)}})),
+
+    Scenario("search.name", "search", _search("name")),
+    Scenario("search.phone", "search", _search("phone")),
+    Scenario("search.villa", "search", _search("villa")),
+
+    Scenario("containers.listUnassigned", "containers", lambda c: ("GET", "/containers", {"params": {"unassigned": "true"}})),
+    Scenario("containers.get", "containers", lambda c: ("GET", f"/containers/{c.pick(c.deployed)[1]}", {})),
+    Scenario("containers.history", "containers", lambda c: ("GET", f"/containers/{c.pick(c.deployed)[1]}/history", {})),
+    Scenario("containers.batchGet", "containers", lambda c: ("POST", "/containers:batchGet", {"json": {"ids": _batch_get(c, 1)}})),
+
+    Scenario("collectionRequests.listRequested", "collection_requests",
+             lambda c: ("GET", "/collection-requests", {"params": {"status": "requested", "sortDir": "desc"}})),
+    Scenario("collectionRequests.checkPending", "collection_requests", _check_pending),
+    Scenario("collectionRequests.create", "collection_requests", _create_request, writes=True),
+    Scenario("collectionRequests.assign", "collection_requests", lambda c: (
+        "PATCH", f"/collection-requests/{_open_request_id(c)}/assign", {"json": {"assignedTo": c.pick(c.drivers)}}), writes=True),
+    Scenario("collectionRequests.claim", "collection_requests", lambda c: ("POST", "/collection-requests/claim", {"json": {
+        "driverId": c.pick(c.drivers), "limit": 5}}), writes=True),
+    Scenario("collectionRequests.claimNear", "collection_requests", lambda c: ("POST", "/collection-requests/claim", {"json": {
+        "driverId": c.pick(c.drivers), "limit": 5,
+        "near": {"latitude": 25.0 + c.rnd.random() * 0.4, "longitude": 55.0 + c.rnd.random() * 0.4}}}), writes=True),
+
+    Scenario("sync.full", "sync", lambda c: ("GET", "/sync", {"params": {"assignedTo": c.pick(c.drivers)}})),
+    Scenario("sync.delta", "sync", lambda c: ("GET", "/sync", {"params": {"assignedTo": c.pick(c.drivers), "since": SYNC_SINCE}})),
+
+    Scenario("collections.summaryRange", "collections", lambda c: ("GET", "/collections", {"params": {
+        "status": "completed", "dateFrom": "2024-03-01", "dateTo": "2024-03-31", "limit": 100}})),
+    Scenario("collections.summaryDriver", "collections", lambda c: ("GET", "/collections", {"params": {
+        "assignedTo": c.pick(c.drivers), "limit": 100}})),
+
+    Scenario("deployments.listTasks", "deployments", lambda c: ("GET", "/deployments", {"params": {"type": "deployment_task"}})),
+    Scenario("deployments.listByDriver", "deployments", lambda c: ("GET", "/deployments", {"params": {"assignedTo": c.pick(c.drivers)}})),
+    Scenario("deployments.assign", "deployments", lambda c: ("POST", "/deployments/assign", {"json": {
+        "householdId": c.pick(c.undeployed), "assignedTo": c.pick(c.drivers)}}), writes=True),
+    Scenario("deployments.perform", "deployments", _perform, writes=True, consumes=("undeployed", "spares")),
+    Scenario("deployments.swap", "deployments", _swap, writes=True, consumes=("open_requests", "spares")),
+    Scenario("deployments.swapBatch", "deployments", _swap_batch, writes=True, consumes=("open_requests", "spares"),
+             per_call=SWAP_BATCH),
+
+    Scenario("users.list", "users", lambda c: ("GET", "/users", {})),
+    Scenario("users.login", "users", lambda c: ("POST", "/auth/login", {"json": {"username": "bench", "password": "bench-pass"}})),
+]
@@ -0,0 +1,153 @@
+"""
+Deterministic seed data shaped like production: households with containers and
+signups, a long tail of collection requests, deployment records, the assignment
+ledger and the per-entity timeline. Documents carry what the write paths store today
+(`searchKeys`, `version`, `updatedAt`, the denormalized request fields), built with the
+app's own helpers. The same --seed and sizes always produce the same documents, so
+benchmark runs on different commits see identical data.
+"""
+import random
+from datetime import datetime, timedelta, timezone
+
+from pymongo import MongoClient
+
+from app.repositories.collection_requests import denormalized
+from app.services import timeline
+from app.services.search import with_search_keys
+
+COMMUNITIES = [f"Community {c}" for c in "ABCDEFGHIJKLMNOPQRSTUVWXYZ"] + [f"District {n}" for n in range(1, 15)]
+FIRST = ["Aisha", "Omar", "Fatima", "Ali", "Sara", "John", "Maria", "Chen", "Priya", "Ahmed", "Layla", "Noah"]
+LAST = ["Khan", "Hassan", "Smith", "Garcia", "Patel", "Nguyen", "Haddad", "Ibrahim", "Silva", "Rahman"]
+START = datetime(2023, 1, 1, tzinfo=timezone.utc)
+SPAN_SECONDS = 2 * 365 * 24 * 3600
+BATCH = 5000
+
+
+class _Writer:
+    def __init__(self, coll):
+        self.coll = coll
+        self.buf = []
+        self.count = 0
+
+    def add(self, doc):
+        self.buf.append(doc)
+        if len(self.buf) >= BATCH:
+            self.flush()
+
+    def flush(self):
+        if self.buf:
+            self.coll.insert_many(self.buf, ordered=False)
+            self.count += len(self.buf)
+            self.buf = []
+
+
+def _ts(rnd: random.Random) -> datetime:
+    return START + timedelta(seconds=rnd.randrange(SPAN_SECONDS), milliseconds=rnd.randrange(1000))
+
+
+def seed(uri: str, db_name: str, households: int, requests: int, seed_value: int = 42) -> dict:
+    """Drop and repopulate db_name. Returns per-collection document counts."""
+    client = MongoClient(uri, tz_aware=True)
+    client.drop_database(db_name)
+    db = client[db_name]
+    rnd = random.Random(seed_value)
+
+    w = {name: _Writer(db[name]) for name in (
+        "households", "containers", "signups", "collection_requests",
+        "deployments", "container_assignments", "users", "entity_events")}
+    drivers = [f"user_driver{i:03d}" for i in range(50)]
+    for u in drivers + ["user_ops"]:
+        w["users"].add({"_id": u, "username": u[5:], "passwordHash": "x", "passwordSalt": "x",
+                        "createdAt": START, "updatedAt": START})
+
+    deployed = []
+    places = {}  # householdId -> household / containerId -> container, for request denormalization
+    for i in range(households):
+        hid, cid, sid = f"hh_{i:08d}", f"container_{i:08d}", f"signup_{i:08d}"
+        created = _ts(rnd)
+        name = f"{rnd.choice(FIRST)} {rnd.choice(LAST)}"
+        phone = f"+9715{rnd.randrange(10**7, 10**8)}"
+        community = rnd.choice(COMMUNITIES)
+        villa = f"V{rnd.randrange(1, 900)}"
+        loc = {"latitude": 25.0 + rnd.random() * 0.4, "longitude": 55.0 + rnd.random() * 0.4}
+        has_container = rnd.random() < 0.85
+        household = with_search_keys("households", {
+            "_id": hid, "villaNumber": villa, "community": community,
+            "addressText": f"{villa}, Street {rnd.randrange(1, 80)}, {community}", "location": loc,
+            "primaryContact": {"fullName": name, "phone": phone, "email": f"{sid}@example.com"},
+            "status": "active", "createdAt": created, "updatedAt": created, "version": 1,
+            "currentContainerId": cid if has_container else None, "previousContainerIds": [],
+        })
+        w["households"].add(household)
+        w["signups"].add(with_search_keys("signups", {
+            "_id": sid, "fullName": name, "phone": phone, "email": f"{sid}@example.com",
+            "addressText": f"{villa}, {community}", "villaNumber": villa, "community": community,
+            "location": loc, "status": "active" if has_container else "awaiting_deployment",
+            "createdAt": created, "updatedAt": created,
+            "dedupeKey": f"phone:{phone}", "linkedHouseholdId": hid, "source": "flyer_qr_v1",
+        }))
+        container = {
+            "_id": cid, "serial": f"C-{i:08d}", "state": "new",
+            "attributes": {"capacityL": 240, "type": "wheelieBin"},
+            "assignedHouseholdId": hid if has_container else None, "qrVersion": 1,
+            "createdAt": created, "updatedAt": created, "version": 1,
+            "history": {"lastAssignedAt": created} if has_container else {},
+        }
+        w["containers"].add(container)
+        if has_container:
+            deployed.append((hid, cid))
+            places[hid], places[cid] = household, container
+            by = rnd.choice(drivers)
+            w["container_assignments"].add({
+                "_id": f"assn_{cid}_{created.isoformat()}", "containerId": cid, "householdId": hid,
+                "assignedAt": created, "assignedBy": by, "assignmentReason": "initial_deployment", "unassignedAt": None,
+            })
+            dep = {
+                "_id": f"dep_{i:08d}", "type": "deployment", "performedAt": created, "performedBy": by,
+                "householdId": hid, "installedContainerId": cid, "updatedAt": created, "version": 1,
+            }
+            w["deployments"].add(dep)
+            for e in timeline.deployment_events(dep):
+                w["entity_events"].add(e)
+
+    # Spare, unassigned containers for deployment/swap scenarios
+    for j in range(max(households // 10, 100)):
+        cid = f"container_spare_{j:08d}"
+        w["containers"].add({
+            "_id": cid, "serial": f"S-{j:08d}", "state": "new",
+            "attributes": {"capacityL": 240, "type": "wheelieBin"},
+            "assignedHouseholdId": None, "qrVersion": 1, "createdAt": START, "updatedAt": START,
+            "version": 1, "history": {},
+        })
+
+    for k in range(requests):
+        hid, cid = deployed[rnd.randrange(len(deployed))]
+        roll = rnd.random()
+        status = "completed" if roll < 0.9 else ("requested" if roll < 0.97 else "cancelled")
+        requested_at = _ts(rnd)
+        doc = {
+            "_id": f"req_{k:09d}", "householdId": hid, "containerId": cid, "requestedAt": requested_at,
+            "requestSource": "container_qr", "status": status, "geoAtRequest": None,
+            **denormalized(places[hid], places[cid]),
+            "updatedAt": requested_at, "version": 1,
+        }
+        if status != "cancelled" and rnd.random() < 0.8:
+            doc["assignedTo"] = rnd.choice(drivers)
+        if status == "completed":
+            doc["metrics"] = {"volumeL": round(rnd.uniform(2, 30), 1), "weightKg": round(rnd.uniform(2, 27), 1),
+                              "measuredBy": doc.get("assignedTo")}
+        if status != "requested":
+            # Finished a few hours later, in one more write
+            doc["updatedAt"] = requested_at + timedelta(seconds=rnd.randrange(600, 12 * 3600))
+            doc["version"] = 2
+        w["collection_requests"].add(doc)
+        # Timeline as app.migrations.entity_events would build it
+        events = timeline.request_events(doc)
+        if status != "requested":
+            events += timeline.status_events(doc, status, doc["updatedAt"], doc.get("assignedTo"))
+        for e in events:
+            w["entity_events"].add(e)
+
+    for writer in w.values():
+        writer.flush()
+    return {name: writer.count for name, writer in w.items()}
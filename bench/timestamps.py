@@ -0,0 +1,97 @@
+"""
+Benchmark ISO-string vs BSON date timestamps: index size and range-scan speed.
+
+Seeds two scratch collections with identical collection-request-shaped documents,
+one storing `requestedAt` as the legacy ISO string and one as a BSON date, builds the
+dashboard index `(status, requestedAt)` on both and times the same date-window scans.
+
+    python -m bench.timestamps --uri mongodb://localhost:27017 --docs 200000 --scans 200
+
+Prints a JSON report; run it before and after a change and diff the output.
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING, DESCENDING, MongoClient
+
+STATUSES = ("requested", "completed", "completed", "completed", "cancelled")
+
+
+def _seed(coll, docs: int, as_date: bool, seed: int):
+    rnd = random.Random(seed)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    batch = []
+    for i in range(docs):
+        ts = start + timedelta(seconds=rnd.randrange(365 * 24 * 3600), microseconds=rnd.randrange(1000) * 1000)
+        batch.append({
+            "_id": f"req_{i:09d}",
+            "householdId": f"hh_{rnd.randrange(docs // 10 or 1):07d}",
+            "status": rnd.choice(STATUSES),
+            "requestedAt": ts if as_date else ts.isoformat(),
+        })
+        if len(batch) == 5000:
+            coll.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        coll.insert_many(batch, ordered=False)
+    coll.create_index([("status", ASCENDING), ("requestedAt", DESCENDING)], name="status_requestedAt")
+
+
+def _windows(scans: int, seed: int):
+    rnd = random.Random(seed)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for _ in range(scans):
+        lo = start + timedelta(days=rnd.randrange(330))
+        yield lo, lo + timedelta(days=rnd.choice((1, 7, 30)))
+
+
+def _scan(coll, as_date: bool, scans: int, seed: int) -> dict:
+    timings = []
+    matched = 0
+    for lo, hi in _windows(scans, seed):
+        bounds = {"$gte": lo, "$lt": hi} if as_date else {"$gte": lo.isoformat(), "$lt": hi.isoformat()}
+        t0 = time.perf_counter()
+        matched += sum(1 for _ in coll.find({"status": "completed", "requestedAt": bounds}, {"_id": 1}).limit(500))
+        timings.append((time.perf_counter() - t0) * 1000)
+    timings.sort()
+    return {
+        "scans": scans,
+        "rowsMatched": matched,
+        "p50Ms": round(statistics.median(timings), 3),
+        "p95Ms": round(timings[int(len(timings) * 0.95) - 1], 3),
+        "meanMs": round(statistics.fmean(timings), 3),
+    }
+
+
+def run(uri: str, db_name: str, docs: int, scans: int, seed: int, keep: bool) -> dict:
+    db = MongoClient(uri, tz_aware=True)[db_name]
+    report = {"docs": docs, "seed": seed}
+    for label, as_date in (("isoString", False), ("bsonDate", True)):
+        coll = db[f"bench_ts_{label}"]
+        coll.drop()
+        _seed(coll, docs, as_date, seed)
+        stats = db.command("collStats", coll.name)
+        report[label] = {
+            "indexSizeBytes": stats["indexSizes"].get("status_requestedAt"),
+            "dataSizeBytes": stats.get("size"),
+            "rangeScan": _scan(coll, as_date, scans, seed),
+        }
+        if not keep:
+            coll.drop()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="homecollection_bench")
+    parser.add_argument("--docs", type=int, default=200_000)
+    parser.add_argument("--scans", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch collections")
+    args = parser.parse_args()
+    print(json.dumps(run(args.uri, args.db, args.docs, args.scans, args.seed, args.keep), indent=2, sort_keys=True))
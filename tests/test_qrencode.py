@@ -0,0 +1,76 @@
+"""
+Regression tests for the built-in QR encoder (app/services/qrencode.py).
+
+Expected symbols were generated with the python-qrcode reference encoder (byte mode,
+fixed mask, no border). Larger symbols are compared by the SHA-256 of their rows
+("#" dark, "." light, one line per row).
+"""
+import hashlib
+
+import pytest
+
+from app.services.qrencode import DataTooLong, encode
+
+LABEL_URL = "https://collect.example.com/r?containerId=container_00000042&sig=1760000000.abcdef0123456789"
+
+# "HELLO WORLD", level L, mask 0: version 1
+HELLO_L0 = [
+    "#######..#.##.#######",
+    "#.....#..###..#.....#",
+    "#.###.#.##.##.#.###.#",
+    "#.###.#..#.#..#.###.#",
+    "#.###.#...#.#.#.###.#",
+    "#.....#.....#.#.....#",
+    "#######.#.#.#.#######",
+    "........##.##........",
+    "###.########.##...#..",
+    "#..##.....#...##...#.",
+    ".######.#.#.##.######",
+    "###....#.##.....#..#.",
+    "##.##.###.#.#####.#..",
+    "........#..#.#....##.",
+    "#######.#.##...##.###",
+    "#.....#.#..##..#....#",
+    "#.###.#.#..#..#.#.#..",
+    "#.###.#..#.#..###.##.",
+    "#.###.#.#...#.#.#.#.#",
+    "#.....#.#..#....#..#.",
+    "#######.#..##.##..###",
+]
+
+# (data, level, mask, size, sha256 of the rows)
+KNOWN_GOOD = [
+    ("HELLO WORLD", "M", 2, 21, "30fdb5c91cccff04ce56c33b46992a7a930fdf2f508f44c5b6c1c277b6c02ea7"),
+    (LABEL_URL, "L", 1, 37, "64621366cdd13ff0cb2f17f02980961075755dca326b7c1148cd62c3a8f3c4ac"),
+    (LABEL_URL, "M", 3, 41, "2fefa3089fe234a494a78f0cb6de160eeb7fd17fc684de22251a09fef32f6e4d"),
+    (LABEL_URL, "Q", 4, 49, "cb0d9e1f0b3f39d0f88d82283b058b61e8f2313c1ca3e9c77b62282ddb9f8f53"),
+    (LABEL_URL, "H", 7, 53, "e8df0e75e8005e2f260def8ccf24c867cc235d504cc4c1cfdd6c2e0d30d87ff4"),
+    ("x" * 200, "L", 0, 53, "774c400e94c89f08a1a06f5c97021bf3216461693212aa9bd0eb30bf0f6a34ff"),
+    ("x" * 200, "H", 6, 77, "3d645b0b4128b074038a7696c5160238ba6ac3c4f3e940b240260b3d3b0d7bb8"),
+]
+
+
+def _rows(modules: list[list[bool]]) -> list[str]:
+    return ["".join("#" if m else "." for m in row) for row in modules]
+
+
+def test_version_1_symbol():
+    assert _rows(encode("HELLO WORLD", "L", mask=0)) == HELLO_L0
+
+
+@pytest.mark.parametrize("data,ecl,mask,size,digest", KNOWN_GOOD)
+def test_known_good_symbols(data, ecl, mask, size, digest):
+    rows = _rows(encode(data, ecl, mask=mask))
+    assert len(rows) == size and all(len(r) == size for r in rows)
+    assert hashlib.sha256("\n".join(rows).encode()).hexdigest() == digest
+
+
+@pytest.mark.parametrize("ecl", "LMQH")
+def test_automatic_mask_is_one_of_the_fixed_masks(ecl):
+    # Implementations may weigh the penalty rules differently; any mask scans
+    assert encode(LABEL_URL, ecl) in [encode(LABEL_URL, ecl, mask=m) for m in range(8)]
+
+
+def test_data_too_long():
+    with pytest.raises(DataTooLong):
+        encode("x" * 3000, "H")